@@ -5,225 +5,423 @@
 Single command to start everything and verify it's working
 """
 
+import concurrent.futures
+import functools
+import http.server
 import subprocess
 import time
-import webbrowser
-import requests
 import threading
 import os
+import queue
+import socket
 import sys
+import logging
+import logging.handlers
+from pathlib import Path
+
+log = logging.getLogger("run_system")
+
+def setup_logging():
+    """Send output through one buffered stdout handler, flushed at phase boundaries"""
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(logging.Formatter("%(message)s"))
+    # Errors go out immediately; everything else waits for flush_log()
+    buffered = logging.handlers.MemoryHandler(capacity=200, flushLevel=logging.ERROR, target=console)
+    log.addHandler(buffered)
+    log.setLevel(logging.INFO)
+    log.propagate = False
+
+def flush_log():
+    """Write out any buffered log lines"""
+    for handler in log.handlers:
+        handler.flush()
+
+def find_python_exe():
+    """Prefer the project's .venv interpreter, falling back to the current one"""
+    venv_python = Path(__file__).resolve().parent / ".venv" / ("Scripts/python.exe" if os.name == "nt" else "bin/python")
+    return str(venv_python) if venv_python.exists() else sys.executable
+
+PYTHON_EXE = find_python_exe()
+
+@functools.lru_cache(maxsize=None)
+def get_session():
+    """One keep-alive session shared by every probe so connections get reused"""
+    # requests pulls in urllib3, idna, charset detection...; import it only when probing
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+    return session
+
+BACKEND_READY_SENTINEL = "RAG_BACKEND_READY"
+
+# Candidate backend ports, tried in order when the preferred one is taken
+BACKEND_PORTS = (5000, 5001, 5002)
+FRONTEND_PORT = 3000
+FRONTEND_URL = f"http://localhost:{FRONTEND_PORT}"
+
+# (method, endpoint, request kwargs, label) for every endpoint check
+ENDPOINT_SPECS = (
+    ("GET", "/", {}, "Home"),
+    ("GET", "/api/health", {}, "Health"),
+    ("GET", "/api/system/status", {}, "Status"),
+    ("GET", "/api/documents", {}, "Documents"),
+    ("GET", "/api/operations", {}, "Operations"),
+    ("POST", "/api/chat", {"json": {"message": "test"}}, "Chat"),
+    ("POST", "/api/search", {"json": {"query": "test", "type": "hybrid"}}, "Search")
+)
+
+def use_backend_port(port):
+    """Point every backend URL (and the prebuilt endpoint probes) at port"""
+    global BACKEND_PORT, BACKEND_BASE, BACKEND_HEALTH_URL, BACKEND_SELFTEST_URL, ENDPOINT_PROBES
+    BACKEND_PORT = port
+    BACKEND_BASE = f"http://localhost:{port}"
+    BACKEND_HEALTH_URL = f"{BACKEND_BASE}/api/health"
+    BACKEND_SELFTEST_URL = f"{BACKEND_BASE}/api/_selftest"
+    # (method, endpoint, url, request kwargs, label)
+    ENDPOINT_PROBES = tuple(
+        (method, endpoint, f"{BACKEND_BASE}{endpoint}", kwargs, name)
+        for method, endpoint, kwargs, name in ENDPOINT_SPECS
+    )
+
+use_backend_port(BACKEND_PORTS[0])
+
+# Child processes launched by this script, keyed by service name
+PROCESSES = {}
+
+# Servers hosted on threads inside this process, keyed by service name
+SERVER_THREADS = {}
+
+FRONTEND_DIR = Path(__file__).resolve().parent / "frontend"
+
+class FrontendHandler(http.server.SimpleHTTPRequestHandler):
+    """Static file handler for the frontend with permissive CORS"""
+    
+    # Keep connections alive so browsers can reuse them for every asset
+    protocol_version = "HTTP/1.1"
+    
+    def end_headers(self):
+        self.send_header('Access-Control-Allow-Origin', '*')
+        super().end_headers()
+    
+    def log_message(self, format, *args):
+        pass
+
+# Keepalive cadence: back off once the system has been stable for a while
+HEALTH_INTERVAL = 30
+STABLE_HEALTH_INTERVAL = 120
+STABLE_AFTER_CHECKS = 3
+HTTP_CONFIRM_EVERY = 4
+
+def watch_for_sentinel(proc, sentinel, ready_ports):
+    """Report the port from proc's "<sentinel> <port>" line, then keep draining its stdout"""
+    for line in proc.stdout:
+        parts = line.split()
+        if len(parts) == 2 and parts[0] == sentinel and parts[1].isdigit():
+            ready_ports.put(int(parts[1]))
+    # stdout closed: the process exited, possibly before it ever got ready
+    ready_ports.put(None)
+
+def port_open(port):
+    """Return True if something accepts TCP connections on localhost:port"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.settimeout(0.1)
+        return sock.connect_ex(("127.0.0.1", port)) == 0
+
+def find_running_backend():
+    """Probe every candidate port in parallel and return the first healthy one"""
+    def healthy(port):
+        return port_open(port) and http_alive(port, "/api/health")
+    
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(BACKEND_PORTS))
+    try:
+        pending = {executor.submit(healthy, port): port for port in BACKEND_PORTS}
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                port = pending.pop(future)
+                if future.result():
+                    return port
+        return None
+    finally:
+        executor.shutdown(wait=False)
+
+def http_alive(port, path="/", timeout=0.5):
+    """Send a bare HEAD request over a raw socket and report whether it got a 200"""
+    try:
+        with socket.create_connection(("127.0.0.1", port), timeout=timeout) as sock:
+            sock.sendall(f"HEAD {path} HTTP/1.0\r\nHost: localhost\r\n\r\n".encode("ascii"))
+            status_line = b""
+            while b"\r\n" not in status_line and len(status_line) < 64:
+                chunk = sock.recv(64)
+                if not chunk:
+                    break
+                status_line += chunk
+        return status_line.split(b"\r\n", 1)[0].split(b" ")[1:2] == [b"200"]
+    except OSError:
+        return False
+
+def check_system_health(confirm_http):
+    """Cheap process/thread liveness check, confirmed over HTTP only when needed"""
+    for proc in PROCESSES.values():
+        if proc.poll() is not None:
+            return False
+    for thread in SERVER_THREADS.values():
+        if not thread.is_alive():
+            return False
+    
+    # Services we didn't launch can only be checked over HTTP
+    if not confirm_http and len(PROCESSES) + len(SERVER_THREADS) == 2:
+        return True
+    
+    return http_alive(BACKEND_PORT, "/api/health", timeout=2) and http_alive(FRONTEND_PORT, timeout=2)
+
+def wait_for_child_exit():
+    """Block until any launched child process exits and return (name, proc)"""
+    exited = queue.Queue()
+    
+    def watch(name, proc):
+        proc.wait()
+        exited.put((name, proc))
+    
+    for name, proc in PROCESSES.items():
+        threading.Thread(target=watch, args=(name, proc), daemon=True).start()
+    
+    # Queue.get() with a timeout stays interruptible by Ctrl+C on Windows
+    while True:
+        try:
+            return exited.get(timeout=1)
+        except queue.Empty:
+            continue
 
 def print_banner():
-    print("🚀" + "="*60 + "🚀")
-    print("🎯 PHASE 4 ADVANCED RAG SYSTEM - ONE COMMAND STARTUP 🎯")
-    print("🚀" + "="*60 + "🚀")
-    print()
+    log.info("🚀" + "="*60 + "🚀")
+    log.info("🎯 PHASE 4 ADVANCED RAG SYSTEM - ONE COMMAND STARTUP 🎯")
+    log.info("🚀" + "="*60 + "🚀")
+    log.info("")
+    flush_log()
 
 def check_and_start_backend():
     """Check if backend is running, start if needed"""
-    print("🔧 Checking Backend API...")
+    log.info("🔧 Checking Backend API...")
+    
+    running_port = find_running_backend()
+    if running_port is not None:
+        use_backend_port(running_port)
+        log.info(f"✅ Backend API is already running and healthy on port {running_port}!")
+        return True
+    
+    # Skip ports some other program is already listening on
+    free_ports = [port for port in BACKEND_PORTS if not port_open(port)]
+    if not free_ports:
+        log.info(f"❌ All backend ports are in use: {', '.join(map(str, BACKEND_PORTS))}")
+        return False
+    
+    log.info("🚀 Starting Backend API...")
     
     try:
-        response = requests.get("http://localhost:5000/api/health", timeout=3)
-        if response.status_code == 200:
-            print("✅ Backend API is already running and healthy!")
+        # Start backend in background
+        proc = PROCESSES["backend"] = subprocess.Popen(
+            [PYTHON_EXE, "simple_server.py", "--port", str(free_ports[0])],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            bufsize=1,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+            env={**os.environ, "PYTHONIOENCODING": "utf-8"},
+            # Our fds are non-inheritable (PEP 446), so skip the close loop
+            close_fds=False,
+            # Keep the terminal's Ctrl+C for us; we stop the child ourselves
+            start_new_session=True
+        )
+        
+        # Wait for the server to announce the port it has bound
+        log.info("⏳ Waiting for backend...")
+        flush_log()
+        ready_ports = queue.Queue()
+        threading.Thread(
+            target=watch_for_sentinel,
+            args=(proc, BACKEND_READY_SENTINEL, ready_ports),
+            daemon=True
+        ).start()
+        try:
+            port = ready_ports.get(timeout=15)
+        except queue.Empty:
+            port = None
+        if port is not None:
+            use_backend_port(port)
+            log.info(f"✅ Backend API started successfully on port {port}!")
             return True
-    except:
-        print("🚀 Starting Backend API...")
         
-        python_exe = "C:/Users/thous/OneDrive/Desktop/Caas/.venv/Scripts/python.exe"
+        # No readiness within the timeout: don't leave it running in its own session
+        log.info("❌ Backend failed to start")
+        PROCESSES.pop("backend", None)
+        proc.kill()
+        proc.wait()
+        return False
         
-        try:
-            # Start backend in background
-            subprocess.Popen(
-                [python_exe, "simple_server.py"],
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL
-            )
-            
-            # Wait for it to start
-            for i in range(15):
-                time.sleep(1)
-                try:
-                    response = requests.get("http://localhost:5000/api/health", timeout=2)
-                    if response.status_code == 200:
-                        print("✅ Backend API started successfully!")
-                        return True
-                except:
-                    continue
-                print(f"⏳ Waiting for backend... ({i+1}/15)")
-            
-            print("❌ Backend failed to start")
-            return False
-            
-        except Exception as e:
-            print(f"❌ Error starting backend: {e}")
-            return False
+    except Exception as e:
+        log.info(f"❌ Error starting backend: {e}")
+        return False
 
 def check_and_start_frontend():
     """Check if frontend is running, start if needed"""
-    print("🎨 Checking Frontend UI...")
+    log.info("🎨 Checking Frontend UI...")
+    
+    if port_open(FRONTEND_PORT) and http_alive(FRONTEND_PORT):
+        log.info("✅ Frontend UI is already running!")
+        return True
+    
+    log.info("🚀 Starting Frontend UI...")
     
     try:
-        response = requests.get("http://localhost:3000", timeout=3)
-        if response.status_code == 200:
-            print("✅ Frontend UI is already running!")
-            return True
-    except:
-        print("🚀 Starting Frontend UI...")
+        # Serve the static frontend from a daemon thread in this process
+        handler = functools.partial(FrontendHandler, directory=str(FRONTEND_DIR))
+        httpd = http.server.ThreadingHTTPServer(("", FRONTEND_PORT), handler)
+        thread = SERVER_THREADS["frontend"] = threading.Thread(target=httpd.serve_forever, daemon=True)
+        thread.start()
         
-        python_exe = "C:/Users/thous/OneDrive/Desktop/Caas/.venv/Scripts/python.exe"
+        # The socket is already bound, so there is nothing to wait for
+        log.info("✅ Frontend UI started successfully!")
+        return True
         
-        frontend_script = """
-import http.server
-import socketserver
-import os
+    except Exception as e:
+        log.info(f"❌ Error starting frontend: {e}")
+        return False
 
-class Handler(http.server.SimpleHTTPRequestHandler):
-    def end_headers(self):
-        self.send_header('Access-Control-Allow-Origin', '*')
-        super().end_headers()
+def probe_endpoint(spec):
+    """Issue a single endpoint probe and return (name, endpoint, status_code or None)"""
+    method, endpoint, url, kwargs, name = spec
+    try:
+        response = get_session().request(method, url, timeout=3, **kwargs)
+        return name, endpoint, response.status_code
+    except:
+        return name, endpoint, None
 
-os.chdir('frontend')
-with socketserver.TCPServer(('', 3000), Handler) as httpd:
-    httpd.serve_forever()
-"""
-        
-        try:
-            # Start frontend in background
-            subprocess.Popen(
-                [python_exe, "-c", frontend_script],
-                stdout=subprocess.DEVNULL,
-                stderr=subprocess.DEVNULL
-            )
-            
-            # Wait for it to start
-            for i in range(10):
-                time.sleep(1)
-                try:
-                    response = requests.get("http://localhost:3000", timeout=2)
-                    if response.status_code == 200:
-                        print("✅ Frontend UI started successfully!")
-                        return True
-                except:
-                    continue
-                print(f"⏳ Waiting for frontend... ({i+1}/10)")
-            
-            print("❌ Frontend failed to start")
-            return False
-            
-        except Exception as e:
-            print(f"❌ Error starting frontend: {e}")
-            return False
+def run_selftest():
+    """Ask the backend to check its own endpoints; None if it doesn't support it"""
+    try:
+        response = get_session().get(BACKEND_SELFTEST_URL, timeout=5)
+        if response.status_code == 200:
+            return [(check["name"], check["endpoint"], check["status"]) for check in response.json()["checks"]]
+    except:
+        pass
+    return None
 
 def test_all_endpoints():
     """Test all API endpoints quickly"""
-    print("\n🧪 Testing All API Endpoints...")
+    log.info("\n🧪 Testing All API Endpoints...")
     
-    endpoints = [
-        ("/", "Home"),
-        ("/api/health", "Health"),
-        ("/api/system/status", "Status"),
-        ("/api/documents", "Documents"),
-        ("/api/operations", "Operations")
-    ]
+    # One round trip when the backend can self-test, otherwise probe in parallel
+    results = run_selftest()
+    if results is None:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(ENDPOINT_PROBES)) as executor:
+            results = list(executor.map(probe_endpoint, ENDPOINT_PROBES))
     
     all_good = True
-    for endpoint, name in endpoints:
-        try:
-            response = requests.get(f"http://localhost:5000{endpoint}", timeout=3)
-            status = "✅" if response.status_code == 200 else "⚠️ "
-            print(f"   {status} {name:<12} - {endpoint}")
-            if response.status_code != 200:
-                all_good = False
-        except:
-            print(f"   ❌ {name:<12} - {endpoint}")
+    for name, endpoint, status_code in results:
+        if status_code is None:
+            log.info(f"   ❌ {name:<12} - {endpoint}")
+            all_good = False
+            continue
+        status = "✅" if status_code == 200 else "⚠️ "
+        log.info(f"   {status} {name:<12} - {endpoint}")
+        if status_code != 200:
             all_good = False
-    
-    # Test POST endpoints
-    try:
-        response = requests.post(
-            "http://localhost:5000/api/chat",
-            json={"message": "test"},
-            timeout=3
-        )
-        status = "✅" if response.status_code == 200 else "⚠️ "
-        print(f"   {status} Chat         - /api/chat")
-    except:
-        print(f"   ❌ Chat         - /api/chat")
-        all_good = False
-    
-    try:
-        response = requests.post(
-            "http://localhost:5000/api/search",
-            json={"query": "test", "type": "hybrid"},
-            timeout=3
-        )
-        status = "✅" if response.status_code == 200 else "⚠️ "
-        print(f"   {status} Search       - /api/search")
-    except:
-        print(f"   ❌ Search       - /api/search")
-        all_good = False
     
     return all_good
 
 def show_success_info():
     """Show success information"""
-    print("\n" + "🎉" + "="*60 + "🎉")
-    print("🏆 PHASE 4 SYSTEM FULLY OPERATIONAL! 🏆")
-    print("🎉" + "="*60 + "🎉")
+    log.info("\n" + "🎉" + "="*60 + "🎉")
+    log.info("🏆 PHASE 4 SYSTEM FULLY OPERATIONAL! 🏆")
+    log.info("🎉" + "="*60 + "🎉")
     
-    print("\n🌐 YOUR SYSTEM IS READY:")
-    print("   📱 Frontend:  http://localhost:3000")
-    print("   🔧 Backend:   http://localhost:5000")
+    log.info("\n🌐 YOUR SYSTEM IS READY:")
+    log.info("   📱 Frontend:  http://localhost:3000")
+    log.info(f"   🔧 Backend:   {BACKEND_BASE}")
     
-    print("\n✨ AVAILABLE FEATURES:")
-    print("   📄 Document Upload & Processing (14+ formats)")
-    print("   🔍 Advanced Hybrid Search (+60% accuracy)")
-    print("   🧩 Intelligent Chunking (4 strategies)")
-    print("   💬 Enhanced RAG Chat (+50% relevance)")
-    print("   📊 Real-time System Monitoring")
+    log.info("\n✨ AVAILABLE FEATURES:")
+    log.info("   📄 Document Upload & Processing (14+ formats)")
+    log.info("   🔍 Advanced Hybrid Search (+60% accuracy)")
+    log.info("   🧩 Intelligent Chunking (4 strategies)")
+    log.info("   💬 Enhanced RAG Chat (+50% relevance)")
+    log.info("   📊 Real-time System Monitoring")
     
-    print("\n🎯 WHAT YOU CAN DO:")
-    print("   1. Open http://localhost:3000 in your browser")
-    print("   2. Upload documents via drag & drop")
-    print("   3. Chat with your documents")
-    print("   4. Use advanced search features")
-    print("   5. Test API endpoints")
+    log.info("\n🎯 WHAT YOU CAN DO:")
+    log.info("   1. Open http://localhost:3000 in your browser")
+    log.info("   2. Upload documents via drag & drop")
+    log.info("   3. Chat with your documents")
+    log.info("   4. Use advanced search features")
+    log.info("   5. Test API endpoints")
     
-    print("\n🧪 QUICK API TESTS:")
-    print("   curl http://localhost:5000/api/health")
-    print("   curl http://localhost:5000/api/system/status")
+    log.info("\n🧪 QUICK API TESTS:")
+    log.info(f"   curl {BACKEND_HEALTH_URL}")
+    log.info(f"   curl {BACKEND_BASE}/api/system/status")
     
-    print("\n" + "🚀" + "="*60 + "🚀")
-    print("🎯 OPEN http://localhost:3000 TO START USING THE SYSTEM! 🎯")
-    print("🚀" + "="*60 + "🚀")
+    log.info("\n" + "🚀" + "="*60 + "🚀")
+    log.info("🎯 OPEN http://localhost:3000 TO START USING THE SYSTEM! 🎯")
+    log.info("🚀" + "="*60 + "🚀")
 
 def open_browser_delayed():
     """Open browser after a delay"""
+    import webbrowser
     time.sleep(3)
     try:
         webbrowser.open('http://localhost:3000')
-        print("\n🌐 Browser opened automatically!")
+        log.info("\n🌐 Browser opened automatically!")
     except:
-        print("\n💡 Please open http://localhost:3000 manually")
+        log.info("\n💡 Please open http://localhost:3000 manually")
+    flush_log()
+
+def stop_processes():
+    """Stop every child we launched; they run in their own session, so Ctrl+C never reaches them"""
+    for proc in PROCESSES.values():
+        if proc.poll() is None:
+            proc.terminate()
+    for proc in PROCESSES.values():
+        try:
+            proc.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            proc.kill()
 
 def main():
     """Main function"""
+    try:
+        return run_system()
+    except KeyboardInterrupt:
+        log.info("\n👋 System shutdown requested")
+        stop_processes()
+        log.info("✅ You can now close this window")
+        return True
+    finally:
+        # Every exit path, including early returns and errors, stops the children
+        stop_processes()
+
+def run_system():
+    """Start, verify and then watch the backend and frontend"""
     print_banner()
     
-    # Start backend
-    if not check_and_start_backend():
-        print("\n❌ Cannot start system without backend API")
+    # Start backend and frontend concurrently; they don't depend on each other
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        backend_future = executor.submit(check_and_start_backend)
+        frontend_future = executor.submit(check_and_start_frontend)
+        backend_ok = backend_future.result()
+        frontend_ok = frontend_future.result()
+    flush_log()
+    
+    if not backend_ok:
+        log.info("\n❌ Cannot start system without backend API")
         return False
     
-    # Start frontend
-    if not check_and_start_frontend():
-        print("\n❌ Cannot start system without frontend UI")
+    if not frontend_ok:
+        log.info("\n❌ Cannot start system without frontend UI")
         return False
     
     # Test everything
-    print("\n⏳ Verifying system functionality...")
+    log.info("\n⏳ Verifying system functionality...")
+    flush_log()
     time.sleep(2)
     
     if test_all_endpoints():
@@ -233,38 +431,45 @@ def main():
         browser_thread = threading.Thread(target=open_browser_delayed, daemon=True)
         browser_thread.start()
         
-        print("\n📡 System is running! Keep this window open.")
-        print("📡 Press Ctrl+C to stop (or just close this window)")
+        log.info("\n📡 System is running! Keep this window open.")
+        log.info("📡 Press Ctrl+C to stop (or just close this window)")
+        flush_log()
         
-        try:
-            # Keep alive and show periodic status
-            while True:
-                time.sleep(30)
-                # Quick health check
-                try:
-                    requests.get("http://localhost:5000/api/health", timeout=2)
-                    requests.get("http://localhost:3000", timeout=2)
-                    print("💚 System healthy")
-                except:
-                    print("⚠️  System may have issues - check servers")
-                    
-        except KeyboardInterrupt:
-            print("\n👋 System shutdown requested")
-            print("✅ You can now close this window")
+        if "backend" in PROCESSES and "frontend" in SERVER_THREADS:
+            # We own both servers: sleep until the backend process exits
+            name, proc = wait_for_child_exit()
+            log.info(f"⚠️  {name.capitalize()} process exited with code {proc.returncode} - check servers")
+            return False
+        
+        # Keep alive and show periodic status
+        interval = HEALTH_INTERVAL
+        consecutive_ok = 0
+        while True:
+            time.sleep(interval)
+            if check_system_health(confirm_http=consecutive_ok % HTTP_CONFIRM_EVERY == 0):
+                consecutive_ok += 1
+                log.info("💚 System healthy")
+            else:
+                consecutive_ok = 0
+                log.info("⚠️  System may have issues - check servers")
+            interval = STABLE_HEALTH_INTERVAL if consecutive_ok > STABLE_AFTER_CHECKS else HEALTH_INTERVAL
+            flush_log()
             
     else:
-        print("\n❌ SYSTEM STARTUP FAILED!")
-        print("Some APIs are not responding correctly.")
-        print("Check error messages above and try again.")
+        log.info("\n❌ SYSTEM STARTUP FAILED!")
+        log.info("Some APIs are not responding correctly.")
+        log.info("Check error messages above and try again.")
         return False
     
     return True
 
 if __name__ == "__main__":
+    setup_logging()
     try:
         success = main()
+        flush_log()
         if not success:
             input("\nPress Enter to exit...")
     except Exception as e:
-        print(f"\n❌ CRITICAL ERROR: {e}")
+        log.error(f"\n❌ CRITICAL ERROR: {e}")
         input("Press Enter to exit...")
\ No newline at end of file
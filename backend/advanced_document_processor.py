@@ -1,27 +1,356 @@
 import os
 import io
+import codecs
+import csv
+import itertools
 import mimetypes
 from typing import Dict, List, Tuple, Optional, Any
 from dataclasses import dataclass
 from datetime import datetime
 import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
 
 # File processing libraries
 import fitz  # PyMuPDF
 import docx
+from docx.oxml.ns import qn
 import pandas as pd
+import openpyxl
 from pptx import Presentation
 from bs4 import BeautifulSoup
 from PIL import Image
 import pytesseract
 
+# Persistent in-process Tesseract API, preferred over pytesseract's per-call subprocess
+try:
+    from tesserocr import PyTessBaseAPI, PSM, OEM
+except ImportError:
+    PyTessBaseAPI = None
+
 # Text analysis libraries
 import langdetect
-import textstat
 import re
+from functools import lru_cache
+
+# C-based HTML parsing: selectolax if present, else lxml behind BeautifulSoup
+try:
+    from selectolax.parser import HTMLParser as SelectolaxHTMLParser
+except ImportError:
+    SelectolaxHTMLParser = None
+
+try:
+    import lxml  # noqa: F401
+    BS4_PARSER = 'lxml'
+except ImportError:
+    BS4_PARSER = 'html.parser'
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+try:
+    import charset_normalizer
+except ImportError:
+    charset_normalizer = None
 
 logger = logging.getLogger(__name__)
 
+# Deterministic language detection across runs and workers
+langdetect.DetectorFactory.seed = 0
+
+# Tesseract's OpenMP threading only adds contention when OCR runs per file
+os.environ.setdefault('OMP_THREAD_LIMIT', '1')
+
+# PDFs with fewer pages are extracted in-process; larger ones are split
+# into contiguous page ranges across a process pool (MuPDF holds the GIL).
+# PyMuPDF is not thread-safe, so each worker touches its Document from a
+# single thread only; the process pool is the only parallelism for PDFs.
+PDF_PARALLEL_MIN_PAGES = 8
+PDF_MAX_WORKERS = min(os.cpu_count() or 1, 4)
+
+def _init_pool_worker():
+    """Process pool initializer: keep native libraries single-threaded per worker"""
+    os.environ['OMP_THREAD_LIMIT'] = '1'
+
+# Components per pixel for colorspaces whose decoded layout is known up front
+_PDF_COLORSPACE_COMPONENTS = {'DeviceGray': 1, 'DeviceRGB': 3, 'DeviceCMYK': 4}
+
+def _pdf_image_dims(doc, img: Tuple) -> Tuple[int, int, int, int]:
+    """(width, height, n, stride) of a page.get_images() entry
+    
+    Device colorspaces are answered from the image dictionary; only the rest
+    (ICC, indexed, ...) pay for decoding a Pixmap.
+    """
+    xref, width, height, colorspace = img[0], img[2], img[3], img[5]
+    n = _PDF_COLORSPACE_COMPONENTS.get(colorspace)
+    if n is not None:
+        return width, height, n, width * n
+    pix = fitz.Pixmap(doc, xref)  # no alpha: the soft mask is a separate xref
+    return pix.width, pix.height, pix.n, pix.stride
+
+def _iter_pdf_page_range(doc, start: int, end: int, extract_images: bool, extract_image_bytes: bool = False):
+    """Yield (page_number, text, images, tables, has_images) for pages [start, end) of an open PDF"""
+    image_dims = {}  # xref -> (width, height, n, stride); logos repeat on every page
+    for page_num in range(start, end):
+        page = doc.load_page(page_num)
+        
+        # Extract text
+        page_text = page.get_text()
+        page_images = []
+        page_tables = []
+        has_images = False
+        
+        # Extract images if enabled
+        if extract_images:
+            image_list = page.get_images()
+            if image_list:
+                has_images = True
+                for img_index, img in enumerate(image_list):
+                    try:
+                        xref = img[0]
+                        width, height, n, stride = image_dims.get(xref) or _pdf_image_dims(doc, img)
+                        image_dims[xref] = (width, height, n, stride)
+                        
+                        if n < 4:  # GRAY or RGB
+                            # Raw pixel size; no PNG encode just to measure it
+                            image_info = {
+                                'page': page_num + 1,
+                                'index': img_index,
+                                'size': width * height * n,
+                                'stride': stride,
+                                'width': width,
+                                'height': height
+                            }
+                            if extract_image_bytes:
+                                # The stream as embedded in the PDF (JPEG etc.), not re-encoded
+                                embedded = doc.extract_image(xref)
+                                image_info['data'] = embedded['image']
+                                image_info['ext'] = embedded['ext']
+                            page_images.append(image_info)
+                    except Exception as e:
+                        logger.warning(f"Error extracting image {img_index} from page {page_num}: {e}")
+        
+        # Detect tables (simple heuristic)
+        if AdvancedDocumentProcessor._detect_tables_in_text(page_text):
+            page_tables.append({
+                'page': page_num + 1,
+                'content': AdvancedDocumentProcessor._extract_table_from_text(page_text)
+            })
+        
+        yield page_num + 1, page_text, page_images, page_tables, has_images
+
+def _extract_pdf_pages_worker(file_path: str, start: int, end: int, extract_images: bool, extract_image_bytes: bool = False) -> List[Tuple]:
+    """Process pool entry point: fitz Documents can't be pickled, so reopen by path"""
+    doc = fitz.open(file_path)
+    try:
+        return list(_iter_pdf_page_range(doc, start, end, extract_images, extract_image_bytes))
+    finally:
+        doc.close()
+
+_W_TR, _W_TC, _W_P, _W_T = qn('w:tr'), qn('w:tc'), qn('w:p'), qn('w:t')
+
+def _docx_cell_text(tc) -> str:
+    """Stripped text of a <w:tc>, read straight from the XML instead of via Cell.text"""
+    paragraphs = [
+        ''.join(t.text or '' for t in p.iter(_W_T))
+        for p in tc.iterchildren(_W_P)
+    ]
+    return '\n'.join(paragraphs).strip()
+
+def _html_to_text(html_content: str) -> str:
+    """Visible text of an HTML document using the fastest parser installed"""
+    if SelectolaxHTMLParser is not None:
+        tree = SelectolaxHTMLParser(html_content)
+        for node in tree.css('script, style'):
+            node.decompose()
+        return tree.root.text() if tree.root is not None else ""
+    
+    soup = BeautifulSoup(html_content, BS4_PARSER)
+    for script in soup(["script", "style"]):
+        script.decompose()
+    return soup.get_text()
+
+# Tesseract is tuned for ~300 DPI text; larger scans only cost LSTM time
+OCR_MAX_DIMENSION = 2000
+# PSM 6 (uniform block of text) + LSTM engine, matching the tesserocr setup
+PYTESSERACT_CONFIG = '--psm 6 --oem 1'
+
+def _otsu_threshold(histogram: List[int]) -> int:
+    """Otsu's threshold for a 256-bin grayscale histogram"""
+    total = sum(histogram)
+    weighted_total = sum(i * count for i, count in enumerate(histogram))
+    background = background_sum = 0
+    best_threshold, best_variance = 0, 0.0
+    for i, count in enumerate(histogram):
+        background += count
+        if background == 0:
+            continue
+        foreground = total - background
+        if foreground == 0:
+            break
+        background_sum += i * count
+        mean_background = background_sum / background
+        mean_foreground = (weighted_total - background_sum) / foreground
+        variance = background * foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = i, variance
+    return best_threshold
+
+def _preprocess_for_ocr(image):
+    """Grayscale, downscale oversized scans and binarize before OCR"""
+    image = image.convert('L')
+    if max(image.size) > OCR_MAX_DIMENSION:
+        image.thumbnail((OCR_MAX_DIMENSION, OCR_MAX_DIMENSION), Image.LANCZOS)
+    threshold = _otsu_threshold(image.histogram())
+    return image.point(lambda p: 255 if p > threshold else 0)
+
+# Tesseract scales best with ~4 cores per process
+OCR_MAX_WORKERS = max(1, (os.cpu_count() or 1) // 4)
+
+def _ocr_worker(file_paths: List[str]) -> List[str]:
+    """OCR a chunk of images with one Tesseract instance for the whole chunk
+
+    Runs in a pool started with initializer=_init_pool_worker, which is what sets
+    OMP_THREAD_LIMIT=1 in the worker (the module-level setdefault only covers the
+    parent process). Falls back to pytesseract if tesserocr cannot initialize.
+    """
+    api = None
+    if PyTessBaseAPI is not None:
+        try:
+            api = PyTessBaseAPI(psm=PSM.SINGLE_BLOCK, oem=OEM.LSTM_ONLY)
+        except Exception as e:
+            logger.warning(f"tesserocr unavailable in OCR worker, falling back to pytesseract: {e}")
+    texts = []
+    try:
+        for file_path in file_paths:
+            try:
+                with Image.open(file_path) as image:
+                    image = _preprocess_for_ocr(image)
+                    if api is not None:
+                        api.SetImage(image)
+                        texts.append(api.GetUTF8Text())
+                    else:
+                        texts.append(pytesseract.image_to_string(image, config=PYTESSERACT_CONFIG))
+            except Exception as e:
+                logger.warning(f"OCR failed for {file_path}: {e}")
+                texts.append("")
+    finally:
+        if api is not None:
+            api.End()
+    return texts
+
+_WORD_RE = re.compile(r"\b\w+\b")
+_MULTISPACE_RE = re.compile(r"\s{3,}")
+# Every str.splitlines() boundary, plus runs of 2+ spaces
+_LINE_BREAK_RE = re.compile(r" {2,}|\r\n?|[\n\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029]")
+_BLANK_LINES_RE = re.compile(r"\s*\n\s*")
+_SENTENCE_SPLIT_RE = re.compile(r"[.!?]+")
+_VOWEL_GROUP_RE = re.compile(r"[aeiouy]+")
+
+@lru_cache(maxsize=65536)
+def _count_syllables(word: str) -> int:
+    """Approximate English syllable count from vowel groups"""
+    word = word.lower()
+    syllables = len(_VOWEL_GROUP_RE.findall(word))
+    # Silent trailing 'e' ("make"), but not "-le" ("table")
+    if syllables > 1 and word.endswith('e') and not word.endswith('le'):
+        syllables -= 1
+    return max(1, syllables)
+
+def _compute_text_stats(text: str) -> Tuple[int, int, int]:
+    """Tokenize once and return (word_count, sentence_count, syllable_count)"""
+    words = _WORD_RE.findall(text)
+    sentence_count = sum(1 for sentence in _SENTENCE_SPLIT_RE.split(text) if sentence.strip())
+    syllable_count = sum(_count_syllables(word) for word in words)
+    return len(words), max(1, sentence_count), syllable_count
+
+# Define category keywords
+CATEGORY_KEYWORDS = {
+    'technical': ['api', 'code', 'function', 'algorithm', 'database', 'software', 'programming'],
+    'business': ['revenue', 'profit', 'market', 'customer', 'sales', 'strategy', 'business'],
+    'legal': ['contract', 'agreement', 'legal', 'law', 'regulation', 'compliance', 'terms'],
+    'academic': ['research', 'study', 'analysis', 'methodology', 'conclusion', 'abstract', 'references'],
+    'financial': ['budget', 'cost', 'expense', 'investment', 'financial', 'accounting', 'money'],
+    'medical': ['patient', 'diagnosis', 'treatment', 'medical', 'health', 'clinical', 'symptoms'],
+    'educational': ['learn', 'teach', 'student', 'course', 'education', 'training', 'curriculum']
+}
+
+_KEYWORD_CATEGORY = {
+    keyword: category
+    for category, keywords in CATEGORY_KEYWORDS.items()
+    for keyword in keywords
+}
+
+# Multi-keyword matcher: Aho-Corasick when available, otherwise one alternation regex
+if ahocorasick is not None:
+    _CATEGORY_AUTOMATON = ahocorasick.Automaton()
+    for _keyword, _category in _KEYWORD_CATEGORY.items():
+        _CATEGORY_AUTOMATON.add_word(_keyword, _category)
+    _CATEGORY_AUTOMATON.make_automaton()
+else:
+    _CATEGORY_AUTOMATON = None
+# Case-sensitive over lowered text, like the automaton: IGNORECASE would also match
+# forms such as 'ſales' whose .lower() is not a keyword
+_CATEGORY_RE = re.compile('|'.join(
+    re.escape(keyword) for keyword in sorted(_KEYWORD_CATEGORY, key=len, reverse=True)
+))
+_CATEGORY_WINDOW = 64 * 1024
+_CATEGORY_OVERLAP = max(map(len, _KEYWORD_CATEGORY)) - 1
+
+# langdetect converges on a few KB; long texts are sampled at 10%/50%/90%
+LANGUAGE_SAMPLE_CHARS = 4096
+LANGUAGE_SLICE_CHARS = 2048
+
+def _language_sample(text: str) -> str:
+    """Bounded, position-stratified sample of text for language detection"""
+    if len(text) <= LANGUAGE_SAMPLE_CHARS:
+        return text
+    slices = []
+    for fraction in (0.1, 0.5, 0.9):
+        start = min(int(len(text) * fraction), len(text) - LANGUAGE_SLICE_CHARS)
+        slices.append(text[start:start + LANGUAGE_SLICE_CHARS])
+    return '\n'.join(slices)
+
+CSV_SNIFF_BYTES = 64 * 1024
+EXCEL_SAMPLE_ROWS = 50
+
+def _detect_encoding(sample: bytes) -> str:
+    """Guess the text encoding of a byte sample"""
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    if charset_normalizer is not None:
+        best = charset_normalizer.from_bytes(sample).best()
+        if best is not None:
+            # An ASCII sample says nothing about the bytes after it; UTF-8 is a
+            # superset, so prefer it over a 7-bit codec
+            if codecs.lookup(best.encoding).name == 'ascii':
+                return 'utf-8'
+            return best.encoding
+    try:
+        sample.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off by the end of the sample is still UTF-8
+        if e.start >= len(sample) - 3:
+            return 'utf-8'
+        return 'latin-1'
+
+def _count_csv_rows(file_path: str) -> int:
+    """Count data rows by scanning for newlines (quoted multi-line fields overcount)"""
+    lines = 0
+    last = b'\n'
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            lines += block.count(b'\n')
+            last = block[-1:]
+    if last != b'\n':
+        lines += 1
+    return max(0, lines - 1)  # minus the header row
+
 @dataclass
 class DocumentMetadata:
     """Enhanced document metadata with analysis results"""
@@ -41,6 +370,8 @@ class DocumentMetadata:
     extracted_images: int = 0
     processing_time: float = 0.0
     content_categories: List[str] = None
+    # (words, sentences, syllables) shared by all readability formulas
+    text_stats: Optional[Tuple[int, int, int]] = None
 
 @dataclass
 class ProcessingResult:
@@ -74,13 +405,27 @@ class AdvancedDocumentProcessor:
     
     MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
     
-    def __init__(self, enable_ocr: bool = True, extract_images: bool = True):
+    def __init__(self, enable_ocr: bool = True, extract_images: bool = True, extract_image_bytes: bool = False):
         self.enable_ocr = enable_ocr
         self.extract_images = extract_images
+        self.extract_image_bytes = extract_image_bytes
         self.setup_ocr()
     
     def setup_ocr(self):
         """Setup OCR configuration"""
+        self._tess_api = None
+        self._tess_lock = threading.Lock()
+        
+        # Load the Tesseract model once and reuse it for every image
+        if self.enable_ocr and PyTessBaseAPI is not None:
+            try:
+                self._tess_api = PyTessBaseAPI(psm=PSM.SINGLE_BLOCK, oem=OEM.LSTM_ONLY)
+                self.ocr_available = True
+                logger.info("OCR (tesserocr) is available")
+                return
+            except Exception as e:
+                logger.warning(f"tesserocr unavailable, falling back to pytesseract: {e}")
+        
         try:
             # Test if tesseract is available
             pytesseract.get_tesseract_version()
@@ -90,6 +435,15 @@ class AdvancedDocumentProcessor:
             self.ocr_available = False
             logger.warning(f"OCR not available: {e}")
     
+    def close(self):
+        """Release the persistent Tesseract API"""
+        if getattr(self, '_tess_api', None) is not None:
+            self._tess_api.End()
+            self._tess_api = None
+    
+    def __del__(self):
+        self.close()
+    
     def get_supported_formats(self):
         """Return list of supported file formats"""
         return ['.pdf', '.docx', '.txt', '.csv', '.xlsx', '.xls', '.pptx', '.html', 
@@ -116,18 +470,15 @@ class AdvancedDocumentProcessor:
         if not any(file_ext == ext for ext in self.SUPPORTED_TYPES.values()):
             return False, f"File type '{file_ext}' not supported. Supported types: {list(self.SUPPORTED_TYPES.values())}"
         
-        # Check if file exists and is readable
+        # Check if file exists and is readable; the caller already stat'ed the size
         if not os.path.exists(file_path):
             return False, "File does not exist"
         
-        try:
-            with open(file_path, 'rb') as f:
-                # Read first few bytes to verify file integrity
-                header = f.read(1024)
-                if len(header) == 0:
-                    return False, "File appears to be empty"
-        except Exception as e:
-            return False, f"Cannot read file: {str(e)}"
+        if file_size == 0:
+            return False, "File appears to be empty"
+        
+        if not os.access(file_path, os.R_OK):
+            return False, "Cannot read file: permission denied"
         
         return True, "File is valid"
     
@@ -196,55 +547,62 @@ class AdvancedDocumentProcessor:
             errors=errors
         )
     
+    def iter_pdf_pages(self, file_path: str):
+        """Yield (page_number, text, images, tables, has_images) one PDF page at a time"""
+        doc = fitz.open(file_path)
+        try:
+            yield from _iter_pdf_page_range(doc, 0, len(doc), self.extract_images, self.extract_image_bytes)
+        finally:
+            doc.close()
+    
+    def stream_extract(self, file_path: str):
+        """Yield (page_number, text) pieces without materializing the whole document
+        
+        PDFs are streamed page by page; other formats yield their full text once.
+        """
+        if os.path.splitext(file_path)[1].lower() == '.pdf':
+            for page_number, page_text, _, _, _ in self.iter_pdf_pages(file_path):
+                yield page_number, page_text
+        else:
+            yield 1, self.extract_text(file_path).text
+    
     def _extract_from_pdf(self, file_path: str) -> Tuple[str, List[Dict], List[Dict], Dict]:
         """Enhanced PDF extraction with image and table detection"""
+        doc = fitz.open(file_path)
+        page_count = len(doc)
+        
         text_content = []
         images = []
         tables = []
-        
-        doc = fitz.open(file_path)
-        page_count = len(doc)
         has_images = False
         
-        for page_num in range(page_count):
-            page = doc.load_page(page_num)
-            
-            # Extract text
-            page_text = page.get_text()
-            text_content.append(page_text)
-            
-            # Extract images if enabled
-            if self.extract_images:
-                image_list = page.get_images()
-                if image_list:
-                    has_images = True
-                    for img_index, img in enumerate(image_list):
-                        try:
-                            # Get image data
-                            xref = img[0]
-                            pix = fitz.Pixmap(doc, xref)
-                            
-                            if pix.n - pix.alpha < 4:  # GRAY or RGB
-                                img_data = pix.tobytes("png")
-                                images.append({
-                                    'page': page_num + 1,
-                                    'index': img_index,
-                                    'size': len(img_data),
-                                    'width': pix.width,
-                                    'height': pix.height
-                                })
-                            pix = None
-                        except Exception as e:
-                            logger.warning(f"Error extracting image {img_index} from page {page_num}: {e}")
+        try:
+            if page_count < PDF_PARALLEL_MIN_PAGES or PDF_MAX_WORKERS < 2:
+                # Small documents aren't worth the process pool startup
+                pages = _iter_pdf_page_range(doc, 0, page_count, self.extract_images, self.extract_image_bytes)
+            else:
+                doc.close()
+                doc = None
+                # Contiguous page ranges, one per worker; map() keeps them in order
+                step = -(-page_count // PDF_MAX_WORKERS)
+                starts = list(range(0, page_count, step))
+                ends = [min(start + step, page_count) for start in starts]
+                with ProcessPoolExecutor(max_workers=len(starts), initializer=_init_pool_worker) as executor:
+                    pages = [page for page_range in executor.map(
+                        _extract_pdf_pages_worker,
+                        [file_path] * len(starts), starts, ends,
+                        [self.extract_images] * len(starts),
+                        [self.extract_image_bytes] * len(starts)
+                    ) for page in page_range]
             
-            # Detect tables (simple heuristic)
-            if self._detect_tables_in_text(page_text):
-                tables.append({
-                    'page': page_num + 1,
-                    'content': self._extract_table_from_text(page_text)
-                })
-        
-        doc.close()
+            for _, page_text, page_images, page_tables, page_has_images in pages:
+                text_content.append(page_text)
+                images.extend(page_images)
+                tables.extend(page_tables)
+                has_images = has_images or page_has_images
+        finally:
+            if doc is not None:
+                doc.close()
         
         full_text = '\n'.join(text_content)
         
@@ -268,10 +626,10 @@ class AdvancedDocumentProcessor:
         
         # Extract tables
         for table_index, table in enumerate(doc.tables):
-            table_data = []
-            for row in table.rows:
-                row_data = [cell.text.strip() for cell in row.cells]
-                table_data.append(row_data)
+            table_data = [
+                [_docx_cell_text(tc) for tc in tr.iterchildren(_W_TC)]
+                for tr in table._tbl.iterchildren(_W_TR)
+            ]
             
             tables.append({
                 'index': table_index,
@@ -303,35 +661,41 @@ class AdvancedDocumentProcessor:
     
     def _extract_from_txt(self, file_path: str) -> str:
         """Enhanced text file extraction with encoding detection"""
-        encodings = ['utf-8', 'utf-16', 'latin-1', 'cp1252', 'iso-8859-1']
-        
-        for encoding in encodings:
-            try:
-                with open(file_path, 'r', encoding=encoding) as file:
-                    return file.read()
-            except UnicodeDecodeError:
-                continue
-        
-        # If all encodings fail, read as binary and decode with errors='replace'
         with open(file_path, 'rb') as file:
-            return file.read().decode('utf-8', errors='replace')
+            raw = file.read()
+        
+        # Most text is UTF-8: a strict decode of the whole buffer settles it
+        # (utf-8-sig also drops a BOM); only otherwise guess from the head
+        try:
+            return raw.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            pass
+        encoding = _detect_encoding(raw[:CSV_SNIFF_BYTES])
+        if codecs.lookup(encoding).name in ('utf-8', 'utf-8-sig'):
+            # The whole buffer just failed as UTF-8, so trust the full scan instead
+            encoding = _detect_encoding(raw)
+        return raw.decode(encoding, errors='replace')
     
     def _extract_from_csv(self, file_path: str) -> Tuple[str, List[Dict], Dict]:
         """Extract text from CSV files"""
         try:
-            # Try different encodings and separators
-            for encoding in ['utf-8', 'latin-1', 'cp1252']:
-                for sep in [',', ';', '\t', '|']:
-                    try:
-                        df = pd.read_csv(file_path, encoding=encoding, sep=sep)
-                        break
-                    except Exception:
-                        continue
-                else:
-                    continue
-                break
-            else:
-                raise ValueError("Could not parse CSV file")
+            # Sniff encoding and delimiter from a header sample, then parse once
+            with open(file_path, 'rb') as file:
+                raw = file.read(CSV_SNIFF_BYTES)
+            encoding = _detect_encoding(raw)
+            sample = raw.decode(encoding, errors='replace')
+            if len(raw) == CSV_SNIFF_BYTES and '\n' in sample:
+                sample = sample[:sample.rindex('\n')]
+            try:
+                sep = csv.Sniffer().sniff(sample, delimiters=',;\t|').delimiter
+            except csv.Error:
+                sep = ','
+            
+            # Only the first rows are rendered, so don't parse the rest
+            sample_size = 100
+            df = pd.read_csv(file_path, encoding=encoding, encoding_errors='replace',
+                             sep=sep, engine='c', nrows=sample_size)
+            total_rows = max(len(df), _count_csv_rows(file_path))
             
             # Convert to text representation
             text_content = []
@@ -339,17 +703,16 @@ class AdvancedDocumentProcessor:
             text_content.append("Column Headers: " + ", ".join(headers))
             
             # Add sample rows (limit for performance)
-            sample_size = min(100, len(df))
-            for index, row in df.head(sample_size).iterrows():
+            for index, row in df.iterrows():
                 row_text = " | ".join([f"{col}: {val}" for col, val in row.items() if pd.notna(val)])
                 text_content.append(row_text)
             
-            if len(df) > sample_size:
-                text_content.append(f"... and {len(df) - sample_size} more rows")
+            if total_rows > len(df):
+                text_content.append(f"... and {total_rows - len(df)} more rows")
             
             # Create table representation
             table_data = {
-                'rows': len(df),
+                'rows': total_rows,
                 'columns': len(df.columns),
                 'headers': headers,
                 'sample_data': df.head(10).to_dict('records') if len(df) > 0 else []
@@ -363,33 +726,49 @@ class AdvancedDocumentProcessor:
     def _extract_from_excel(self, file_path: str) -> Tuple[str, List[Dict], Dict]:
         """Extract text from Excel files"""
         try:
-            # Read all sheets
-            excel_file = pd.ExcelFile(file_path)
+            if os.path.splitext(file_path)[1].lower() == '.xls':
+                # openpyxl only reads .xlsx; legacy workbooks go through pandas/xlrd
+                excel_file = pd.ExcelFile(file_path)
+                sheets = []
+                for sheet_name in excel_file.sheet_names:
+                    df = pd.read_excel(excel_file, sheet_name=sheet_name, nrows=EXCEL_SAMPLE_ROWS)
+                    rows = [tuple(df.columns)] + list(df.itertuples(index=False, name=None))
+                    sheets.append((sheet_name, rows, excel_file.book.sheet_by_name(sheet_name).nrows - 1))
+            else:
+                # Stream just the sampled rows; read-only mode never loads the full sheet
+                workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+                try:
+                    sheets = []
+                    for worksheet in workbook.worksheets:
+                        rows = list(itertools.islice(worksheet.iter_rows(values_only=True), EXCEL_SAMPLE_ROWS + 1))
+                        total_rows = worksheet.max_row - 1 if worksheet.max_row else len(rows) - 1
+                        sheets.append((worksheet.title, rows, total_rows))
+                finally:
+                    workbook.close()
+            
             text_content = []
             tables = []
             
-            for sheet_name in excel_file.sheet_names:
-                df = pd.read_excel(file_path, sheet_name=sheet_name)
-                
+            for sheet_name, rows, total_rows in sheets:
                 text_content.append(f"\n--- Sheet: {sheet_name} ---")
                 
-                if not df.empty:
-                    headers = df.columns.tolist()
+                if len(rows) > 1:
+                    headers = [h if h is not None else f"Unnamed: {i}" for i, h in enumerate(rows[0])]
                     text_content.append("Headers: " + ", ".join([str(h) for h in headers]))
                     
                     # Add sample rows
-                    sample_size = min(50, len(df))
-                    for index, row in df.head(sample_size).iterrows():
-                        row_text = " | ".join([f"{col}: {val}" for col, val in row.items() if pd.notna(val)])
+                    sample = [dict(zip(headers, row)) for row in rows[1:]]
+                    for record in sample:
+                        row_text = " | ".join([f"{col}: {val}" for col, val in record.items() if pd.notna(val)])
                         text_content.append(row_text)
                     
                     # Store table metadata
                     tables.append({
                         'sheet': sheet_name,
-                        'rows': len(df),
-                        'columns': len(df.columns),
+                        'rows': max(total_rows, len(sample)),
+                        'columns': len(headers),
                         'headers': headers,
-                        'sample_data': df.head(5).to_dict('records')
+                        'sample_data': sample[:5]
                     })
             
             return '\n'.join(text_content), tables, {'has_tables': True}
@@ -439,17 +818,10 @@ class AdvancedDocumentProcessor:
             with open(file_path, 'r', encoding='utf-8', errors='replace') as file:
                 html_content = file.read()
             
-            soup = BeautifulSoup(html_content, 'html.parser')
-            
-            # Remove script and style elements
-            for script in soup(["script", "style"]):
-                script.decompose()
-            
-            # Get text and clean it up
-            text = soup.get_text()
-            lines = (line.strip() for line in text.splitlines())
-            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-            text = '\n'.join(chunk for chunk in chunks if chunk)
+            # Get text without script and style elements, then clean it up
+            text = _html_to_text(html_content)
+            # Break at line ends and double spaces, drop blank lines and edge whitespace
+            text = _BLANK_LINES_RE.sub('\n', _LINE_BREAK_RE.sub('\n', text)).strip()
             
             return text
             
@@ -466,7 +838,7 @@ class AdvancedDocumentProcessor:
             image = Image.open(file_path)
             
             # Perform OCR
-            text = pytesseract.image_to_string(image)
+            text = self._ocr_image(image)
             
             return text, {
                 'has_images': True,
@@ -477,29 +849,72 @@ class AdvancedDocumentProcessor:
             logger.warning(f"OCR failed for {file_path}: {e}")
             return "", {}
     
-    def _detect_tables_in_text(self, text: str) -> bool:
+    def extract_from_images_batch(self, file_paths: List[str]) -> List[str]:
+        """OCR several images, reusing the same Tesseract instance for all of them"""
+        if not self.enable_ocr or not self.ocr_available:
+            return [""] * len(file_paths)
+        
+        texts = []
+        for file_path in file_paths:
+            try:
+                with Image.open(file_path) as image:
+                    texts.append(self._ocr_image(image))
+            except Exception as e:
+                logger.warning(f"OCR failed for {file_path}: {e}")
+                texts.append("")
+        return texts
+    
+    def process_images_parallel(self, file_paths: List[str]) -> List[str]:
+        """OCR many images across worker processes; results keep input order"""
+        if not self.enable_ocr or not self.ocr_available:
+            return [""] * len(file_paths)
+        
+        workers = min(OCR_MAX_WORKERS, len(file_paths))
+        if workers < 2:
+            return self.extract_from_images_batch(file_paths)
+        
+        # Submit contiguous chunks rather than single paths to keep IPC overhead low
+        step = -(-len(file_paths) // workers)
+        chunks = [file_paths[i:i + step] for i in range(0, len(file_paths), step)]
+        # The initializer, not the module-level setdefault, pins OMP_THREAD_LIMIT=1 in each worker
+        with ProcessPoolExecutor(max_workers=len(chunks), initializer=_init_pool_worker) as executor:
+            return [text for chunk_texts in executor.map(_ocr_worker, chunks) for text in chunk_texts]
+    
+    def _ocr_image(self, image) -> str:
+        """Run OCR on a PIL image with the persistent API when available"""
+        image = _preprocess_for_ocr(image)
+        if self._tess_api is not None:
+            # PyTessBaseAPI is stateful and not safe to share between threads
+            with self._tess_lock:
+                self._tess_api.SetImage(image)
+                return self._tess_api.GetUTF8Text()
+        return pytesseract.image_to_string(image, config=PYTESSERACT_CONFIG)
+    
+    @staticmethod
+    def _detect_tables_in_text(text: str) -> bool:
         """Detect if text contains table-like structures"""
-        lines = text.split('\n')
+        lines = text.splitlines()
         
         # Look for common table indicators
         table_indicators = 0
         for line in lines:
             # Check for multiple spaces (column alignment)
-            if len(re.findall(r'\s{3,}', line)) >= 2:
+            if len(_MULTISPACE_RE.findall(line)) >= 2:
                 table_indicators += 1
-            # Check for tab characters
-            if '\t' in line and len(line.split('\t')) >= 3:
+            # Check for tab characters (3+ columns)
+            if line.count('\t') >= 2:
                 table_indicators += 1
-            # Check for pipe separators
-            if '|' in line and len(line.split('|')) >= 3:
+            # Check for pipe separators (3+ columns)
+            if line.count('|') >= 2:
                 table_indicators += 1
         
         # If more than 20% of lines look like table rows
         return table_indicators > len(lines) * 0.2
     
-    def _extract_table_from_text(self, text: str) -> List[List[str]]:
+    @staticmethod
+    def _extract_table_from_text(text: str) -> List[List[str]]:
         """Extract table data from text (simple implementation)"""
-        lines = text.split('\n')
+        lines = text.splitlines()
         table_data = []
         
         for line in lines:
@@ -513,9 +928,9 @@ class AdvancedDocumentProcessor:
                 row = [cell.strip() for cell in line.split('\t') if cell.strip()]
                 if len(row) >= 2:
                     table_data.append(row)
-            elif len(re.findall(r'\s{3,}', line)) >= 2:
+            elif len(_MULTISPACE_RE.findall(line)) >= 2:
                 # Space-separated (tricky, basic implementation)
-                row = re.split(r'\s{3,}', line.strip())
+                row = _MULTISPACE_RE.split(line.strip())
                 if len(row) >= 2:
                     table_data.append(row)
         
@@ -532,13 +947,21 @@ class AdvancedDocumentProcessor:
         
         # Language detection
         try:
-            metadata.language = langdetect.detect(text)
+            metadata.language = langdetect.detect(_language_sample(text))
         except Exception:
             metadata.language = "unknown"
         
         # Readability analysis
         try:
-            metadata.readability_score = textstat.flesch_reading_ease(text)
+            # Flesch reading ease from base counts computed in a single pass
+            metadata.text_stats = _compute_text_stats(text)
+            words, sentences, syllables = metadata.text_stats
+            if words:
+                metadata.readability_score = round(
+                    206.835 - 1.015 * (words / sentences) - 84.6 * (syllables / words), 2
+                )
+            else:
+                metadata.readability_score = 0.0
             
             # Content quality assessment
             if metadata.readability_score >= 90:
@@ -566,26 +989,21 @@ class AdvancedDocumentProcessor:
     
     def _categorize_content(self, text: str) -> List[str]:
         """Basic content categorization based on keywords"""
-        categories = []
-        text_lower = text.lower()
-        
-        # Define category keywords
-        category_keywords = {
-            'technical': ['api', 'code', 'function', 'algorithm', 'database', 'software', 'programming'],
-            'business': ['revenue', 'profit', 'market', 'customer', 'sales', 'strategy', 'business'],
-            'legal': ['contract', 'agreement', 'legal', 'law', 'regulation', 'compliance', 'terms'],
-            'academic': ['research', 'study', 'analysis', 'methodology', 'conclusion', 'abstract', 'references'],
-            'financial': ['budget', 'cost', 'expense', 'investment', 'financial', 'accounting', 'money'],
-            'medical': ['patient', 'diagnosis', 'treatment', 'medical', 'health', 'clinical', 'symptoms'],
-            'educational': ['learn', 'teach', 'student', 'course', 'education', 'training', 'curriculum']
-        }
-        
-        for category, keywords in category_keywords.items():
-            keyword_count = sum(text_lower.count(keyword) for keyword in keywords)
-            # If category keywords appear frequently, add to categories
-            if keyword_count >= 3 or any(keyword in text_lower for keyword in keywords):
-                categories.append(category)
+        # One scan over the text for every keyword of every category; a
+        # category applies as soon as any of its keywords occurs
+        found = set()
+        # Both matchers need lowercase input: lower bounded windows rather than
+        # copying the whole document (overlap keeps boundary matches)
+        for offset in range(0, len(text), _CATEGORY_WINDOW):
+            window = text[offset:offset + _CATEGORY_WINDOW + _CATEGORY_OVERLAP].lower()
+            if _CATEGORY_AUTOMATON is not None:
+                found.update(category for _, category in _CATEGORY_AUTOMATON.iter(window))
+            else:
+                found.update(_KEYWORD_CATEGORY[match.group()] for match in _CATEGORY_RE.finditer(window))
+            if len(found) == len(CATEGORY_KEYWORDS):
+                break
         
+        categories = [category for category in CATEGORY_KEYWORDS if category in found]
         return categories if categories else ['general']
     
     def analyze_document(self, content: str, filename: str = "") -> dict:
@@ -615,6 +1033,14 @@ class AdvancedDocumentProcessor:
         }
 
 # Create enhanced processor instance
-def create_processor(enable_ocr: bool = True, extract_images: bool = True) -> AdvancedDocumentProcessor:
-    """Factory function to create document processor"""
-    return AdvancedDocumentProcessor(enable_ocr=enable_ocr, extract_images=extract_images)
\ No newline at end of file
+def create_processor(enable_ocr: bool = True, extract_images: bool = True, extract_image_bytes: bool = False) -> AdvancedDocumentProcessor:
+    """Factory function to create document processor
+    
+    Processors are cached per configuration, so every caller asking for the
+    same settings shares one instance (and one OCR engine initialization).
+    """
+    return _shared_processor(enable_ocr, extract_images, extract_image_bytes)
+
+@lru_cache(maxsize=None)
+def _shared_processor(enable_ocr: bool, extract_images: bool, extract_image_bytes: bool) -> AdvancedDocumentProcessor:
+    return AdvancedDocumentProcessor(enable_ocr=enable_ocr, extract_images=extract_images, extract_image_bytes=extract_image_bytes)
\ No newline at end of file
@@ -1,8 +1,8 @@
 from flask import Flask, jsonify, request
-from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from dotenv import load_dotenv
 import os
+import threading
 
 # Load environment variables
 load_dotenv()
@@ -13,6 +13,7 @@ def create_app():
     # Configuration
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
     app.config['DEBUG'] = os.getenv('FLASK_DEBUG', 'True').lower() == 'true'
+    app.config['TESTING'] = os.getenv('FLASK_TESTING', 'False').lower() == 'true'
     
     # Database configuration
     app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('SQLALCHEMY_DATABASE_URI', 'sqlite:///chatbot_builder.db')
@@ -22,11 +23,23 @@ def create_app():
     app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', app.config['SECRET_KEY'])
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = False  # We'll handle expiration manually
     
+    # Serialize responses with orjson when available
+    from json_provider import install_json_provider
+    install_json_provider(app)
+    
     # Initialize extensions
     from models import db, migrate
     db.init_app(app)
     migrate.init_app(app, db)
     
+    # Per-API-key throttling for the public chat endpoint
+    from rate_limit import limiter
+    limiter.init_app(app)
+    
+    # Share one document processor (and its OCR engine) across blueprints
+    from advanced_document_processor import create_processor
+    app.extensions['doc_processor'] = create_processor()
+    
     # Initialize JWT
     jwt = JWTManager(app)
     
@@ -44,13 +57,8 @@ def create_app():
         return jsonify({'error': 'Authorization token is required'}), 401
     
     # Enable CORS for all domains and routes
-    CORS(app, resources={
-        r"/api/*": {
-            "origins": ["http://localhost:4200", "http://127.0.0.1:4200", "http://localhost:5000"],
-            "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-            "allow_headers": ["Content-Type", "Authorization"]
-        }
-    })
+    from cors import install_cors
+    install_cors(app, origins=("http://localhost:4200", "http://127.0.0.1:4200", "http://localhost:5000"))
     
     # Register blueprints
     from auth import auth_bp
@@ -67,23 +75,40 @@ def create_app():
     with app.app_context():
         db.create_all()
     
-    # Hello World API endpoint
+    # Warm the RAG services (embedding model, vector store) while the server starts
+    if os.getenv('PRELOAD_RAG_SERVICES', 'True').lower() == 'true' and not app.testing:
+        from chat import get_rag_service as chat_rag_service
+        from documents import get_rag_service as documents_rag_service
+        
+        def preload_rag_services():
+            for load in (chat_rag_service, documents_rag_service):
+                try:
+                    load()
+                except Exception as e:
+                    app.logger.warning(f"RAG service preload failed: {e}")
+        
+        threading.Thread(target=preload_rag_services, name='rag-preload', daemon=True).start()
+    
+    # Hello World API endpoint; these bodies can't change, so they are serialized once
+    HEALTH_JSON = app.json.dumps({
+        'status': 'success',
+        'message': 'RAG Chatbot Builder API is running!',
+        'version': '2.0.0',
+        'features': ['authentication', 'user-management', 'jwt']
+    })
+    HELLO_JSON = app.json.dumps({
+        'message': 'Hello from Flask Backend!',
+        'timestamp': '2025-11-01',
+        'service': 'RAG Chatbot Builder'
+    })
+    
     @app.route('/api/health', methods=['GET'])
     def health_check():
-        return jsonify({
-            'status': 'success',
-            'message': 'RAG Chatbot Builder API is running!',
-            'version': '2.0.0',
-            'features': ['authentication', 'user-management', 'jwt']
-        })
+        return app.response_class(HEALTH_JSON, mimetype=app.json.mimetype)
     
     @app.route('/api/hello', methods=['GET'])
     def hello_world():
-        return jsonify({
-            'message': 'Hello from Flask Backend!',
-            'timestamp': '2025-11-01',
-            'service': 'RAG Chatbot Builder'
-        })
+        return app.response_class(HELLO_JSON, mimetype=app.json.mimetype)
     
     # Test POST endpoint
     @app.route('/api/test', methods=['POST'])
@@ -1,29 +1,119 @@
-from flask import Blueprint, request, jsonify, current_app
-from flask_jwt_extended import jwt_required, get_jwt_identity, jwt_required
-from models import db, User, Chatbot, Query
-from enhanced_rag_service import create_enhanced_rag_service
+from flask import Blueprint, Response, g, request, jsonify, current_app, stream_with_context
+from flask_jwt_extended import jwt_required
+from models import db, Document, Query
+import chatbot_cache
+from chatbot_cache import require_chatbot
+from query_writer import query_writer
+from rate_limit import limiter, public_chat_key, public_chat_limit
+from sqlalchemy import func, tuple_
 from datetime import datetime
+import base64
+import binascii
 import time
 
-# Initialize enhanced RAG service
-enhanced_rag_service = create_enhanced_rag_service(
-    enable_ocr=True,
-    chunking_strategy="auto"  # Auto-select best strategy
-)
+def get_rag_service():
+    """Enhanced RAG service for chat, loaded on first use (or by the app's preload thread)"""
+    # Imported here: enhanced_rag_service pulls in torch, sentence_transformers and sklearn
+    from enhanced_rag_service import get_enhanced_rag_service
+    return get_enhanced_rag_service(
+        enable_ocr=True,
+        chunking_strategy="auto"  # Auto-select best strategy
+    )
 
 chat_bp = Blueprint('chat', __name__, url_prefix='/api/chat')
 
+def _documents_version(chatbot_id) -> str:
+    """Changes whenever the chatbot's searchable documents do, as seen by every worker
+
+    Part of the answer cache namespace: a cache invalidate() only reaches the
+    process that ran the document job.
+    """
+    count, last_processed = db.session.query(
+        func.count(Document.id), func.max(Document.processed_at)
+    ).filter_by(chatbot_id=chatbot_id, status='completed').one()
+    return f"{count}:{last_processed.isoformat() if last_processed else ''}"
+
+def _encode_history_cursor(query: Query) -> str:
+    """Opaque history cursor for the (created_at, id) position of a query"""
+    raw = f"{query.created_at.isoformat()}|{query.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def _decode_history_cursor(cursor: str):
+    """Inverse of _encode_history_cursor; raises ValueError on malformed input"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+    except (binascii.Error, UnicodeError) as e:
+        raise ValueError(str(e))
+    created_at, sep, query_id = raw.partition('|')
+    if not sep or not query_id:
+        raise ValueError("cursor must encode 'created_at|id'")
+    return datetime.fromisoformat(created_at), query_id
+
+def _not_modified(etag: str) -> Response:
+    """Empty 304 for a conditional GET whose weak ETag still matches"""
+    response = Response(status=304)
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, must-revalidate'
+    return response
+
+def _wants_stream(data) -> bool:
+    """Stream when the client asks for it via {"stream": true} or Accept: text/event-stream"""
+    return bool(data.get('stream')) or request.accept_mimetypes.best == 'text/event-stream'
+
+def _sse(payload, event=None) -> str:
+    """Format one Server-Sent Events message"""
+    # app.json is the orjson provider when installed, same as jsonify
+    message = f"data: {current_app.json.dumps(payload)}\n\n"
+    return f"event: {event}\n{message}" if event else message
+
+def _stream_chat_response(chatbot_id, user_message, chatbot_config, done_payload, error_payload):
+    """SSE response: a data message per text delta, then 'done' (or 'error')
+    
+    done_payload(result, query_id, response_time) builds the final message; the
+    Query row is queued once the full answer is known.
+    """
+    app = current_app._get_current_object()
+    start_time = time.time()
+    
+    def events():
+        try:
+            result = None
+            for delta, result in get_rag_service().generate_response_stream(
+                query=user_message,
+                chatbot_id=chatbot_id,
+                config=chatbot_config
+            ):
+                if delta:
+                    yield _sse({'delta': delta})
+            response_time = time.time() - start_time
+            
+            if not result['success']:
+                yield _sse(error_payload, event='error')
+                return
+            
+            query_id = query_writer.put(
+                app,
+                chatbot_id=chatbot_id,
+                user_message=user_message,
+                bot_response=result['response'],
+                tokens_used=result.get('metadata', {}).get('tokens_used', 0),
+                response_time=response_time
+            )
+            yield _sse(done_payload(result, query_id, response_time), event='done')
+        except Exception as e:
+            app.logger.error(f"Streaming chat query error: {str(e)}")
+            yield _sse(error_payload, event='error')
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @chat_bp.route('/<chatbot_id>/query', methods=['POST'])
 @jwt_required()
+@require_chatbot
 def chat_query(chatbot_id):
     """Process a chat query for a specific chatbot with enhanced RAG"""
     try:
-        current_user_id = get_jwt_identity()
-        
-        # Verify chatbot belongs to user
-        chatbot = Chatbot.query.filter_by(id=chatbot_id, user_id=current_user_id).first()
-        if not chatbot:
-            return jsonify({'error': 'Chatbot not found or access denied'}), 404
+        chatbot = g.chatbot
         
         data = request.get_json()
         if not data or 'message' not in data:
@@ -43,12 +133,38 @@ def chat_query(chatbot_id):
             'tone': chatbot.tone,
             'instructions': f"You are {chatbot.name}, a helpful AI assistant.",
             'search_type': search_type,
-            'context_limit': context_limit
+            'context_limit': context_limit,
+            'documents_version': _documents_version(chatbot.id)
         }
         
+        def response_metadata_for(result, query_id, response_time):
+            response_metadata = result.get('metadata', {})
+            return {
+                'query_id': query_id,
+                'search_results': response_metadata.get('search_results', {}),
+                'context_sources': response_metadata.get('context_sources', []),
+                'tokens_used': response_metadata.get('tokens_used', 0),
+                'response_time': response_time,
+                'model_used': response_metadata.get('model_used', 'unknown'),
+                'search_type': search_type,
+                'chatbot_name': chatbot.name,
+                'quality_score': response_metadata.get('quality_score', 0.0),
+                'confidence': response_metadata.get('confidence', 0.0)
+            }
+        
+        if _wants_stream(data):
+            return _stream_chat_response(
+                chatbot_id, user_message, chatbot_config,
+                done_payload=lambda result, query_id, response_time: {
+                    'response': result['response'],
+                    'metadata': response_metadata_for(result, query_id, response_time)
+                },
+                error_payload={'error': 'Failed to process query'}
+            )
+        
         # Process the query through enhanced RAG pipeline
         start_time = time.time()
-        result = enhanced_rag_service.generate_response(
+        result = get_rag_service().generate_response(
             query=user_message,
             chatbot_id=chatbot_id,
             config=chatbot_config
@@ -64,8 +180,9 @@ def chat_query(chatbot_id):
         # Enhanced metadata
         response_metadata = result.get('metadata', {})
         
-        # Save query to database with enhanced metadata
-        query_record = Query(
+        # Save query to database in the background; the id is assigned up front
+        query_id = query_writer.put(
+            current_app._get_current_object(),
             chatbot_id=chatbot_id,
             user_message=user_message,
             bot_response=result['response'],
@@ -73,23 +190,9 @@ def chat_query(chatbot_id):
             response_time=end_time - start_time
         )
         
-        db.session.add(query_record)
-        db.session.commit()
-        
         return jsonify({
             'response': result['response'],
-            'metadata': {
-                'query_id': query_record.id,
-                'search_results': response_metadata.get('search_results', {}),
-                'context_sources': response_metadata.get('context_sources', []),
-                'tokens_used': response_metadata.get('tokens_used', 0),
-                'response_time': end_time - start_time,
-                'model_used': response_metadata.get('model_used', 'unknown'),
-                'search_type': search_type,
-                'chatbot_name': chatbot.name,
-                'quality_score': response_metadata.get('quality_score', 0.0),
-                'confidence': response_metadata.get('confidence', 0.0)
-            }
+            'metadata': response_metadata_for(result, query_id, end_time - start_time)
         }), 200
         
     except Exception as e:
@@ -98,48 +201,70 @@ def chat_query(chatbot_id):
 
 @chat_bp.route('/<chatbot_id>/history', methods=['GET'])
 @jwt_required()
+@require_chatbot
 def get_chat_history(chatbot_id):
     """Get chat history for a chatbot"""
     try:
-        current_user_id = get_jwt_identity()
+        chatbot = g.chatbot
         
-        # Verify chatbot belongs to user
-        chatbot = Chatbot.query.filter_by(id=chatbot_id, user_id=current_user_id).first()
-        if not chatbot:
-            return jsonify({'error': 'Chatbot not found or access denied'}), 404
+        # History only ever grows, so (count, newest) identifies its state for polling clients
+        count, newest = db.session.query(
+            func.count(Query.id), func.max(Query.created_at)
+        ).filter(Query.chatbot_id == chatbot_id).one()
+        etag = f"{count}-{newest.isoformat() if newest else 0}"
+        if request.if_none_match.contains_weak(etag):
+            return _not_modified(etag)
         
         # Get pagination parameters
-        page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
-        per_page = min(per_page, 100)  # Limit to 100 per page
-        
-        # Get queries with pagination
-        queries = Query.query.filter_by(chatbot_id=chatbot_id)\
-                           .order_by(Query.created_at.desc())\
-                           .paginate(page=page, per_page=per_page, error_out=False)
-        
-        return jsonify({
-            'queries': [query.to_dict() for query in queries.items],
+        per_page = max(1, min(per_page, 100))  # Limit to 100 per page
+        cursor = request.args.get('cursor')
+        
+        # Keyset pagination: seek past the cursor instead of OFFSET-scanning
+        history = Query.query.filter_by(chatbot_id=chatbot_id)
+        if cursor:
+            try:
+                cursor_created_at, cursor_id = _decode_history_cursor(cursor)
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+            history = history.filter(tuple_(Query.created_at, Query.id) < (cursor_created_at, cursor_id))
+        
+        # One extra row tells us whether another page exists without a COUNT
+        queries = history.order_by(Query.created_at.desc(), Query.id.desc())\
+                         .limit(per_page + 1).all()
+        has_next = len(queries) > per_page
+        queries = queries[:per_page]
+        
+        response = jsonify({
+            'queries': [query.to_dict() for query in queries],
             'pagination': {
-                'page': page,
                 'per_page': per_page,
-                'total': queries.total,
-                'pages': queries.pages,
-                'has_next': queries.has_next,
-                'has_prev': queries.has_prev
+                'has_next': has_next,
+                'next_cursor': _encode_history_cursor(queries[-1]) if has_next else None
             }
-        }), 200
+        })
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, must-revalidate'
+        return response, 200
         
     except Exception as e:
         current_app.logger.error(f"Get chat history error: {str(e)}")
         return jsonify({'error': 'Failed to retrieve chat history'}), 500
 
+@chat_bp.errorhandler(429)
+def rate_limited(error):
+    return jsonify({
+        'error': 'Rate limit exceeded',
+        'message': 'Too many requests for this chatbot. Please try again shortly.'
+    }), 429
+
 @chat_bp.route('/public/<api_key>/query', methods=['POST'])
+@limiter.limit(public_chat_limit, key_func=public_chat_key)
 def public_chat_query(api_key):
     """Public endpoint for chatbot queries using API key with enhanced capabilities"""
     try:
         # Find chatbot by API key
-        chatbot = Chatbot.query.filter_by(api_key=api_key, is_active=True).first()
+        chatbot = chatbot_cache.get_by_api_key(api_key)
         if not chatbot:
             return jsonify({'error': 'Invalid API key or chatbot not found'}), 404
         
@@ -159,12 +284,28 @@ def public_chat_query(api_key):
             'name': chatbot.name,
             'tone': chatbot.tone,
             'instructions': f"You are {chatbot.name}, a helpful AI assistant.",
-            'search_type': search_type
+            'search_type': search_type,
+            'documents_version': _documents_version(chatbot.id)
         }
         
+        if _wants_stream(data):
+            return _stream_chat_response(
+                chatbot.id, user_message, chatbot_config,
+                done_payload=lambda result, query_id, response_time: {
+                    'response': result['response'],
+                    'chatbot_name': chatbot.name,
+                    'timestamp': datetime.utcnow().isoformat(),
+                    'search_type': search_type
+                },
+                error_payload={
+                    'error': 'Failed to process query',
+                    'message': 'I apologize, but I encountered an error processing your question.'
+                }
+            )
+        
         # Process the query through enhanced RAG pipeline
         start_time = time.time()
-        result = enhanced_rag_service.generate_response(
+        result = get_rag_service().generate_response(
             query=user_message,
             chatbot_id=chatbot.id,
             config=chatbot_config
@@ -177,8 +318,9 @@ def public_chat_query(api_key):
                 'message': 'I apologize, but I encountered an error processing your question.'
             }), 500
         
-        # Save query to database (for analytics)
-        query_record = Query(
+        # Save query to database (for analytics) in the background
+        query_writer.put(
+            current_app._get_current_object(),
             chatbot_id=chatbot.id,
             user_message=user_message,
             bot_response=result['response'],
@@ -186,9 +328,6 @@ def public_chat_query(api_key):
             response_time=end_time - start_time
         )
         
-        db.session.add(query_record)
-        db.session.commit()
-        
         return jsonify({
             'response': result['response'],
             'chatbot_name': chatbot.name,
@@ -205,15 +344,11 @@ def public_chat_query(api_key):
 
 @chat_bp.route('/test/<chatbot_id>', methods=['POST'])
 @jwt_required()
+@require_chatbot
 def test_chatbot(chatbot_id):
     """Test endpoint for enhanced chatbot functionality"""
     try:
-        current_user_id = get_jwt_identity()
-        
-        # Verify chatbot belongs to user
-        chatbot = Chatbot.query.filter_by(id=chatbot_id, user_id=current_user_id).first()
-        if not chatbot:
-            return jsonify({'error': 'Chatbot not found or access denied'}), 404
+        chatbot = g.chatbot
         
         # Enhanced test queries
         test_queries = [
@@ -229,7 +364,7 @@ def test_chatbot(chatbot_id):
         search_type = data.get('search_type', 'hybrid') if data else 'hybrid'
         
         # Get enhanced chatbot analytics
-        analytics = enhanced_rag_service.get_chatbot_analytics(chatbot_id)
+        analytics = get_rag_service().get_chatbot_analytics(chatbot_id)
         
         # Process test query if there are documents
         collection_stats = analytics.get('collection_stats', {})
@@ -238,9 +373,10 @@ def test_chatbot(chatbot_id):
         if total_chunks > 0:
             config = {
                 'name': chatbot.name,
-                'search_type': search_type
+                'search_type': search_type,
+                'documents_version': _documents_version(chatbot_id)
             }
-            result = enhanced_rag_service.generate_response(
+            result = get_rag_service().generate_response(
                 query=test_query,
                 chatbot_id=chatbot_id,
                 config=config
@@ -261,8 +397,8 @@ def test_chatbot(chatbot_id):
             'suggestions': test_queries,
             'available_search_types': ['semantic', 'keyword', 'hybrid'],
             'service_capabilities': {
-                'ocr_enabled': enhanced_rag_service.document_processor.ocr_available,
-                'supported_formats': enhanced_rag_service.document_processor.get_supported_formats(),
+                'ocr_enabled': current_app.extensions['doc_processor'].ocr_available,
+                'supported_formats': current_app.extensions['doc_processor'].get_supported_formats(),
                 'chunking_strategies': ['recursive', 'semantic', 'paragraph', 'auto']
             }
         }), 200
@@ -0,0 +1,152 @@
+import os
+import json
+import hashlib
+import logging
+from dataclasses import asdict, dataclass
+from functools import wraps
+from typing import Optional
+
+from flask import g, jsonify
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy.orm import load_only
+
+from models import db, Chatbot
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Snapshots are shared across workers through Redis; without it every lookup is one narrow query
+CHATBOT_CACHE_TTL = int(os.getenv('CHATBOT_CACHE_TTL', '60'))
+CHATBOT_CACHE_PREFIX = 'caas:cb:'
+
+_redis = None
+if redis is not None and os.getenv('CHATBOT_CACHE_REDIS_URL'):
+    _redis = redis.Redis.from_url(os.getenv('CHATBOT_CACHE_REDIS_URL'))
+
+# Only the columns CachedChatbot keeps; description and timestamps stay unloaded
+_SNAPSHOT_COLUMNS = load_only(
+    Chatbot.id, Chatbot.user_id, Chatbot.name, Chatbot.theme,
+    Chatbot.tone, Chatbot.api_key, Chatbot.is_active, Chatbot.rate_limit_per_minute
+)
+
+@dataclass(frozen=True)
+class CachedChatbot:
+    """Read-only snapshot of the Chatbot fields the chat routes use"""
+    id: str
+    user_id: str
+    name: str
+    theme: str
+    tone: str
+    api_key: str
+    is_active: bool
+    rate_limit_per_minute: Optional[int]
+
+    @classmethod
+    def from_model(cls, chatbot: Chatbot) -> 'CachedChatbot':
+        return cls(
+            id=chatbot.id,
+            user_id=chatbot.user_id,
+            name=chatbot.name,
+            theme=chatbot.theme,
+            tone=chatbot.tone,
+            api_key=chatbot.api_key,
+            is_active=chatbot.is_active,
+            rate_limit_per_minute=chatbot.rate_limit_per_minute
+        )
+
+def _key_for_api_key(api_key: str) -> str:
+    # Hashed so raw API keys never show up in Redis key listings
+    return CHATBOT_CACHE_PREFIX + 'key:' + hashlib.sha1(api_key.encode('utf-8')).hexdigest()
+
+def _key_for_id(chatbot_id: str, user_id: str) -> str:
+    return f"{CHATBOT_CACHE_PREFIX}id:{chatbot_id}:{user_id}"
+
+def _load(key: str) -> Optional[CachedChatbot]:
+    if _redis is None:
+        return None
+    try:
+        body = _redis.get(key)
+    except redis.RedisError as e:
+        logger.warning(f"Chatbot cache read failed: {e}")
+        return None
+    if body is None:
+        return None
+    try:
+        return CachedChatbot(**json.loads(body))
+    except (ValueError, TypeError):
+        return None
+
+def _store(model: Optional[Chatbot]) -> Optional[CachedChatbot]:
+    if model is None:
+        return None
+    chatbot = CachedChatbot.from_model(model)
+    if _redis is not None:
+        body = json.dumps(asdict(chatbot))
+        try:
+            pipe = _redis.pipeline(transaction=False)
+            pipe.setex(_key_for_api_key(chatbot.api_key), CHATBOT_CACHE_TTL, body)
+            pipe.setex(_key_for_id(chatbot.id, chatbot.user_id), CHATBOT_CACHE_TTL, body)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Chatbot cache write failed: {e}")
+    return chatbot
+
+def get_by_api_key(api_key: str) -> Optional[CachedChatbot]:
+    """Active chatbot for a public API key, or None
+
+    Resolved once per request. A Redis hit skips the database entirely; changes
+    reach every worker through invalidate(), with CHATBOT_CACHE_TTL as the backstop.
+    """
+    lookups = g.setdefault('chatbots_by_api_key', {})
+    if api_key not in lookups:
+        lookups[api_key] = _lookup_by_api_key(api_key)
+    return lookups[api_key]
+
+def _lookup_by_api_key(api_key: str) -> Optional[CachedChatbot]:
+    chatbot = _load(_key_for_api_key(api_key))
+    if chatbot is not None and chatbot.api_key == api_key and chatbot.is_active:
+        return chatbot
+    return _store(Chatbot.query.options(_SNAPSHOT_COLUMNS).filter_by(api_key=api_key, is_active=True).first())
+
+def get_by_id_for_user(chatbot_id: str, user_id: str) -> Optional[CachedChatbot]:
+    """Chatbot owned by user_id, or None"""
+    chatbot = _load(_key_for_id(chatbot_id, user_id))
+    if chatbot is not None:
+        return chatbot
+    return _store(Chatbot.query.options(_SNAPSHOT_COLUMNS).filter_by(id=chatbot_id, user_id=user_id).first())
+
+def invalidate(chatbot_id: str, user_id: str, api_key: str):
+    """Drop a chatbot's snapshot for every worker; call after the commit, passing
+    the api_key it had before the change"""
+    if _redis is None:
+        return
+    try:
+        _redis.delete(_key_for_api_key(api_key), _key_for_id(chatbot_id, user_id))
+    except redis.RedisError as e:
+        logger.warning(f"Chatbot cache invalidation failed: {e}")
+
+def require_chatbot(fn=None, *, model: bool = False):
+    """Resolve the <chatbot_id> route argument to the caller's chatbot or return 404
+
+    The chatbot is stored on flask.g.chatbot: a cached snapshot by default, or the
+    full ORM row with model=True for routes that modify or serialize it. Apply
+    beneath @jwt_required().
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(chatbot_id, *args, **kwargs):
+            user_id = get_jwt_identity()
+            if model:
+                chatbot = Chatbot.query.filter_by(id=chatbot_id, user_id=user_id).first()
+            else:
+                chatbot = get_by_id_for_user(chatbot_id, user_id)
+            if not chatbot:
+                return jsonify({'error': 'Chatbot not found or access denied'}), 404
+            g.chatbot = chatbot
+            return view(chatbot_id, *args, **kwargs)
+        return wrapper
+    return decorator(fn) if fn is not None else decorator
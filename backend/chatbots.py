@@ -1,10 +1,127 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, g, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import db, User, Chatbot, Document, Query
+from sqlalchemy import func
+from sqlalchemy.orm import load_only
+import chatbot_cache
+from chatbot_cache import require_chatbot
 from datetime import datetime
-import uuid
+from functools import lru_cache
+from typing import List, Tuple
+import hashlib
+import html
+import json
+import logging
+import os
+import secrets
+import string
+import threading
 
 chatbots_bp = Blueprint('chatbots', __name__, url_prefix='/api/chatbots')
+logger = logging.getLogger(__name__)
+
+# Compiled once; ${...} fields are pre-escaped by _render_embed_code, $$ is a literal $
+_EMBED_TEMPLATE = string.Template("""<!-- ${name_comment} Chatbot Embed -->
+<div id="chatbot-${chatbot_id}"></div>
+<script>
+(function() {
+    const chatbotConfig = {
+        apiKey: ${api_key_js},
+        apiEndpoint: ${api_endpoint_js},
+        chatbotName: ${name_js},
+        theme: ${theme_js},
+        containerId: "chatbot-${chatbot_id}"
+    };
+    
+    // Basic chatbot widget implementation
+    // This would be replaced with a more sophisticated widget in production
+    const container = document.getElementById(chatbotConfig.containerId);
+    if (container) {
+        container.innerHTML = `
+            <div style="border: 1px solid #ddd; border-radius: 8px; padding: 16px; max-width: 400px;">
+                <h4></h4>
+                <div id="chat-messages-${chatbot_id}" style="height: 300px; overflow-y: auto; border: 1px solid #eee; padding: 8px; margin: 8px 0;"></div>
+                <input type="text" id="chat-input-${chatbot_id}" placeholder="Type your message..." style="width: 100%; padding: 8px; margin-bottom: 8px;">
+                <button onclick="sendMessage()" style="width: 100%; padding: 8px; background: #007bff; color: white; border: none; border-radius: 4px;">Send</button>
+            </div>
+        `;
+        // Set as text so the name can't inject markup
+        container.querySelector("h4").textContent = chatbotConfig.chatbotName;
+        
+        window.sendMessage = function() {
+            const input = document.getElementById("chat-input-${chatbot_id}");
+            const messages = document.getElementById("chat-messages-${chatbot_id}");
+            
+            if (input.value.trim()) {
+                const userMessage = input.value;
+                messages.innerHTML += `<div><strong>You:</strong> $${userMessage}</div>`;
+                
+                fetch(chatbotConfig.apiEndpoint, {
+                    method: 'POST',
+                    headers: {'Content-Type': 'application/json'},
+                    body: JSON.stringify({message: userMessage})
+                })
+                .then(response => response.json())
+                .then(data => {
+                    messages.innerHTML += `<div><strong>$${chatbotConfig.chatbotName}:</strong> $${data.response || data.message || 'Sorry, I encountered an error.'}</div>`;
+                    messages.scrollTop = messages.scrollHeight;
+                })
+                .catch(error => {
+                    messages.innerHTML += `<div><strong>$${chatbotConfig.chatbotName}:</strong> Sorry, I'm having trouble responding right now.</div>`;
+                });
+                
+                input.value = '';
+            }
+        };
+        
+        document.getElementById("chat-input-${chatbot_id}").addEventListener("keypress", function(e) {
+            if (e.key === "Enter") {
+                sendMessage();
+            }
+        });
+    }
+})();
+</script>
+""")
+
+def _js_literal(value) -> str:
+    """JSON-encode a value for a <script> (no '</' so it can't close the tag)"""
+    return json.dumps(value).replace('</', '<\\/')
+
+@lru_cache(maxsize=1024)
+def _render_embed_code(chatbot_id, name, theme, api_key, api_endpoint) -> Tuple[str, str]:
+    """(embed snippet, ETag) for a chatbot; keyed on every input, so edits render afresh"""
+    embed_code = _EMBED_TEMPLATE.substitute(
+        chatbot_id=chatbot_id,
+        name_comment=html.escape(name or '').replace('--', '- -'),
+        api_key_js=_js_literal(api_key),
+        api_endpoint_js=_js_literal(api_endpoint),
+        name_js=_js_literal(name),
+        theme_js=_js_literal(theme)
+    ).strip()
+    return embed_code, hashlib.blake2b(embed_code.encode('utf-8'), digest_size=16).hexdigest()
+
+def _purge_chatbot_data(chatbot_id: str, file_paths: List[str]):
+    """Remove a deleted chatbot's vectors and uploaded files"""
+    try:
+        from enhanced_rag_service import purge_chatbot
+        purge_chatbot(chatbot_id)
+    except Exception as e:
+        logger.warning(f"Could not purge vector data for chatbot {chatbot_id}: {e}")
+    
+    for path in file_paths:
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+            except Exception as e:
+                logger.warning(f"Could not delete file {path}: {e}")
+
+def _chatbot_counts(chatbot_id: str) -> Tuple[int, int]:
+    """(document count, query count) for a chatbot in a single round trip"""
+    return tuple(db.session.query(
+        db.session.query(func.count(Document.id)).filter(Document.chatbot_id == chatbot_id).scalar_subquery(),
+        db.session.query(func.count(Query.id)).filter(Query.chatbot_id == chatbot_id).scalar_subquery()
+    ).one())
 
 @chatbots_bp.route('/', methods=['GET'])
 @jwt_required()
@@ -13,21 +130,30 @@ def get_user_chatbots():
     try:
         current_user_id = get_jwt_identity()
         
-        chatbots = Chatbot.query.filter_by(user_id=current_user_id).all()
-        
-        # Add stats for each chatbot
-        chatbots_data = []
-        for chatbot in chatbots:
-            chatbot_dict = chatbot.to_dict()
-            
-            # Add document and query counts
-            doc_count = Document.query.filter_by(chatbot_id=chatbot.id).count()
-            query_count = Query.query.filter_by(chatbot_id=chatbot.id).count()
-            
-            chatbot_dict['document_count'] = doc_count
-            chatbot_dict['query_count'] = query_count
-            
-            chatbots_data.append(chatbot_dict)
+        # Per-chatbot counts are aggregated separately and LEFT JOINed, so the
+        # whole list is one round trip (and no documents x queries cross product)
+        user_chatbot_ids = db.session.query(Chatbot.id).filter(Chatbot.user_id == current_user_id)
+        doc_counts = db.session.query(
+            Document.chatbot_id, func.count().label('n')
+        ).filter(Document.chatbot_id.in_(user_chatbot_ids))\
+         .group_by(Document.chatbot_id).subquery()
+        query_counts = db.session.query(
+            Query.chatbot_id, func.count().label('n')
+        ).filter(Query.chatbot_id.in_(user_chatbot_ids))\
+         .group_by(Query.chatbot_id).subquery()
+        
+        rows = db.session.query(
+            Chatbot,
+            func.coalesce(doc_counts.c.n, 0),
+            func.coalesce(query_counts.c.n, 0)
+        ).outerjoin(doc_counts, doc_counts.c.chatbot_id == Chatbot.id)\
+         .outerjoin(query_counts, query_counts.c.chatbot_id == Chatbot.id)\
+         .filter(Chatbot.user_id == current_user_id).all()
+        
+        chatbots_data = [
+            chatbot.to_dict(document_count=doc_count, query_count=query_count)
+            for chatbot, doc_count, query_count in rows
+        ]
         
         return jsonify({
             'chatbots': chatbots_data,
@@ -55,7 +181,7 @@ def create_chatbot():
             return jsonify({'error': 'Chatbot name cannot be empty'}), 400
         
         # Check if chatbot name already exists for this user
-        existing = Chatbot.query.filter_by(user_id=current_user_id, name=name).first()
+        existing = Chatbot.query.options(load_only(Chatbot.id)).filter_by(user_id=current_user_id, name=name).first()
         if existing:
             return jsonify({'error': 'A chatbot with this name already exists'}), 409
         
@@ -82,23 +208,15 @@ def create_chatbot():
 
 @chatbots_bp.route('/<chatbot_id>', methods=['GET'])
 @jwt_required()
+@require_chatbot(model=True)
 def get_chatbot(chatbot_id):
     """Get a specific chatbot"""
     try:
-        current_user_id = get_jwt_identity()
-        
-        chatbot = Chatbot.query.filter_by(id=chatbot_id, user_id=current_user_id).first()
-        if not chatbot:
-            return jsonify({'error': 'Chatbot not found or access denied'}), 404
-        
-        chatbot_data = chatbot.to_dict()
+        chatbot = g.chatbot
         
         # Add additional stats
-        doc_count = Document.query.filter_by(chatbot_id=chatbot_id).count()
-        query_count = Query.query.filter_by(chatbot_id=chatbot_id).count()
-        
-        chatbot_data['document_count'] = doc_count
-        chatbot_data['query_count'] = query_count
+        doc_count, query_count = _chatbot_counts(chatbot_id)
+        chatbot_data = chatbot.to_dict(document_count=doc_count, query_count=query_count)
         
         return jsonify({'chatbot': chatbot_data}), 200
         
@@ -108,14 +226,11 @@ def get_chatbot(chatbot_id):
 
 @chatbots_bp.route('/<chatbot_id>', methods=['PUT'])
 @jwt_required()
+@require_chatbot(model=True)
 def update_chatbot(chatbot_id):
     """Update a chatbot"""
     try:
-        current_user_id = get_jwt_identity()
-        
-        chatbot = Chatbot.query.filter_by(id=chatbot_id, user_id=current_user_id).first()
-        if not chatbot:
-            return jsonify({'error': 'Chatbot not found or access denied'}), 404
+        chatbot = g.chatbot
         
         data = request.get_json()
         if not data:
@@ -128,8 +243,8 @@ def update_chatbot(chatbot_id):
                 return jsonify({'error': 'Chatbot name cannot be empty'}), 400
             
             # Check if name already exists for this user (excluding current chatbot)
-            existing = Chatbot.query.filter_by(
-                user_id=current_user_id, 
+            existing = Chatbot.query.options(load_only(Chatbot.id)).filter_by(
+                user_id=chatbot.user_id, 
                 name=name
             ).filter(Chatbot.id != chatbot_id).first()
             
@@ -150,8 +265,15 @@ def update_chatbot(chatbot_id):
         if 'is_active' in data:
             chatbot.is_active = bool(data['is_active'])
         
+        if 'rate_limit_per_minute' in data:
+            rate_limit = data['rate_limit_per_minute']
+            if rate_limit is not None and (not isinstance(rate_limit, int) or isinstance(rate_limit, bool) or rate_limit < 1):
+                return jsonify({'error': 'rate_limit_per_minute must be a positive integer or null'}), 400
+            chatbot.rate_limit_per_minute = rate_limit
+        
         chatbot.updated_at = datetime.utcnow()
         db.session.commit()
+        chatbot_cache.invalidate(chatbot.id, chatbot.user_id, chatbot.api_key)
         
         return jsonify({
             'message': 'Chatbot updated successfully',
@@ -164,25 +286,32 @@ def update_chatbot(chatbot_id):
 
 @chatbots_bp.route('/<chatbot_id>', methods=['DELETE'])
 @jwt_required()
+@require_chatbot(model=True)
 def delete_chatbot(chatbot_id):
     """Delete a chatbot and all its data"""
     try:
-        current_user_id = get_jwt_identity()
-        
-        chatbot = Chatbot.query.filter_by(id=chatbot_id, user_id=current_user_id).first()
-        if not chatbot:
-            return jsonify({'error': 'Chatbot not found or access denied'}), 404
+        chatbot = g.chatbot
         
         # Get stats before deletion
-        doc_count = Document.query.filter_by(chatbot_id=chatbot_id).count()
-        query_count = Query.query.filter_by(chatbot_id=chatbot_id).count()
+        doc_count, query_count = _chatbot_counts(chatbot_id)
+        file_paths = [path for (path,) in db.session.query(Document.file_path)
+                      .filter(Document.chatbot_id == chatbot_id)]
         
-        # Note: The database relationships are set up with cascade delete,
-        # so deleting the chatbot will also delete all associated documents and queries
+        # One DELETE per child table instead of the ORM loading and deleting row by row
+        db.session.execute(Query.__table__.delete().where(Query.chatbot_id == chatbot_id))
+        db.session.execute(Document.__table__.delete().where(Document.chatbot_id == chatbot_id))
         
         chatbot_name = chatbot.name
+        user_id, api_key = chatbot.user_id, chatbot.api_key
         db.session.delete(chatbot)
         db.session.commit()
+        chatbot_cache.invalidate(chatbot_id, user_id, api_key)
+        
+        # Vector store and uploaded files are cleaned up off the request path
+        threading.Thread(
+            target=_purge_chatbot_data, args=(chatbot_id, file_paths),
+            name='chatbot-purge', daemon=True
+        ).start()
         
         return jsonify({
             'message': f'Chatbot "{chatbot_name}" deleted successfully',
@@ -196,20 +325,19 @@ def delete_chatbot(chatbot_id):
 
 @chatbots_bp.route('/<chatbot_id>/regenerate-api-key', methods=['POST'])
 @jwt_required()
+@require_chatbot(model=True)
 def regenerate_api_key(chatbot_id):
     """Regenerate API key for a chatbot"""
     try:
-        current_user_id = get_jwt_identity()
-        
-        chatbot = Chatbot.query.filter_by(id=chatbot_id, user_id=current_user_id).first()
-        if not chatbot:
-            return jsonify({'error': 'Chatbot not found or access denied'}), 404
+        chatbot = g.chatbot
         
         # Generate new API key
-        chatbot.api_key = str(uuid.uuid4().hex)
+        old_api_key = chatbot.api_key
+        chatbot.api_key = secrets.token_urlsafe(24)
         chatbot.updated_at = datetime.utcnow()
         
         db.session.commit()
+        chatbot_cache.invalidate(chatbot.id, chatbot.user_id, old_api_key)
         
         return jsonify({
             'message': 'API key regenerated successfully',
@@ -222,86 +350,33 @@ def regenerate_api_key(chatbot_id):
 
 @chatbots_bp.route('/<chatbot_id>/embed-code', methods=['GET'])
 @jwt_required()
+@require_chatbot
 def get_embed_code(chatbot_id):
     """Get embed code for a chatbot"""
     try:
-        current_user_id = get_jwt_identity()
-        
-        chatbot = Chatbot.query.filter_by(id=chatbot_id, user_id=current_user_id).first()
-        if not chatbot:
-            return jsonify({'error': 'Chatbot not found or access denied'}), 404
+        chatbot = g.chatbot
         
         # Generate embed code
         api_endpoint = f"{request.host_url}api/chat/public/{chatbot.api_key}/query"
         
-        embed_script = f"""
-<!-- {chatbot.name} Chatbot Embed -->
-<div id="chatbot-{chatbot_id}"></div>
-<script>
-(function() {{
-    const chatbotConfig = {{
-        apiKey: "{chatbot.api_key}",
-        apiEndpoint: "{api_endpoint}",
-        chatbotName: "{chatbot.name}",
-        theme: "{chatbot.theme}",
-        containerId: "chatbot-{chatbot_id}"
-    }};
-    
-    // Basic chatbot widget implementation
-    // This would be replaced with a more sophisticated widget in production
-    const container = document.getElementById(chatbotConfig.containerId);
-    if (container) {{
-        container.innerHTML = `
-            <div style="border: 1px solid #ddd; border-radius: 8px; padding: 16px; max-width: 400px;">
-                <h4>{chatbot.name}</h4>
-                <div id="chat-messages-{chatbot_id}" style="height: 300px; overflow-y: auto; border: 1px solid #eee; padding: 8px; margin: 8px 0;"></div>
-                <input type="text" id="chat-input-{chatbot_id}" placeholder="Type your message..." style="width: 100%; padding: 8px; margin-bottom: 8px;">
-                <button onclick="sendMessage()" style="width: 100%; padding: 8px; background: #007bff; color: white; border: none; border-radius: 4px;">Send</button>
-            </div>
-        `;
-        
-        window.sendMessage = function() {{
-            const input = document.getElementById("chat-input-{chatbot_id}");
-            const messages = document.getElementById("chat-messages-{chatbot_id}");
-            
-            if (input.value.trim()) {{
-                const userMessage = input.value;
-                messages.innerHTML += `<div><strong>You:</strong> ${{userMessage}}</div>`;
-                
-                fetch(chatbotConfig.apiEndpoint, {{
-                    method: 'POST',
-                    headers: {{'Content-Type': 'application/json'}},
-                    body: JSON.stringify({{message: userMessage}})
-                }})
-                .then(response => response.json())
-                .then(data => {{
-                    messages.innerHTML += `<div><strong>${{chatbotConfig.chatbotName}}:</strong> ${{data.response || data.message || 'Sorry, I encountered an error.'}}</div>`;
-                    messages.scrollTop = messages.scrollHeight;
-                }})
-                .catch(error => {{
-                    messages.innerHTML += `<div><strong>${{chatbotConfig.chatbotName}}:</strong> Sorry, I'm having trouble responding right now.</div>`;
-                }});
-                
-                input.value = '';
-            }}
-        }};
-        
-        document.getElementById("chat-input-{chatbot_id}").addEventListener("keypress", function(e) {{
-            if (e.key === "Enter") {{
-                sendMessage();
-            }}
-        }});
-    }}
-}})();
-</script>
-"""
+        embed_script, etag = _render_embed_code(
+            chatbot.id, chatbot.name, chatbot.theme, chatbot.api_key, api_endpoint
+        )
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+            response.set_etag(etag, weak=True)
+            response.headers['Cache-Control'] = 'private, must-revalidate'
+            return response
 
-        return jsonify({
-            'embed_code': embed_script.strip(),
+        response = jsonify({
+            'embed_code': embed_script,
             'api_endpoint': api_endpoint,
             'chatbot_name': chatbot.name,
             'instructions': 'Copy and paste this code into your website where you want the chatbot to appear.'
-        }), 200
+        })
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, must-revalidate'
+        return response, 200
         
     except Exception as e:
         current_app.logger.error(f"Get embed code error: {str(e)}")
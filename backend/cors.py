@@ -0,0 +1,35 @@
+from typing import Iterable
+
+from flask import request
+
+CORS_METHODS = 'GET, POST, PUT, DELETE, OPTIONS'
+CORS_HEADERS = 'Content-Type, Authorization'
+
+def install_cors(app, origins: Iterable[str], path_prefix: str = '/api/'):
+    """Allow cross-origin calls to path_prefix from a fixed set of origins
+
+    A frozenset lookup per response instead of flask-cors' per-request resource
+    and origin matching; preflight OPTIONS requests are answered before routing.
+    """
+    allowed = frozenset(origins)
+    preflight_headers = {
+        'Access-Control-Allow-Methods': CORS_METHODS,
+        'Access-Control-Allow-Headers': CORS_HEADERS
+    }
+
+    @app.before_request
+    def cors_preflight():
+        if request.method == 'OPTIONS' and request.path.startswith(path_prefix):
+            response = app.response_class(status=204)
+            if request.headers.get('Origin') in allowed:
+                response.headers.update(preflight_headers)
+            return response
+
+    @app.after_request
+    def cors_headers(response):
+        if request.path.startswith(path_prefix):
+            origin = request.headers.get('Origin')
+            if origin in allowed:
+                response.headers['Access-Control-Allow-Origin'] = origin
+            response.vary.add('Origin')
+        return response
@@ -4,17 +4,620 @@ Simple RAG Demo Application - Shows Phase 4 Operations
 """
 
 import os
+import re
 import sys
 import json
+import shutil
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+from functools import wraps
 from datetime import datetime
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, Response, g, jsonify, request, send_from_directory
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from flask_compress import Compress
+except ImportError:
+    Compress = None
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+try:
+    from numba import njit, prange
+    _NUMBA_AVAILABLE = np is not None
+except ImportError:
+    _NUMBA_AVAILABLE = False
+
 # Add current directory to path
 current_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, current_dir)
 
+logger = logging.getLogger(__name__)
+
+# Stream uploads to disk in 1MB chunks rather than Werkzeug's default 16KB
+UPLOAD_BUFFER_SIZE = 1024 * 1024
+
+# Semantic answer cache for /api/chat
+CHAT_CACHE_THRESHOLD = 0.92
+CHAT_CACHE_MIN_SOURCE_OVERLAP = 0.5  # Jaccard of retrieved document ids
+CHAT_CACHE_MAX_ENTRIES = 1024
+CHAT_EMBEDDING_DIM = 256
+# Random-projection LSH: 8 tables of 8-bit signatures keeps recall high at cosine 0.92
+CHAT_CACHE_LSH_TABLES = 8
+CHAT_CACHE_LSH_BITS = 8
+# Most similar candidates checked for source overlap per lookup
+CHAT_CACHE_TOP_K = 8
+
+# Preloaded into the answer cache at startup
+COMMON_CHAT_QUERIES = [
+    'What file formats are supported?',
+    'How does hybrid search work?',
+    'What chunking strategies are available?',
+    'How do I upload a document?'
+]
+
+_TOKEN_RE = re.compile(r"\w+")
+
+def embed_query(text):
+    """Signed hashed bag-of-words vector; the demo has no embedding model"""
+    vector = np.zeros(CHAT_EMBEDDING_DIM, dtype=np.float32)
+    for token in _TOKEN_RE.findall(text.lower()):
+        h = int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'little')
+        vector[h % CHAT_EMBEDDING_DIM] += 1.0 if h >> 63 else -1.0
+    return vector
+
+if _NUMBA_AVAILABLE:
+    @njit(cache=True, parallel=True)
+    def _cosine_scores(embeds, norms, q, q_norm):
+        scores = np.empty(embeds.shape[0], dtype=np.float32)
+        for i in prange(embeds.shape[0]):
+            dot = 0.0
+            for j in range(embeds.shape[1]):
+                dot += embeds[i, j] * q[j]
+            scores[i] = dot / (norms[i] * q_norm)
+        return scores
+else:
+    def _cosine_scores(embeds, norms, q, q_norm):
+        return (embeds @ q) / (norms * q_norm)
+
+def _cosine_topk(embeds, norms, q, q_norm, k):
+    """(indices, scores) of the k rows most similar to q, best first"""
+    scores = _cosine_scores(embeds, norms, q, q_norm)
+    top = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+    top = top[np.argsort(-scores[top])]
+    return top, scores[top]
+
+def _warm_cosine_jit(dim=CHAT_EMBEDDING_DIM):
+    """Compile _cosine_scores now rather than on the first chat request"""
+    if _NUMBA_AVAILABLE:
+        _cosine_topk(np.ones((1, dim), dtype=np.float32), np.ones(1, dtype=np.float32),
+                     np.ones(dim, dtype=np.float32), 1.0, 1)
+
+def _jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+class SemanticAnswerCache:
+    """LRU cache of chat responses, matched by cosine similarity of query embeddings
+
+    Candidates come from random-projection LSH buckets rather than a scan of every
+    entry. A hit also requires the cached answer to have been grounded in mostly the
+    same documents as the current retrieval, so answers go stale when the sources change.
+    """
+
+    def __init__(self, dim=CHAT_EMBEDDING_DIM, threshold=CHAT_CACHE_THRESHOLD,
+                 min_source_overlap=CHAT_CACHE_MIN_SOURCE_OVERLAP, max_entries=CHAT_CACHE_MAX_ENTRIES,
+                 num_tables=CHAT_CACHE_LSH_TABLES, num_bits=CHAT_CACHE_LSH_BITS, seed=0):
+        self.threshold = threshold
+        self.min_source_overlap = min_source_overlap
+        self.max_entries = max_entries
+        self.num_tables = num_tables
+        # All tables' hyperplanes in one matrix so hashing is a single matmul
+        self._projections = np.random.default_rng(seed).standard_normal(
+            (num_tables * num_bits, dim)).astype(np.float32)
+        self._buckets = [{} for _ in range(num_tables)]
+        # Fixed slots; _entries maps slot -> (doc_ids, response, bucket keys) in LRU order
+        self._embeddings = np.zeros((max_entries, dim), dtype=np.float32)
+        self._norms = np.zeros(max_entries, dtype=np.float32)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _hash(self, embedding):
+        bits = (self._projections @ embedding > 0).reshape(self.num_tables, -1)
+        return [row.tobytes() for row in np.packbits(bits, axis=1)]
+
+    def lookup(self, embedding, doc_ids):
+        """Return the cached response for a similar query over similar documents, or None"""
+        query_norm = float(np.linalg.norm(embedding))
+        if query_norm == 0.0:
+            return None
+        keys = self._hash(embedding)
+        with self._lock:
+            candidates = set()
+            for table, key in zip(self._buckets, keys):
+                candidates.update(table.get(key, ()))
+            if not candidates:
+                return None
+            slots = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            top, scores = _cosine_topk(self._embeddings[slots], self._norms[slots],
+                                       embedding, query_norm, CHAT_CACHE_TOP_K)
+            for i, score in zip(top, scores):
+                if score < self.threshold:
+                    break
+                slot = int(slots[i])
+                cached_doc_ids, response, _ = self._entries[slot]
+                if _jaccard(cached_doc_ids, doc_ids) >= self.min_source_overlap:
+                    self._entries.move_to_end(slot)
+                    return response
+        return None
+
+    def store(self, embedding, doc_ids, response):
+        """Cache response, evicting the least recently used entry when full"""
+        norm = float(np.linalg.norm(embedding))
+        if norm == 0.0:
+            return
+        keys = self._hash(embedding)
+        with self._lock:
+            if len(self._entries) < self.max_entries:
+                slot = len(self._entries)
+            else:
+                slot, (_, _, old_keys) = self._entries.popitem(last=False)
+                for table, key in zip(self._buckets, old_keys):
+                    bucket = table[key]
+                    bucket.remove(slot)
+                    if not bucket:
+                        del table[key]
+            self._embeddings[slot] = embedding
+            self._norms[slot] = norm
+            self._entries[slot] = (frozenset(doc_ids), response, keys)
+            for table, key in zip(self._buckets, keys):
+                table.setdefault(key, []).append(slot)
+
+_answer_cache = SemanticAnswerCache() if np is not None else None
+
+def retrieve_sources(user_message):
+    """Documents the demo pipeline grounds an answer in"""
+    return [
+        {'document': 'sample.pdf', 'relevance': 0.95, 'chunk': 'Introduction section'},
+        {'document': 'data.txt', 'relevance': 0.78, 'chunk': 'Technical details'}
+    ]
+
+def generate_chat_response(user_message, sources, timestamp):
+    """Simulate Phase 4 enhanced processing"""
+    return {
+        'response': f"Enhanced RAG Response: Based on your query '{user_message}', I've analyzed the uploaded documents using our Phase 4 hybrid search system. Here's what I found...",
+        'processing': {
+            'search_method': 'hybrid',
+            'semantic_similarity': 0.85,
+            'keyword_matches': 3,
+            'chunks_analyzed': 12,
+            'documents_consulted': 2,
+            'confidence_score': 0.92
+        },
+        'sources': sources,
+        'features_used': [
+            'Intelligent chunking',
+            'Semantic search',
+            'Context ranking',
+            'Multi-document synthesis'
+        ],
+        'timestamp': timestamp
+    }
+
+def build_search_response(query, search_type, upload_folder):
+    """Search the uploads' precomputed chunks, or simulate Phase 4 results if there are none"""
+    matches = search_chunks(upload_folder, query) if np is not None else []
+    if matches:
+        results = [
+            {'document': filename, 'chunk': chunk, 'score': round(score, 4), 'page': None, 'strategy': 'semantic'}
+            for score, filename, chunk in matches
+        ]
+    else:
+        results = _simulated_search_results(query)
+    
+    return {
+        'query': query,
+        'search_type': search_type,
+        'results': results,
+        'total_results': len(results),
+        'processing_time': '0.23s',
+        'features_used': {
+            'hybrid_search': True,
+            'semantic_ranking': True,
+            'intelligent_chunking': True,
+            'context_preservation': True
+        }
+    }
+
+def _simulated_search_results(query):
+    return [
+        {
+            'document': 'document1.pdf',
+            'chunk': f"This is a relevant chunk for '{query}' from document 1...",
+            'score': 0.95,
+            'page': 1,
+            'strategy': 'semantic'
+        },
+        {
+            'document': 'document2.txt',
+            'chunk': f"Another relevant section about '{query}' with additional context...",
+            'score': 0.87,
+            'page': None,
+            'strategy': 'keyword'
+        },
+        {
+            'document': 'document3.docx',
+            'chunk': f"Comprehensive information regarding '{query}' and related topics...",
+            'score': 0.76,
+            'page': 3,
+            'strategy': 'hybrid'
+        }
+    ]
+
+def warm_cache(common_queries):
+    """Answer common_queries ahead of time so their paraphrases hit the cache"""
+    if _answer_cache is None:
+        return
+    timestamp = datetime.now().isoformat()
+    for query in common_queries:
+        sources = retrieve_sources(query)
+        _answer_cache.store(embed_query(query), {source['document'] for source in sources},
+                            generate_chat_response(query, sources, timestamp))
+
+# /api/search result cache; L1 entries expire sooner since other workers can't clear them
+SEARCH_CACHE_TTL = int(os.getenv('SEARCH_CACHE_TTL', '300'))
+SEARCH_CACHE_L1_TTL = 30
+SEARCH_CACHE_L1_MAX_ENTRIES = 1024
+SEARCH_CACHE_PREFIX = 'search:'
+
+class SearchResultCache:
+    """Serialized /api/search responses in a per-process LRU (L1) over a shared Redis (L2)
+
+    L2 is only used when the redis client is installed and a URL is configured;
+    Redis errors degrade to L1-only rather than failing the request.
+    """
+
+    def __init__(self, redis_url=None, ttl=SEARCH_CACHE_TTL, l1_ttl=SEARCH_CACHE_L1_TTL,
+                 l1_max_entries=SEARCH_CACHE_L1_MAX_ENTRIES):
+        self.ttl = ttl
+        self.l1_ttl = l1_ttl
+        self.l1_max_entries = l1_max_entries
+        self._l1 = OrderedDict()
+        self._lock = threading.Lock()
+        self._l2 = redis.Redis.from_url(redis_url) if redis is not None and redis_url else None
+
+    @staticmethod
+    def key(query, search_type):
+        return SEARCH_CACHE_PREFIX + hashlib.sha1(f"{query}|{search_type}".encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """(body, 'HIT-L1' | 'HIT-L2') for a cached response, or (None, 'MISS')"""
+        with self._lock:
+            entry = self._l1.get(key)
+            if entry is not None:
+                if entry[0] >= time.monotonic():
+                    self._l1.move_to_end(key)
+                    return entry[1], 'HIT-L1'
+                del self._l1[key]
+        if self._l2 is not None:
+            try:
+                body = self._l2.get(key)
+            except redis.RedisError as e:
+                logger.warning(f"Search cache L2 read failed: {e}")
+                body = None
+            if body is not None:
+                self._put_l1(key, body)
+                return body, 'HIT-L2'
+        return None, 'MISS'
+
+    def set(self, key, body):
+        self._put_l1(key, body)
+        if self._l2 is not None:
+            try:
+                self._l2.setex(key, self.ttl, body)
+            except redis.RedisError as e:
+                logger.warning(f"Search cache L2 write failed: {e}")
+
+    def _put_l1(self, key, body):
+        with self._lock:
+            self._l1[key] = (time.monotonic() + self.l1_ttl, body)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.l1_max_entries:
+                self._l1.popitem(last=False)
+
+    def invalidate(self):
+        """Drop every cached search (the document set changed)"""
+        with self._lock:
+            self._l1.clear()
+        if self._l2 is not None:
+            try:
+                batch = []
+                for key in self._l2.scan_iter(match=SEARCH_CACHE_PREFIX + '*', count=500):
+                    batch.append(key)
+                    if len(batch) >= 500:
+                        self._l2.delete(*batch)
+                        batch = []
+                if batch:
+                    self._l2.delete(*batch)
+            except redis.RedisError as e:
+                logger.warning(f"Search cache L2 invalidation failed: {e}")
+
+_search_cache = SearchResultCache(os.getenv('SEARCH_CACHE_REDIS_URL'))
+
+# Per-document chunk embeddings, computed once after upload and memory-mapped for search
+CHUNK_CACHE_DIRNAME = '.chunks'
+CHUNK_CACHE_MAX_DOCS = 32
+CHUNK_MAX_CHARS = 800
+_PLAIN_TEXT_SUFFIXES = frozenset({'.txt', '.md', '.csv', '.json', '.xml', '.html'})
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+
+# filename -> (embeddings, texts), or None when the upload has no cache; LRU order
+_chunk_cache = OrderedDict()
+_chunk_cache_lock = threading.Lock()
+
+def _chunk_cache_paths(upload_folder, filename):
+    base = os.path.join(upload_folder, CHUNK_CACHE_DIRNAME, filename)
+    return base + '.npy', base + '.json'
+
+def _read_document_text(filepath):
+    suffix = os.path.splitext(filepath)[1].lower()
+    if suffix in _PLAIN_TEXT_SUFFIXES:
+        with open(filepath, 'r', encoding='utf-8', errors='replace') as f:
+            return f.read()
+    if suffix in ('.pdf', '.docx'):
+        from document_processor import DocumentProcessor
+        return DocumentProcessor(os.path.dirname(filepath)).extract_text(filepath)
+    return None
+
+def _chunk_text(text, max_chars=CHUNK_MAX_CHARS):
+    """Pack paragraphs into chunks of at most max_chars, splitting longer paragraphs"""
+    chunks = []
+    current = ''
+    for paragraph in _PARAGRAPH_RE.split(text):
+        paragraph = paragraph.strip()
+        for start in range(0, len(paragraph), max_chars):
+            piece = paragraph[start:start + max_chars]
+            if current and len(current) + len(piece) + 2 > max_chars:
+                chunks.append(current)
+                current = piece
+            else:
+                current = f"{current}\n\n{piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+def precompute_chunk_embeddings(filepath):
+    """Chunk and embed an upload once, into <uploads>/.chunks/<name>.npy and .json"""
+    try:
+        text = _read_document_text(filepath)
+        chunks = _chunk_text(text) if text else []
+        if not chunks:
+            return
+        embeddings = np.stack([embed_query(chunk) for chunk in chunks])
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        embeddings /= np.where(norms == 0, 1, norms)
+        
+        upload_folder, filename = os.path.split(filepath)
+        embeds_path, texts_path = _chunk_cache_paths(upload_folder, filename)
+        os.makedirs(os.path.dirname(embeds_path), exist_ok=True)
+        # Texts first: a complete .npy is what marks the cache as usable
+        tmp_suffix = f".{threading.get_ident()}.tmp"
+        with open(texts_path + tmp_suffix, 'w', encoding='utf-8') as f:
+            json.dump(chunks, f)
+        os.replace(texts_path + tmp_suffix, texts_path)
+        with open(embeds_path + tmp_suffix, 'wb') as f:
+            np.save(f, embeddings)
+        os.replace(embeds_path + tmp_suffix, embeds_path)
+        
+        with _chunk_cache_lock:
+            _chunk_cache.pop(filename, None)
+        _search_cache.invalidate()
+    except Exception as e:
+        logger.warning(f"Could not precompute chunk embeddings for {filepath}: {e}")
+
+def _load_chunk_cache(upload_folder, filename):
+    with _chunk_cache_lock:
+        if filename in _chunk_cache:
+            _chunk_cache.move_to_end(filename)
+            return _chunk_cache[filename]
+    
+    embeds_path, texts_path = _chunk_cache_paths(upload_folder, filename)
+    try:
+        embeddings = np.load(embeds_path, mmap_mode='r')
+        with open(texts_path, 'r', encoding='utf-8') as f:
+            entry = (embeddings, json.load(f))
+    except (OSError, ValueError):
+        entry = None
+    
+    with _chunk_cache_lock:
+        _chunk_cache[filename] = entry
+        while len(_chunk_cache) > CHUNK_CACHE_MAX_DOCS:
+            _chunk_cache.popitem(last=False)
+    return entry
+
+def search_chunks(upload_folder, query, top_k=3):
+    """(score, filename, chunk) for the best precomputed chunks across all uploads"""
+    query_embedding = embed_query(str(query))
+    query_norm = float(np.linalg.norm(query_embedding))
+    if query_norm == 0.0:
+        return []
+    query_embedding /= query_norm
+    
+    _load_doc_index(upload_folder)
+    with _doc_index_lock:
+        filenames = list(_DOC_INDEX)
+    
+    matches = []
+    for filename in filenames:
+        entry = _load_chunk_cache(upload_folder, filename)
+        if entry is None:
+            continue
+        embeddings, texts = entry
+        scores = embeddings @ query_embedding
+        for i in np.argsort(scores)[::-1][:top_k]:
+            if scores[i] > 0:
+                matches.append((float(scores[i]), filename, texts[i]))
+    matches.sort(key=lambda match: match[0], reverse=True)
+    return matches[:top_k]
+
+# Uploads are deduplicated by content: sha256 -> first filename stored with it
+DEDUP_INDEX_FILENAME = '.dedup.sqlite3'
+_dedup_lock = threading.Lock()
+
+def _dedup_connect(upload_folder):
+    conn = sqlite3.connect(os.path.join(upload_folder, DEDUP_INDEX_FILENAME))
+    conn.execute('CREATE TABLE IF NOT EXISTS uploads (digest TEXT PRIMARY KEY, filename TEXT NOT NULL)')
+    return conn
+
+def _link_into_place(source, destination):
+    """Atomically make destination a hard link to source; False if the filesystem can't link"""
+    link_path = f"{destination}.{threading.get_ident()}.link"
+    try:
+        os.link(source, link_path)
+    except OSError:
+        return False
+    os.replace(link_path, destination)
+    return True
+
+def save_upload(file, upload_folder, filename):
+    """Stream an upload to disk, hard-linking it to an identical earlier upload
+    
+    Returns (filepath, duplicate_of) where duplicate_of is the stored filename with
+    the same content, or None. The file is written to a temp name and renamed into
+    place, so replacing a name never modifies the inode other links share.
+    """
+    filepath = os.path.join(upload_folder, filename)
+    fd, tmp_path = tempfile.mkstemp(dir=upload_folder, prefix='.upload-')
+    try:
+        sha256 = hashlib.sha256()
+        with os.fdopen(fd, 'wb') as dst:
+            while True:
+                chunk = file.stream.read(UPLOAD_BUFFER_SIZE)
+                if not chunk:
+                    break
+                sha256.update(chunk)
+                dst.write(chunk)
+        os.chmod(tmp_path, 0o644)  # mkstemp creates files as 0600
+        digest = sha256.hexdigest()
+        
+        with _dedup_lock, closing(_dedup_connect(upload_folder)) as conn, conn:
+            row = conn.execute('SELECT filename FROM uploads WHERE digest = ?', (digest,)).fetchone()
+            existing = row[0] if row and os.path.isfile(os.path.join(upload_folder, row[0])) else None
+            
+            if existing == filename:
+                os.unlink(tmp_path)
+            elif existing and _link_into_place(os.path.join(upload_folder, existing), filepath):
+                os.unlink(tmp_path)
+            else:
+                os.replace(tmp_path, filepath)
+            
+            # Whatever this name held before is gone; the digest keeps its first owner
+            conn.execute('DELETE FROM uploads WHERE filename = ? AND digest != ?', (filename, digest))
+            conn.execute('INSERT OR REPLACE INTO uploads (digest, filename) VALUES (?, ?)',
+                         (digest, existing or filename))
+        return filepath, existing
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+def _reuse_chunk_cache(upload_folder, source, filename):
+    """Give filename the chunk cache already computed for identical content in source"""
+    source_paths = _chunk_cache_paths(upload_folder, source)
+    if not all(os.path.isfile(path) for path in source_paths):
+        return False
+    if source != filename:
+        for source_path, path in zip(source_paths, _chunk_cache_paths(upload_folder, filename)):
+            if not _link_into_place(source_path, path):
+                shutil.copyfile(source_path, path)
+    with _chunk_cache_lock:
+        _chunk_cache.pop(filename, None)
+    return True
+
+# Demo chunking: extension -> (strategy, bytes per chunk, minimum chunks)
+CHUNKING_STRATEGIES = ('semantic', 'fixed', 'sentence', 'paragraph')
+CHUNKING_BY_EXTENSION = {
+    'pdf': ('semantic', 1000, 3), 'docx': ('semantic', 1000, 3), 'doc': ('semantic', 1000, 3),
+    'txt': ('sentence', 500, 2), 'md': ('sentence', 500, 2),
+    'csv': ('fixed', 2000, 1), 'json': ('fixed', 2000, 1), 'xml': ('fixed', 2000, 1)
+}
+DEFAULT_CHUNKING = ('paragraph', 800, 2)
+
+# Upload folder inventory, loaded on first listing and updated on upload; the
+# folder's mtime also moves when another worker process adds a file, which
+# triggers a rescan
+_DOC_INDEX = {}
+_doc_index_lock = threading.RLock()
+_doc_index_loaded = False
+_doc_index_dir_mtime = None
+_doc_index_version = 0
+_doc_index_modified = datetime.utcnow()
+# Distinguishes ETags across restarts, when the version counter starts over
+_DOC_INDEX_EPOCH = format(time.time_ns(), 'x')
+
+def _document_entry(filename, stat_info):
+    return {
+        'filename': filename,
+        'size': stat_info.st_size,
+        'size_formatted': f"{stat_info.st_size / 1024:.1f} KB",
+        'uploaded_at': datetime.fromtimestamp(stat_info.st_mtime).isoformat(),
+        'type': filename.split('.')[-1].lower() if '.' in filename else 'unknown',
+        'processed': True
+    }
+
+def _bump_doc_index():
+    global _doc_index_version, _doc_index_modified
+    _doc_index_version += 1
+    _doc_index_modified = datetime.utcnow()
+
+def _load_doc_index(upload_folder):
+    """Scan the upload folder unless it is unchanged (by mtime) since the last scan"""
+    global _doc_index_loaded, _doc_index_dir_mtime
+    try:
+        dir_mtime = os.stat(upload_folder).st_mtime_ns
+    except FileNotFoundError:
+        dir_mtime = None
+    with _doc_index_lock:
+        if _doc_index_loaded and dir_mtime == _doc_index_dir_mtime:
+            return
+        scanned = {}
+        if dir_mtime is not None:
+            with os.scandir(upload_folder) as entries:
+                for entry in entries:
+                    # Dotfiles are the demo's own bookkeeping, never uploads
+                    if entry.is_file() and not entry.name.startswith('.'):
+                        scanned[entry.name] = _document_entry(entry.name, entry.stat())
+        _doc_index_dir_mtime = dir_mtime
+        if not _doc_index_loaded or scanned != _DOC_INDEX:
+            _DOC_INDEX.clear()
+            _DOC_INDEX.update(scanned)
+            _bump_doc_index()
+        _doc_index_loaded = True
+
+def _index_document(filepath):
+    """Record a newly saved upload; before the first listing there is nothing to update"""
+    with _doc_index_lock:
+        if _doc_index_loaded:
+            filename = os.path.basename(filepath)
+            _DOC_INDEX[filename] = _document_entry(filename, os.stat(filepath))
+            _bump_doc_index()
+
 def create_demo_app():
     """Create a demo Flask application to show Phase 4 operations"""
     app = Flask(__name__)
@@ -24,23 +627,109 @@ def create_demo_app():
     app.config['SECRET_KEY'] = 'demo-secret-key'
     app.config['UPLOAD_FOLDER'] = os.path.join(current_dir, 'uploads')
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+    # Behind Apache/lighttpd, let the front server stream downloads with X-Sendfile
+    app.config['USE_X_SENDFILE'] = os.getenv('USE_X_SENDFILE', '').lower() in ('1', 'true', 'yes')
+    
+    # Serialize responses with orjson when available
+    from json_provider import install_json_provider
+    install_json_provider(app)
+    
+    # Brotli/gzip for JSON bodies worth compressing; adds Vary: Accept-Encoding
+    if Compress is not None:
+        app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+        app.config['COMPRESS_MIN_SIZE'] = 512
+        app.config['COMPRESS_BR_LEVEL'] = 4
+        app.config['COMPRESS_LEVEL'] = 4
+        Compress(app)
     
     # Ensure upload directory exists
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     
+    _warm_cosine_jit()
+    warm_cache(COMMON_CHAT_QUERIES)
+    
     # Allowed file extensions for Phase 4
-    ALLOWED_EXTENSIONS = {
+    ALLOWED_EXTENSIONS = frozenset({
         'txt', 'pdf', 'doc', 'docx', 'ppt', 'pptx', 'xls', 'xlsx',
         'rtf', 'odt', 'html', 'md', 'csv', 'json', 'xml'
-    }
+    })
+    ALLOWED_SUFFIXES = frozenset('.' + ext for ext in ALLOWED_EXTENSIONS)
     
     def allowed_file(filename):
-        return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+        return os.path.splitext(filename)[1].lower() in ALLOWED_SUFFIXES
+    
+    def json_etag(payload):
+        return hashlib.blake2b(app.json.dumps(payload).encode('utf-8'), digest_size=8).hexdigest()
+    
+    def static_json(view):
+        """Serve a view whose JSON can't change while the app runs, with an ETag
+        
+        The view runs and is serialized on the first request; after that the same
+        bytes are sent, or an empty 304 when If-None-Match already has them.
+        """
+        cached = {}
+        
+        @wraps(view)
+        def wrapper():
+            if 'body' not in cached:
+                body = app.json.dumps(view()).encode('utf-8')
+                cached['etag'] = hashlib.blake2b(body, digest_size=8).hexdigest()
+                cached['body'] = body
+            if request.if_none_match.contains_weak(cached['etag']):
+                response = Response(status=304)
+            else:
+                response = Response(cached['body'], mimetype=app.json.mimetype)
+            # Weak, since the bytes on the wire differ once the body is compressed
+            response.set_etag(cached['etag'], weak=True)
+            response.headers['Cache-Control'] = 'public, max-age=60'
+            return response
+        return wrapper
+    
+    SYSTEM_STATUS = {
+        'status': 'operational',
+        'phase': 'Phase 4 - Advanced RAG System',
+        'features': {
+            'document_processing': {
+                'enabled': True,
+                'formats_supported': 14,
+                'formats': sorted(ALLOWED_EXTENSIONS)
+            },
+            'hybrid_search': {
+                'enabled': True,
+                'semantic_search': True,
+                'keyword_search': True
+            },
+            'intelligent_chunking': {
+                'enabled': True,
+                'strategies': ['semantic', 'fixed', 'sentence', 'paragraph'],
+                'auto_selection': True
+            },
+            'enhanced_rag': {
+                'enabled': True,
+                'context_ranking': True,
+                'multi_document': True
+            }
+        },
+        'performance': {
+            'search_accuracy_improvement': '+60%',
+            'chunk_quality_improvement': '+40%',
+            'response_relevance_improvement': '+50%',
+            'processing_speed_improvement': '+30%'
+        }
+    }
+    # Weak: full responses also carry the request timestamp
+    SYSTEM_STATUS_ETAG = json_etag(SYSTEM_STATUS)
+    
+    @app.before_request
+    def stamp_request():
+        # One timestamp per request, shared by everything the handler reports
+        g.now_iso = datetime.now().isoformat()
     
     @app.route('/')
+    @static_json
     def home():
         """Home page"""
-        return jsonify({
+        return {
             'message': 'Advanced RAG System - Phase 4 Demo',
             'version': '4.0.0',
             'features': [
@@ -55,17 +744,18 @@ def create_demo_app():
                 'status': '/api/system/status',
                 'upload': '/api/documents/upload',
                 'documents': '/api/documents',
+                'download': '/api/documents/<filename>/download',
                 'chat': '/api/chat',
                 'search': '/api/search'
             }
-        })
+        }
     
     @app.route('/api/health')
     def health_check():
         """Health check endpoint"""
         return jsonify({
             'status': 'healthy',
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': g.now_iso,
             'version': '4.0.0',
             'uptime': 'running'
         })
@@ -73,69 +763,46 @@ def create_demo_app():
     @app.route('/api/system/status')
     def system_status():
         """System status with Phase 4 features"""
-        return jsonify({
-            'status': 'operational',
-            'phase': 'Phase 4 - Advanced RAG System',
-            'features': {
-                'document_processing': {
-                    'enabled': True,
-                    'formats_supported': 14,
-                    'formats': list(ALLOWED_EXTENSIONS)
-                },
-                'hybrid_search': {
-                    'enabled': True,
-                    'semantic_search': True,
-                    'keyword_search': True
-                },
-                'intelligent_chunking': {
-                    'enabled': True,
-                    'strategies': ['semantic', 'fixed', 'sentence', 'paragraph'],
-                    'auto_selection': True
-                },
-                'enhanced_rag': {
-                    'enabled': True,
-                    'context_ranking': True,
-                    'multi_document': True
-                }
-            },
-            'performance': {
-                'search_accuracy_improvement': '+60%',
-                'chunk_quality_improvement': '+40%',
-                'response_relevance_improvement': '+50%',
-                'processing_speed_improvement': '+30%'
-            },
-            'timestamp': datetime.now().isoformat()
-        })
+        if request.if_none_match.contains_weak(SYSTEM_STATUS_ETAG):
+            response = Response(status=304)
+        else:
+            response = jsonify({**SYSTEM_STATUS, 'timestamp': g.now_iso})
+        response.set_etag(SYSTEM_STATUS_ETAG, weak=True)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     
     @app.route('/api/documents', methods=['GET'])
     def list_documents():
         """List uploaded documents"""
         try:
-            documents = []
-            upload_folder = app.config['UPLOAD_FOLDER']
+            _load_doc_index(app.config['UPLOAD_FOLDER'])
+            with _doc_index_lock:
+                entries = list(_DOC_INDEX.values())
+                etag = f"docs-{_DOC_INDEX_EPOCH}-{_doc_index_version}"
+                last_modified = _doc_index_modified
             
-            if os.path.exists(upload_folder):
-                for filename in os.listdir(upload_folder):
-                    filepath = os.path.join(upload_folder, filename)
-                    if os.path.isfile(filepath):
-                        stat_info = os.stat(filepath)
-                        documents.append({
-                            'id': len(documents) + 1,
-                            'filename': filename,
-                            'size': stat_info.st_size,
-                            'size_formatted': f"{stat_info.st_size / 1024:.1f} KB",
-                            'uploaded_at': datetime.fromtimestamp(stat_info.st_mtime).isoformat(),
-                            'type': filename.split('.')[-1].lower() if '.' in filename else 'unknown',
-                            'processed': True,
-                            'chunks_created': 5 + (len(documents) * 3),  # Demo data
-                            'processing_strategy': ['semantic', 'fixed', 'sentence', 'paragraph'][len(documents) % 4]
-                        })
+            if request.if_none_match.contains_weak(etag):
+                response = Response(status=304)
+                response.set_etag(etag, weak=True)
+                return response
             
-            return jsonify({
+            documents = []
+            for entry in entries:
+                documents.append({
+                    'id': len(documents) + 1,
+                    **entry,
+                    'chunks_created': 5 + (len(documents) * 3),  # Demo data
+                    'processing_strategy': CHUNKING_STRATEGIES[len(documents) % len(CHUNKING_STRATEGIES)]
+                })
+            
+            response = jsonify({
                 'documents': documents,
                 'total': len(documents),
                 'supported_formats': list(ALLOWED_EXTENSIONS)
             })
+            response.set_etag(etag, weak=True)
+            response.last_modified = last_modified
+            return response
             
         except Exception as e:
             return jsonify({'error': str(e)}), 500
@@ -158,26 +825,22 @@ def create_demo_app():
             
             # Save file
             filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
+            filepath, duplicate_of = save_upload(file, app.config['UPLOAD_FOLDER'], filename)
+            _index_document(filepath)
+            _search_cache.invalidate()
+            reused_chunks = duplicate_of is not None and _reuse_chunk_cache(
+                app.config['UPLOAD_FOLDER'], duplicate_of, filename)
+            if np is not None and not reused_chunks:
+                threading.Thread(target=precompute_chunk_embeddings, args=(filepath,),
+                                 name='chunk-embeddings', daemon=True).start()
             
             # Simulate Phase 4 processing
             file_size = os.path.getsize(filepath)
             file_ext = filename.split('.')[-1].lower()
             
             # Determine chunking strategy based on file type (demo logic)
-            if file_ext in ['pdf', 'docx', 'doc']:
-                strategy = 'semantic'
-                chunks = max(3, file_size // 1000)
-            elif file_ext in ['txt', 'md']:
-                strategy = 'sentence'
-                chunks = max(2, file_size // 500)
-            elif file_ext in ['csv', 'json', 'xml']:
-                strategy = 'fixed'
-                chunks = max(1, file_size // 2000)
-            else:
-                strategy = 'paragraph'
-                chunks = max(2, file_size // 800)
+            strategy, bytes_per_chunk, min_chunks = CHUNKING_BY_EXTENSION.get(file_ext, DEFAULT_CHUNKING)
+            chunks = max(min_chunks, file_size // bytes_per_chunk)
             
             return jsonify({
                 'message': 'Document uploaded and processed successfully',
@@ -190,14 +853,28 @@ def create_demo_app():
                     'chunks_created': min(chunks, 50),  # Cap for demo
                     'enhanced_features': True,
                     'metadata_extracted': True,
-                    'searchable': True
+                    'searchable': True,
+                    'duplicate_of': duplicate_of
                 },
-                'timestamp': datetime.now().isoformat()
+                'timestamp': g.now_iso
             })
             
         except Exception as e:
             return jsonify({'error': str(e)}), 500
     
+    @app.route('/api/documents/<filename>/download')
+    def download_document(filename):
+        """Download an uploaded document
+        
+        send_from_directory hands the open file to the WSGI server's file_wrapper,
+        which gunicorn serves with sendfile(2); with USE_X_SENDFILE the front
+        server reads the file itself and Python never touches the bytes.
+        """
+        if filename.startswith('.'):
+            return jsonify({'error': 'Document not found'}), 404
+        return send_from_directory(app.config['UPLOAD_FOLDER'], filename,
+                                   as_attachment=True, conditional=True)
+    
     @app.route('/api/chat', methods=['POST'])
     def chat():
         """Enhanced chat endpoint with Phase 4 features"""
@@ -207,30 +884,20 @@ def create_demo_app():
                 return jsonify({'error': 'No message provided'}), 400
             
             user_message = data['message']
+            sources = retrieve_sources(user_message)
+            doc_ids = {source['document'] for source in sources}
+
+            if _answer_cache is not None:
+                query_embedding = embed_query(user_message)
+                cached = _answer_cache.lookup(query_embedding, doc_ids)
+                if cached is not None:
+                    return jsonify({**cached, 'cache_hit': True})
             
-            # Simulate Phase 4 enhanced processing
-            response_data = {
-                'response': f"Enhanced RAG Response: Based on your query '{user_message}', I've analyzed the uploaded documents using our Phase 4 hybrid search system. Here's what I found...",
-                'processing': {
-                    'search_method': 'hybrid',
-                    'semantic_similarity': 0.85,
-                    'keyword_matches': 3,
-                    'chunks_analyzed': 12,
-                    'documents_consulted': 2,
-                    'confidence_score': 0.92
-                },
-                'sources': [
-                    {'document': 'sample.pdf', 'relevance': 0.95, 'chunk': 'Introduction section'},
-                    {'document': 'data.txt', 'relevance': 0.78, 'chunk': 'Technical details'}
-                ],
-                'features_used': [
-                    'Intelligent chunking',
-                    'Semantic search',
-                    'Context ranking',
-                    'Multi-document synthesis'
-                ],
-                'timestamp': datetime.now().isoformat()
-            }
+            response_data = generate_chat_response(user_message, sources, g.now_iso)
+
+            if _answer_cache is not None:
+                _answer_cache.store(query_embedding, doc_ids, response_data)
+            response_data = {**response_data, 'cache_hit': False}
             
             return jsonify(response_data)
             
@@ -248,49 +915,20 @@ def create_demo_app():
             query = data['query']
             search_type = data.get('type', 'hybrid')  # hybrid, semantic, keyword
             
-            # Simulate Phase 4 search results
-            results = [
-                {
-                    'document': 'document1.pdf',
-                    'chunk': f"This is a relevant chunk for '{query}' from document 1...",
-                    'score': 0.95,
-                    'page': 1,
-                    'strategy': 'semantic'
-                },
-                {
-                    'document': 'document2.txt',
-                    'chunk': f"Another relevant section about '{query}' with additional context...",
-                    'score': 0.87,
-                    'page': None,
-                    'strategy': 'keyword'
-                },
-                {
-                    'document': 'document3.docx',
-                    'chunk': f"Comprehensive information regarding '{query}' and related topics...",
-                    'score': 0.76,
-                    'page': 3,
-                    'strategy': 'hybrid'
-                }
-            ]
-            
-            return jsonify({
-                'query': query,
-                'search_type': search_type,
-                'results': results,
-                'total_results': len(results),
-                'processing_time': '0.23s',
-                'features_used': {
-                    'hybrid_search': True,
-                    'semantic_ranking': True,
-                    'intelligent_chunking': True,
-                    'context_preservation': True
-                }
-            })
+            cache_key = _search_cache.key(query, search_type)
+            body, cache_status = _search_cache.get(cache_key)
+            if body is None:
+                body = app.json.dumps(build_search_response(query, search_type, app.config['UPLOAD_FOLDER']))
+                _search_cache.set(cache_key, body)
+            response = Response(body, mimetype=app.json.mimetype)
+            response.headers['X-Cache'] = cache_status
+            return response
             
         except Exception as e:
             return jsonify({'error': str(e)}), 500
     
     @app.route('/api/operations')
+    @static_json
     def show_operations():
         """Show all available operations"""
         operations = {
@@ -299,12 +937,17 @@ def create_demo_app():
                     'endpoint': '/api/documents/upload',
                     'method': 'POST',
                     'description': 'Upload and process documents with Phase 4 enhancements',
-                    'supports': list(ALLOWED_EXTENSIONS)
+                    'supports': sorted(ALLOWED_EXTENSIONS)
                 },
                 'list': {
                     'endpoint': '/api/documents',
                     'method': 'GET',
                     'description': 'List all uploaded and processed documents'
+                },
+                'download': {
+                    'endpoint': '/api/documents/<filename>/download',
+                    'method': 'GET',
+                    'description': 'Download an uploaded document'
                 }
             },
             'search_operations': {
@@ -340,14 +983,15 @@ def create_demo_app():
             }
         }
         
-        return jsonify(operations)
+        return operations
     
     # Error handlers
     @app.errorhandler(404)
     def not_found(error):
         return jsonify({'error': 'Endpoint not found', 'available_endpoints': [
             '/', '/api/health', '/api/system/status', '/api/documents',
-            '/api/documents/upload', '/api/chat', '/api/search', '/api/operations'
+            '/api/documents/upload', '/api/documents/<filename>/download',
+            '/api/chat', '/api/search', '/api/operations'
         ]}), 404
     
     @app.errorhandler(500)
@@ -375,10 +1019,14 @@ if __name__ == '__main__':
         print("   • GET  /api/system/status   - System status")
         print("   • GET  /api/documents       - List documents")
         print("   • POST /api/documents/upload - Upload document")
+        print("   • GET  /api/documents/<filename>/download - Download document")
         print("   • POST /api/chat            - Enhanced chat")
         print("   • POST /api/search          - Advanced search")
         print("   • GET  /api/operations      - Show all operations")
         print("=" * 50)
+        print("💡 Development server only; for production run:")
+        print("   gunicorn -c gunicorn.conf.py wsgi:application")
+        print("=" * 50)
         app.run(host='0.0.0.0', port=5000, debug=False)
     except Exception as e:
         print(f"❌ Failed to start demo application: {e}")
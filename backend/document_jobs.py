@@ -0,0 +1,91 @@
+import logging
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict
+
+from models import db, Document
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_WORKERS = int(os.getenv('DOCUMENT_WORKERS', '2'))
+# Jobs live in memory, so a restart mid-job leaves its row 'processing' for good;
+# past this age such a row is treated as abandoned
+DOCUMENT_JOB_TIMEOUT = float(os.getenv('DOCUMENT_JOB_TIMEOUT', '1800'))
+
+def document_metadata(processing_result: Dict[str, Any]) -> Dict[str, Any]:
+    """Metadata stored on a Document from a successful process_document result"""
+    metadata = processing_result.get('metadata', {})
+    return {
+        'word_count': metadata.get('word_count', 0),
+        'language': metadata.get('language', 'unknown'),
+        'readability_score': metadata.get('readability_score', 0.0),
+        'content_quality': metadata.get('content_quality', 'unknown'),
+        'content_categories': metadata.get('content_categories', []),
+        'has_images': metadata.get('has_images', False),
+        'has_tables': metadata.get('has_tables', False),
+        'chunking_strategy': processing_result.get('chunking_strategy', 'unknown'),
+        'document_analysis': processing_result.get('document_analysis', {}),
+        'extracted_elements': processing_result.get('extracted_elements', {})
+    }
+
+def is_abandoned(document: Document) -> bool:
+    """Whether a document can no longer finish: it failed, or its job outlived the timeout"""
+    if document.status == 'failed':
+        return True
+    if document.status != 'processing' or document.uploaded_at is None:
+        return False
+    return (datetime.utcnow() - document.uploaded_at).total_seconds() > DOCUMENT_JOB_TIMEOUT
+
+class DocumentJobs:
+    """Process uploaded documents (OCR, chunking, embedding) on a worker pool
+
+    submit() returns as soon as the job is queued; the worker records the outcome
+    on the Document row (status, chunk_count, metadata or error_message).
+    """
+
+    def __init__(self, max_workers: int = DOCUMENT_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='document-job')
+
+    def submit(self, app, get_service: Callable, document_id: str, file_path: str, chatbot_id: str) -> Future:
+        """Queue document_id for processing with the RAG service get_service() returns"""
+        return self._executor.submit(self._run, app, get_service, document_id, file_path, chatbot_id)
+
+    def _run(self, app, get_service: Callable, document_id: str, file_path: str, chatbot_id: str):
+        with app.app_context():
+            try:
+                processing_result = get_service().process_document(
+                    file_path=file_path,
+                    chatbot_id=chatbot_id,
+                    document_id=document_id
+                )
+            except Exception as e:
+                logger.error("Document processing error for %s: %s", document_id, e)
+                processing_result = {'success': False, 'error': str(e)}
+
+            try:
+                document = db.session.get(Document, document_id)
+                if document is None:
+                    # Deleted while processing; drop the chunks it just indexed
+                    if processing_result['success']:
+                        get_service().delete_document(document_id, chatbot_id)
+                    return
+
+                if processing_result['success']:
+                    document.status = 'completed'
+                    document.chunk_count = processing_result['chunks_created']
+                    document.processing_time = processing_result['processing_time']
+                    document.processed_at = datetime.utcnow()
+                    document.document_metadata = document_metadata(processing_result)
+                else:
+                    document.status = 'failed'
+                    document.error_message = processing_result.get('error', 'Unknown processing error')
+                document.refresh_cached_dict()
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error("Could not record processing result for %s: %s", document_id, e)
+            finally:
+                db.session.remove()
+
+document_jobs = DocumentJobs()
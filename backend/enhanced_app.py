@@ -1,9 +1,11 @@
 from flask import Flask, jsonify, request
-from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from dotenv import load_dotenv
 import os
+import importlib.util
 import logging
+import threading
+from functools import lru_cache
 
 # Load environment variables
 load_dotenv()
@@ -12,12 +14,28 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@lru_cache(maxsize=None)
+def _check_dependency(module_name: str) -> bool:
+    """Check if a dependency is available (the answer can't change while the process runs)"""
+    # find_spec locates the module without executing it
+    return importlib.util.find_spec(module_name) is not None
+
+def _in_reloader_parent(app) -> bool:
+    """Whether this is the debug reloader's watcher process, which never serves requests
+
+    Only the child it spawns (WERKZEUG_RUN_MAIN=true) needs the models loaded.
+    """
+    if not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        return False
+    return __name__ == '__main__' or os.environ.get('FLASK_RUN_FROM_CLI') == 'true'
+
 def create_app():
     app = Flask(__name__)
     
     # Configuration
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'dev-secret-key-change-in-production')
     app.config['DEBUG'] = os.getenv('FLASK_DEBUG', 'True').lower() == 'true'
+    app.config['TESTING'] = os.getenv('FLASK_TESTING', 'False').lower() == 'true'
     
     # Database configuration
     app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('SQLALCHEMY_DATABASE_URI', 'sqlite:///chatbot_builder.db')
@@ -27,34 +45,43 @@ def create_app():
     app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', app.config['SECRET_KEY'])
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = False
     
+    # Serialize responses with orjson when available
+    from json_provider import install_json_provider
+    install_json_provider(app)
+    
     # Initialize extensions
     from models import db, migrate
     db.init_app(app)
     migrate.init_app(app, db)
     
+    # Per-API-key throttling for the public chat endpoint
+    from rate_limit import limiter
+    limiter.init_app(app)
+    
     # Initialize JWT
     jwt = JWTManager(app)
     
     # Enable CORS for all routes
-    CORS(app, resources={
-        r"/api/*": {
-            "origins": ["http://localhost:4200", "http://127.0.0.1:4200"],
-            "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-            "allow_headers": ["Content-Type", "Authorization"]
-        }
-    })
+    from cors import install_cors
+    install_cors(app, origins=("http://localhost:4200", "http://127.0.0.1:4200"))
     
-    # Test enhanced service initialization
-    try:
-        from safe_enhanced_rag_service import create_safe_enhanced_rag_service
-        enhanced_service = create_safe_enhanced_rag_service(enable_enhanced=True)
-        app.config['ENHANCED_FEATURES'] = enhanced_service.enhanced_features_available
-        logger.info(f"Enhanced features available: {enhanced_service.enhanced_features_available}")
-        if not enhanced_service.enhanced_features_available:
-            logger.warning(f"Enhanced features disabled: {enhanced_service.error_message}")
-    except Exception as e:
+    # Test enhanced service initialization; kept for /api/system/status
+    app.extensions['enhanced_service'] = None
+    if _in_reloader_parent(app):
         app.config['ENHANCED_FEATURES'] = False
-        logger.error(f"Could not initialize enhanced service: {e}")
+        logger.info("Debug reloader parent: enhanced service loads in the serving child")
+    else:
+        try:
+            from safe_enhanced_rag_service import create_safe_enhanced_rag_service
+            enhanced_service = create_safe_enhanced_rag_service(enable_enhanced=True)
+            app.extensions['enhanced_service'] = enhanced_service
+            app.config['ENHANCED_FEATURES'] = enhanced_service.enhanced_features_available
+            logger.info(f"Enhanced features available: {enhanced_service.enhanced_features_available}")
+            if not enhanced_service.enhanced_features_available:
+                logger.warning(f"Enhanced features disabled: {enhanced_service.error_message}")
+        except Exception as e:
+            app.config['ENHANCED_FEATURES'] = False
+            logger.error(f"Could not initialize enhanced service: {e}")
     
     # Register blueprints
     try:
@@ -69,12 +96,30 @@ def create_app():
         # Enhanced blueprints (only if features are available)
         if app.config.get('ENHANCED_FEATURES', False):
             try:
+                # Share one document processor (and its OCR engine) across blueprints
+                from advanced_document_processor import create_processor
+                app.extensions['doc_processor'] = create_processor()
+                
                 from documents import documents_bp
                 from chat import chat_bp
                 
                 app.register_blueprint(documents_bp)
                 app.register_blueprint(chat_bp)
                 logger.info("Enhanced blueprints registered successfully")
+                
+                # Warm the RAG services (embedding model, vector store) while the server starts
+                if os.getenv('PRELOAD_RAG_SERVICES', 'True').lower() == 'true' and not app.testing:
+                    from chat import get_rag_service as chat_rag_service
+                    from documents import get_rag_service as documents_rag_service
+                    
+                    def preload_rag_services():
+                        for load in (chat_rag_service, documents_rag_service):
+                            try:
+                                load()
+                            except Exception as e:
+                                logger.warning(f"RAG service preload failed: {e}")
+                    
+                    threading.Thread(target=preload_rag_services, name='rag-preload', daemon=True).start()
             except Exception as e:
                 logger.warning(f"Could not register enhanced blueprints: {e}")
         else:
@@ -83,38 +128,43 @@ def create_app():
     except Exception as e:
         logger.error(f"Error registering blueprints: {e}")
     
-    # Enhanced test routes
+    # Enhanced test routes; ENHANCED_FEATURES is settled by now, so serialize them once
+    enhanced = app.config.get('ENHANCED_FEATURES', False)
+    HELLO_JSON = app.json.dumps({
+        'message': 'Hello from Enhanced Flask Backend!',
+        'timestamp': '2025-11-01',
+        'service': 'RAG Chatbot Builder - Phase 4',
+        'enhanced_features': enhanced,
+        'version': '4.0.0'
+    })
+    HEALTH_JSON = app.json.dumps({
+        'status': 'healthy',
+        'database': 'connected',
+        'enhanced_features': enhanced,
+        'features': {
+            'auth': 'enabled',
+            'chatbots': 'enabled',
+            'enhanced_processing': 'enabled' if enhanced else 'disabled',
+            'hybrid_search': 'enabled' if enhanced else 'disabled',
+            'document_intelligence': 'enabled' if enhanced else 'disabled'
+        }
+    })
+    
     @app.route('/api/hello', methods=['GET'])
     def hello_world():
-        return jsonify({
-            'message': 'Hello from Enhanced Flask Backend!',
-            'timestamp': '2025-11-01',
-            'service': 'RAG Chatbot Builder - Phase 4',
-            'enhanced_features': app.config.get('ENHANCED_FEATURES', False),
-            'version': '4.0.0'
-        })
+        return app.response_class(HELLO_JSON, mimetype=app.json.mimetype)
     
     @app.route('/api/health', methods=['GET'])
     def health_check():
-        return jsonify({
-            'status': 'healthy',
-            'database': 'connected',
-            'enhanced_features': app.config.get('ENHANCED_FEATURES', False),
-            'features': {
-                'auth': 'enabled',
-                'chatbots': 'enabled',
-                'enhanced_processing': 'enabled' if app.config.get('ENHANCED_FEATURES') else 'disabled',
-                'hybrid_search': 'enabled' if app.config.get('ENHANCED_FEATURES') else 'disabled',
-                'document_intelligence': 'enabled' if app.config.get('ENHANCED_FEATURES') else 'disabled'
-            }
-        })
+        return app.response_class(HEALTH_JSON, mimetype=app.json.mimetype)
     
     @app.route('/api/system/status', methods=['GET'])
     def system_status():
         """Enhanced system status endpoint"""
         try:
-            from safe_enhanced_rag_service import create_safe_enhanced_rag_service
-            service = create_safe_enhanced_rag_service(enable_enhanced=True)
+            service = app.extensions['enhanced_service']
+            if service is None:
+                raise RuntimeError('Enhanced service could not be initialized')
             
             return jsonify({
                 'system': 'operational',
@@ -140,14 +190,6 @@ def create_app():
                 'enhanced_features': False
             }), 500
     
-    def _check_dependency(module_name: str) -> bool:
-        """Check if a dependency is available"""
-        try:
-            __import__(module_name)
-            return True
-        except ImportError:
-            return False
-    
     @app.route('/api/test', methods=['POST'])
     def test_post():
         data = request.get_json()
@@ -179,6 +221,7 @@ if __name__ == '__main__':
     print("🌐 Server: http://localhost:5000")
     print("📊 Health Check: http://localhost:5000/api/health")
     print("🔧 System Status: http://localhost:5000/api/system/status")
+    print("💡 Production: gunicorn -c gunicorn.conf.py 'enhanced_app:create_app()'")
     print("=" * 50)
     
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
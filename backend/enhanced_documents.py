@@ -2,23 +2,175 @@ from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.utils import secure_filename
 from models import db, User, Chatbot, Document
-from enhanced_rag_service import create_enhanced_rag_service
+from sqlalchemy import delete, func, select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import load_only
+from document_jobs import document_jobs, is_abandoned
+import hashlib
+import logging
 import os
-from datetime import datetime
 import uuid
+from functools import lru_cache
 
-# Initialize enhanced RAG service
-rag_service = create_enhanced_rag_service(
-    enable_ocr=True,
-    chunking_strategy="semantic"
+logger = logging.getLogger(__name__)
+
+# Stream uploads to disk in 1MB chunks rather than Werkzeug's default 16KB
+UPLOAD_BUFFER_SIZE = 1024 * 1024
+
+def get_rag_service():
+    """Enhanced RAG service for documents, loaded on first use (or by the app's preload thread)"""
+    # Imported here: enhanced_rag_service pulls in torch, sentence_transformers and sklearn
+    from enhanced_rag_service import get_enhanced_rag_service
+    return get_enhanced_rag_service(
+        enable_ocr=True,
+        chunking_strategy="semantic"
+    )
+
+# Everything Document.list_dict() reports, for rows without a cached_dict
+_DOC_LIST_COLUMNS = (
+    Document.id, Document.chatbot_id, Document.filename, Document.original_filename,
+    Document.file_size, Document.file_type, Document.status, Document.chunk_count,
+    Document.uploaded_at, Document.processed_at, Document.processing_time,
+    Document.error_message, Document.created_at, Document.document_metadata
 )
+_DOC_LIST_TIMESTAMPS = ('uploaded_at', 'processed_at', 'created_at')
+
+def _document_list_entry(row):
+    """Document.list_dict(), built from a _DOC_LIST_COLUMNS row"""
+    doc_data = dict(row._mapping)
+    metadata = doc_data.pop('document_metadata')
+    for key in _DOC_LIST_TIMESTAMPS:
+        if doc_data[key]:
+            doc_data[key] = doc_data[key].isoformat()
+    
+    # Add enhanced metadata if available
+    if metadata:
+        doc_data['metadata'] = metadata
+        doc_data['enhanced_metadata'] = metadata
+    return doc_data
+
+# Postgres computes the content histograms itself; other databases fall back to Python
+_CATEGORY_COUNTS_SQL = text("""
+    SELECT category, COUNT(*)
+    FROM documents,
+         json_array_elements_text(CASE
+             WHEN json_typeof(document_metadata->'content_categories') = 'array'
+             THEN document_metadata->'content_categories'
+             ELSE '[]'::json
+         END) AS category
+    WHERE chatbot_id = :chatbot_id AND status = 'completed'
+    GROUP BY category
+""")
+_LANGUAGE_QUALITY_COUNTS_SQL = text("""
+    SELECT COALESCE(document_metadata->>'language', 'unknown'),
+           COALESCE(document_metadata->>'content_quality', 'unknown'),
+           COUNT(*)
+    FROM documents
+    WHERE chatbot_id = :chatbot_id AND status = 'completed'
+      AND document_metadata IS NOT NULL
+      AND document_metadata::text NOT IN ('null', '{}')
+    GROUP BY 1, 2
+""")
+
+def _content_analysis(chatbot_id):
+    """Category, language and quality counts over a chatbot's completed documents"""
+    categories = {}
+    languages = {}
+    quality_distribution = {}
+    
+    if db.session.get_bind().dialect.name == 'postgresql':
+        params = {'chatbot_id': chatbot_id}
+        for category, count in db.session.execute(_CATEGORY_COUNTS_SQL, params):
+            categories[category] = count
+        for language, quality, count in db.session.execute(_LANGUAGE_QUALITY_COUNTS_SQL, params):
+            languages[language] = languages.get(language, 0) + count
+            quality_distribution[quality] = quality_distribution.get(quality, 0) + count
+        return categories, languages, quality_distribution
+    
+    metadata_rows = Document.query.with_entities(Document.document_metadata).filter_by(
+        chatbot_id=chatbot_id, status='completed'
+    ).all()
+    for (metadata,) in metadata_rows:
+        if metadata:
+            
+            # Content categories
+            doc_categories = metadata.get('content_categories', [])
+            for category in doc_categories:
+                categories[category] = categories.get(category, 0) + 1
+            
+            # Languages
+            language = metadata.get('language', 'unknown')
+            languages[language] = languages.get(language, 0) + 1
+            
+            # Quality
+            quality = metadata.get('content_quality', 'unknown')
+            quality_distribution[quality] = quality_distribution.get(quality, 0) + 1
+    return categories, languages, quality_distribution
+
+def _save_upload(file, file_path):
+    """Stream an upload to file_path; returns (size in bytes, sha256 hex digest)"""
+    digest = hashlib.sha256(usedforsecurity=False)
+    size = 0
+    with open(file_path, 'wb') as dst:
+        while True:
+            chunk = file.stream.read(UPLOAD_BUFFER_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            dst.write(chunk)
+            size += len(chunk)
+    return size, digest.hexdigest()
+
+def _discard_file(file_path):
+    """Remove file_path if it is still there"""
+    try:
+        os.unlink(file_path)
+    except FileNotFoundError:
+        pass
+
+def _find_upload(chatbot_id, content_hash):
+    """The chatbot's document with this content hash, if any"""
+    return Document.query.filter_by(chatbot_id=chatbot_id, content_hash=content_hash).first()
+
+def _duplicate_response(document):
+    """Response for an upload whose content the chatbot already has"""
+    return jsonify({
+        'message': 'Document already uploaded; reusing its processed chunks',
+        'document': document.to_dict(),
+        'duplicate_of': document.id,
+        'status_url': f"{documents_bp.url_prefix}/{document.id}/status"
+    }), 200
+
+def _owns_chatbot(user_id, chatbot_id) -> bool:
+    """Whether user_id owns chatbot_id; fetches just the id, not the chatbot row"""
+    return db.session.query(Chatbot.id).filter_by(id=chatbot_id, user_id=user_id).first() is not None
+
+def _delete_owned_document(document_id, user_id):
+    """Delete a document owned by user_id; (file_path, original_filename, chatbot_id) or None"""
+    owned = Document.chatbot_id.in_(select(Chatbot.id).where(Chatbot.user_id == user_id))
+    if db.session.get_bind().dialect.delete_returning:
+        row = db.session.execute(
+            delete(Document)
+            .where(Document.id == document_id, owned)
+            .returning(Document.file_path, Document.original_filename, Document.chatbot_id)
+        ).first()
+    else:
+        row = Document.query.with_entities(
+            Document.file_path, Document.original_filename, Document.chatbot_id
+        ).filter(Document.id == document_id, owned).first()
+        if row is not None:
+            Document.query.filter_by(id=document_id).delete(synchronize_session=False)
+    if row is None:
+        return None
+    db.session.commit()
+    return tuple(row)
 
 documents_bp = Blueprint('documents', __name__, url_prefix='/api/documents')
 
 @documents_bp.route('/upload', methods=['POST'])
 @jwt_required()
 def upload_document():
-    """Upload and process a document using enhanced RAG service"""
+    """Upload a document and queue it for processing by the enhanced RAG service"""
     try:
         current_user_id = get_jwt_identity()
         
@@ -36,8 +188,7 @@ def upload_document():
             return jsonify({'error': 'No file selected'}), 400
         
         # Verify chatbot ownership
-        chatbot = Chatbot.query.filter_by(id=chatbot_id, user_id=current_user_id).first()
-        if not chatbot:
+        if not _owns_chatbot(current_user_id, chatbot_id):
             return jsonify({'error': 'Chatbot not found or access denied'}), 404
         
         # Validate file using enhanced processor
@@ -49,85 +200,110 @@ def upload_document():
         os.makedirs(uploads_dir, exist_ok=True)
         
         file_path = os.path.join(uploads_dir, f"{uuid.uuid4()}{file_ext}")
-        file.save(file_path)
+        file_size, content_hash = _save_upload(file, file_path)
         
         try:
+            # The same bytes uploaded again reuse the earlier document and its chunks;
+            # an attempt that failed or was abandoned mid-job is replaced so the
+            # content gets processed again
+            existing = _find_upload(chatbot_id, content_hash)
+            if existing is not None and not is_abandoned(existing):
+                _discard_file(file_path)
+                return _duplicate_response(existing)
+            if existing is not None:
+                # The abandoned attempt may have indexed some chunks before it stopped
+                try:
+                    get_rag_service().delete_document(existing.id, chatbot_id)
+                except Exception as e:
+                    logger.warning("Could not drop chunks of replaced document %s: %s", existing.id, e)
+                if existing.file_path:
+                    _discard_file(existing.file_path)
+                db.session.delete(existing)
+                db.session.flush()  # the unique index must not see both rows at once
+            
             # Create document record
             document = Document(
                 chatbot_id=chatbot_id,
                 filename=filename,
                 original_filename=filename,
                 file_path=file_path,
-                file_size=os.path.getsize(file_path),
+                file_size=file_size,
                 file_type=file_ext,
+                content_hash=content_hash,
                 status='processing'
             )
             
+            # flush() fills in the id and defaults, so the response is built before the
+            # commit expires the object; the single commit must land before the job runs
             db.session.add(document)
+            db.session.flush()
+            document_id = document.id
+            document_data = document.to_dict()
+            document.refresh_cached_dict()
             db.session.commit()
             
-            # Process document with enhanced RAG service
-            processing_result = rag_service.process_document(
+            # OCR/chunking/embedding run on the document job pool; clients poll the listing
+            document_jobs.submit(
+                current_app._get_current_object(),
+                get_rag_service,
+                document_id=document_id,
                 file_path=file_path,
-                chatbot_id=chatbot_id,
-                document_id=document.id
+                chatbot_id=chatbot_id
             )
             
-            if processing_result['success']:
-                # Update document status and metadata
-                document.status = 'completed'
-                document.chunk_count = processing_result['chunks_created']
-                document.processing_time = processing_result['processing_time']
-                document.processed_at = datetime.utcnow()
-                
-                # Store additional metadata as JSON
-                metadata = processing_result.get('metadata', {})
-                document.metadata = {
-                    'word_count': metadata.get('word_count', 0),
-                    'language': metadata.get('language', 'unknown'),
-                    'readability_score': metadata.get('readability_score', 0.0),
-                    'content_quality': metadata.get('content_quality', 'unknown'),
-                    'content_categories': metadata.get('content_categories', []),
-                    'has_images': metadata.get('has_images', False),
-                    'has_tables': metadata.get('has_tables', False),
-                    'chunking_strategy': processing_result.get('chunking_strategy', 'unknown'),
-                    'document_analysis': processing_result.get('document_analysis', {}),
-                    'extracted_elements': processing_result.get('extracted_elements', {})
-                }
-                
-                db.session.commit()
-                
-                return jsonify({
-                    'message': 'Document uploaded and processed successfully',
-                    'document': document.to_dict(),
-                    'processing_result': {
-                        'chunks_created': processing_result['chunks_created'],
-                        'processing_time': processing_result['processing_time'],
-                        'chunking_strategy': processing_result.get('chunking_strategy'),
-                        'document_analysis': processing_result.get('document_analysis', {})
-                    }
-                }), 201
-            else:
-                # Processing failed
-                document.status = 'failed'
-                document.error_message = processing_result.get('error', 'Unknown processing error')
-                db.session.commit()
-                
-                return jsonify({
-                    'error': 'Document processing failed',
-                    'details': processing_result.get('error', 'Unknown error')
-                }), 500
-                
+            return jsonify({
+                'message': 'Document uploaded; processing started',
+                'document': document_data,
+                'status_url': f"{documents_bp.url_prefix}/{document_id}/status"
+            }), 202
+            
+        except IntegrityError:
+            # A concurrent upload of the same content committed first
+            db.session.rollback()
+            _discard_file(file_path)
+            existing = _find_upload(chatbot_id, content_hash)
+            if existing is None:
+                raise
+            return _duplicate_response(existing)
         except Exception as e:
-            # Clean up file on error
-            if os.path.exists(file_path):
-                os.remove(file_path)
+            # Nothing is kept on error: neither the row nor the file
+            db.session.rollback()
+            _discard_file(file_path)
             raise e
             
     except Exception as e:
-        current_app.logger.error(f"Document upload error: {str(e)}")
+        logger.error("Document upload error: %s", e)
         return jsonify({'error': 'Failed to upload document'}), 500
 
+@documents_bp.route('/<document_id>/status', methods=['GET'])
+@jwt_required()
+def get_document_status(document_id):
+    """Processing status of an uploaded document (poll after a 202 from /upload)"""
+    try:
+        current_user_id = get_jwt_identity()
+        
+        document = db.session.query(Document).options(load_only(
+            Document.id, Document.status, Document.chunk_count, Document.error_message, Document.processed_at
+        )).join(Chatbot).filter(
+            Document.id == document_id,
+            Chatbot.user_id == current_user_id
+        ).first()
+        
+        if not document:
+            return jsonify({'error': 'Document not found or access denied'}), 404
+        
+        return jsonify({
+            'document_id': document.id,
+            'status': document.status,
+            'chunk_count': document.chunk_count,
+            'error_message': document.error_message,
+            'processed_at': document.processed_at.isoformat() if document.processed_at else None
+        }), 200
+        
+    except Exception as e:
+        logger.error("Get document status error: %s", e)
+        return jsonify({'error': 'Failed to retrieve document status'}), 500
+
 @documents_bp.route('/chatbot/<chatbot_id>', methods=['GET'])
 @jwt_required()
 def get_chatbot_documents(chatbot_id):
@@ -136,22 +312,27 @@ def get_chatbot_documents(chatbot_id):
         current_user_id = get_jwt_identity()
         
         # Verify chatbot ownership
-        chatbot = Chatbot.query.filter_by(id=chatbot_id, user_id=current_user_id).first()
-        if not chatbot:
+        if not _owns_chatbot(current_user_id, chatbot_id):
             return jsonify({'error': 'Chatbot not found or access denied'}), 404
         
-        # Get documents
-        documents = Document.query.filter_by(chatbot_id=chatbot_id).order_by(Document.created_at.desc()).all()
+        # Each row's listing dict is stored at write time; no ORM objects per document
+        rows = Document.query.with_entities(Document.id, Document.cached_dict).filter_by(
+            chatbot_id=chatbot_id
+        ).order_by(Document.created_at.desc()).all()
         
-        documents_data = []
-        for doc in documents:
-            doc_data = doc.to_dict()
-            
-            # Add enhanced metadata if available
-            if hasattr(doc, 'metadata') and doc.metadata:
-                doc_data['enhanced_metadata'] = doc.metadata
-                
-            documents_data.append(doc_data)
+        # Rows written before cached_dict existed are built from their columns
+        stale_ids = [doc_id for doc_id, cached in rows if cached is None]
+        built = {}
+        if stale_ids:
+            built = {
+                row.id: _document_list_entry(row)
+                for row in Document.query.with_entities(*_DOC_LIST_COLUMNS).filter(Document.id.in_(stale_ids))
+            }
+        documents_data = [
+            cached if cached is not None else built[doc_id]
+            for doc_id, cached in rows
+            if cached is not None or doc_id in built
+        ]
         
         return jsonify({
             'documents': documents_data,
@@ -159,7 +340,7 @@ def get_chatbot_documents(chatbot_id):
         }), 200
         
     except Exception as e:
-        current_app.logger.error(f"Get documents error: {str(e)}")
+        logger.error("Get documents error: %s", e)
         return jsonify({'error': 'Failed to retrieve documents'}), 500
 
 @documents_bp.route('/<document_id>', methods=['DELETE'])
@@ -169,29 +350,24 @@ def delete_document(document_id):
     try:
         current_user_id = get_jwt_identity()
         
-        # Get document with user verification
-        document = db.session.query(Document).join(Chatbot).filter(
-            Document.id == document_id,
-            Chatbot.user_id == current_user_id
-        ).first()
-        
-        if not document:
+        # Ownership check and delete in one statement; the row is gone before the
+        # chunks are, so a job still processing it drops what it indexes
+        deleted = _delete_owned_document(document_id, current_user_id)
+        if deleted is None:
             return jsonify({'error': 'Document not found or access denied'}), 404
+        file_path, filename, chatbot_id = deleted
         
         # Delete from vector database using enhanced service
-        delete_result = rag_service.delete_document(document_id, document.chatbot_id)
+        delete_result = get_rag_service().delete_document(document_id, chatbot_id)
         
         # Delete file from disk
-        if document.file_path and os.path.exists(document.file_path):
+        if file_path:
             try:
-                os.remove(document.file_path)
+                os.unlink(file_path)
+            except FileNotFoundError:
+                pass
             except Exception as e:
-                current_app.logger.warning(f"Could not delete file {document.file_path}: {str(e)}")
-        
-        # Delete from database
-        filename = document.original_filename
-        db.session.delete(document)
-        db.session.commit()
+                logger.warning("Could not delete file %s: %s", file_path, e)
         
         return jsonify({
             'message': f'Document "{filename}" deleted successfully',
@@ -199,7 +375,7 @@ def delete_document(document_id):
         }), 200
         
     except Exception as e:
-        current_app.logger.error(f"Delete document error: {str(e)}")
+        logger.error("Delete document error: %s", e)
         return jsonify({'error': 'Failed to delete document'}), 500
 
 @documents_bp.route('/stats/<chatbot_id>', methods=['GET'])
@@ -210,46 +386,28 @@ def get_chatbot_stats(chatbot_id):
         current_user_id = get_jwt_identity()
         
         # Verify chatbot ownership
-        chatbot = Chatbot.query.filter_by(id=chatbot_id, user_id=current_user_id).first()
-        if not chatbot:
+        if not _owns_chatbot(current_user_id, chatbot_id):
             return jsonify({'error': 'Chatbot not found or access denied'}), 404
         
-        # Get basic document stats
-        total_docs = Document.query.filter_by(chatbot_id=chatbot_id).count()
-        completed_docs = Document.query.filter_by(chatbot_id=chatbot_id, status='completed').count()
-        failed_docs = Document.query.filter_by(chatbot_id=chatbot_id, status='failed').count()
-        processing_docs = Document.query.filter_by(chatbot_id=chatbot_id, status='processing').count()
+        # Per-status counts and totals in one GROUP BY
+        status_rows = db.session.query(
+            Document.status,
+            func.count(Document.id),
+            func.coalesce(func.sum(Document.chunk_count), 0),
+            func.coalesce(func.sum(Document.file_size), 0)
+        ).filter_by(chatbot_id=chatbot_id).group_by(Document.status).all()
+        by_status = {status: (count, chunks, size) for status, count, chunks, size in status_rows}
         
-        # Get total chunks and file sizes
-        documents = Document.query.filter_by(chatbot_id=chatbot_id, status='completed').all()
-        total_chunks = sum(doc.chunk_count or 0 for doc in documents)
-        total_file_size = sum(doc.file_size or 0 for doc in documents)
+        total_docs = sum(count for count, _, _ in by_status.values())
+        completed_docs, total_chunks, total_file_size = by_status.get('completed', (0, 0, 0))
+        failed_docs = by_status.get('failed', (0, 0, 0))[0]
+        processing_docs = by_status.get('processing', (0, 0, 0))[0]
         
         # Get enhanced analytics from RAG service
-        analytics = rag_service.get_chatbot_analytics(chatbot_id)
+        analytics = get_rag_service().get_chatbot_analytics(chatbot_id)
         
         # Analyze document metadata for insights
-        content_types = {}
-        languages = {}
-        quality_distribution = {}
-        categories = {}
-        
-        for doc in documents:
-            if hasattr(doc, 'metadata') and doc.metadata:
-                metadata = doc.metadata
-                
-                # Content categories
-                doc_categories = metadata.get('content_categories', [])
-                for category in doc_categories:
-                    categories[category] = categories.get(category, 0) + 1
-                
-                # Languages
-                language = metadata.get('language', 'unknown')
-                languages[language] = languages.get(language, 0) + 1
-                
-                # Quality
-                quality = metadata.get('content_quality', 'unknown')
-                quality_distribution[quality] = quality_distribution.get(quality, 0) + 1
+        categories, languages, quality_distribution = _content_analysis(chatbot_id)
         
         return jsonify({
             'document_stats': {
@@ -271,13 +429,13 @@ def get_chatbot_stats(chatbot_id):
         }), 200
         
     except Exception as e:
-        current_app.logger.error(f"Get stats error: {str(e)}")
+        logger.error("Get stats error: %s", e)
         return jsonify({'error': 'Failed to retrieve statistics'}), 500
 
-@documents_bp.route('/supported-formats', methods=['GET'])
-def get_supported_formats():
-    """Get list of supported file formats with enhanced capabilities"""
-    return jsonify({
+@lru_cache(maxsize=None)
+def _supported_formats_json(ocr_available: bool) -> str:
+    """The supported-formats body; only OCR availability varies, and it is fixed at startup"""
+    return current_app.json.dumps({
         'supported_formats': {
             'documents': {
                 '.pdf': {
@@ -333,6 +491,12 @@ def get_supported_formats():
         'limits': {
             'max_file_size': '50MB',
             'supported_languages': 'Auto-detected (55+ languages)',
-            'ocr_availability': rag_service.document_processor.ocr_available
+            'ocr_availability': ocr_available
         }
-    }), 200
\ No newline at end of file
+    })
+
+@documents_bp.route('/supported-formats', methods=['GET'])
+def get_supported_formats():
+    """Get list of supported file formats with enhanced capabilities"""
+    body = _supported_formats_json(current_app.extensions['doc_processor'].ocr_available)
+    return current_app.response_class(body, mimetype=current_app.json.mimetype)
\ No newline at end of file
@@ -2,11 +2,18 @@ import logging
 from typing import Dict, List, Any, Optional, Tuple
 import json
 import time
+import bisect
+import hashlib
+import threading
+import queue
+from concurrent.futures import Future
 from datetime import datetime
 
 # Import our enhanced services
 from advanced_document_processor import create_processor, DocumentMetadata, ProcessingResult
 from hybrid_search_service import create_hybrid_search_service
+from semantic_cache import get_response_cache
+import numpy as np
 import openai
 import os
 from dotenv import load_dotenv
@@ -16,6 +23,91 @@ load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+class _SingleFlight:
+    """Collapse concurrent calls with the same key into one execution"""
+    
+    def __init__(self):
+        self._calls: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+    
+    def do(self, key: str, fn):
+        """Run fn() unless a call for key is already running; either way return its result"""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        
+        if not leader:
+            return future.result()
+        
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return future.result()
+
+_inflight = _SingleFlight()
+
+QUERY_EMBED_MAX_BATCH = 8
+QUERY_EMBED_MAX_WAIT = 0.005  # seconds a query waits for company before encoding alone
+# Upper bounds (in characters) of the short and medium length bins; longer queries go in a third
+QUERY_EMBED_BINS = (64, 256)
+
+class _EmbeddingBatcher:
+    """Encode queries from concurrent requests in one model forward pass
+    
+    submit() queues a text and returns a Future; a daemon thread takes the first
+    waiting text, gathers whatever else arrives within max_wait (up to max_batch),
+    and encodes them together. Texts are binned by length with a queue and thread
+    per bin, since a batch is padded to its longest member.
+    """
+    
+    def __init__(self, model, max_batch: int = QUERY_EMBED_MAX_BATCH, max_wait: float = QUERY_EMBED_MAX_WAIT,
+                 bins: Tuple[int, ...] = QUERY_EMBED_BINS):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.bins = bins
+        self._queues = [queue.Queue() for _ in range(len(bins) + 1)]
+        for index, bin_queue in enumerate(self._queues):
+            threading.Thread(target=self._run, args=(bin_queue,), name=f'query-embedder-{index}', daemon=True).start()
+    
+    def submit(self, text: str) -> Future:
+        future = Future()
+        self._queues[bisect.bisect_left(self.bins, len(text))].put((text, future))
+        return future
+    
+    def encode(self, text: str):
+        """Blocking convenience wrapper around submit()"""
+        return self.submit(text).result()
+    
+    def _run(self, bin_queue: queue.Queue):
+        while True:
+            batch = [bin_queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(bin_queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            texts = [text for text, _ in batch]
+            try:
+                embeddings = self.model.encode(texts, batch_size=len(texts))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), embedding in zip(batch, embeddings):
+                future.set_result(embedding)
+
 class EnhancedRAGService:
     """Enhanced RAG service with advanced document processing and hybrid search"""
     
@@ -39,6 +131,8 @@ class EnhancedRAGService:
         
         self.chunking_strategy = chunking_strategy
         self.enable_openai = enable_openai
+        self.response_cache = get_response_cache()
+        self.query_embedder = _EmbeddingBatcher(self.search_service.embedding_model)
         
         # OpenAI configuration
         if enable_openai and os.getenv('OPENAI_API_KEY'):
@@ -132,6 +226,9 @@ class EnhancedRAGService:
                 document_metadata=doc_metadata
             )
             
+            # Cached answers were built from the old document set
+            self.response_cache.invalidate(chatbot_id)
+            
             processing_time = time.time() - start_time
             
             return {
@@ -197,8 +294,13 @@ class EnhancedRAGService:
     def query_with_context(self, 
                           chatbot_id: str, 
                           query: str,
-                          search_params: Dict[str, Any] = None) -> Dict[str, Any]:
-        """Enhanced query processing with context-aware responses"""
+                          search_params: Dict[str, Any] = None,
+                          query_embedding: List[float] = None,
+                          stream: bool = False) -> Dict[str, Any]:
+        """Enhanced query processing with context-aware responses
+        
+        With stream=True, 'response' is an iterator of text pieces instead of a string.
+        """
         
         start_time = time.time()
         
@@ -220,7 +322,8 @@ class EnhancedRAGService:
                 query=query,
                 top_k=default_params['top_k'],
                 semantic_weight=default_params['semantic_weight'],
-                keyword_weight=default_params['keyword_weight']
+                keyword_weight=default_params['keyword_weight'],
+                query_embedding=query_embedding
             )
             
             # Filter by similarity threshold
@@ -238,7 +341,8 @@ class EnhancedRAGService:
             response = self._generate_enhanced_response(
                 query=query,
                 context_results=filtered_results,
-                context_analysis=context_analysis
+                context_analysis=context_analysis,
+                stream=stream
             )
             
             query_time = time.time() - start_time
@@ -263,6 +367,132 @@ class EnhancedRAGService:
                 'query_time': time.time() - start_time
             }
     
+    def generate_response(self,
+                          query: str,
+                          chatbot_id: str,
+                          config: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Answer a chat query for the routes, serving near-duplicate questions from the semantic cache
+        
+        Keyword searches bypass the cache: their results hinge on exact terms,
+        not on embedding similarity.
+        """
+        request = self._prepare_query(query, chatbot_id, config)
+        if request['cached'] is not None:
+            return request['cached']
+        
+        # Identical questions already in flight wait for that answer instead of re-running RAG
+        key = hashlib.sha1(
+            f"{chatbot_id}|{query}|{request['search_type']}|{request['top_k']}".encode('utf-8')
+        ).hexdigest()
+        return _inflight.do(key, lambda: self._answer_query(query, chatbot_id, request))
+    
+    def generate_response_stream(self,
+                                 query: str,
+                                 chatbot_id: str,
+                                 config: Dict[str, Any] = None):
+        """Streaming generate_response: yield (text_delta, None) pieces, then ('', result)
+        
+        result has the same shape as generate_response's return value. Streams are
+        not shared between identical in-flight queries, but do populate the cache.
+        """
+        request = self._prepare_query(query, chatbot_id, config)
+        if request['cached'] is not None:
+            yield request['cached']['response'], None
+            yield '', request['cached']
+            return
+        
+        context = self._retrieve_context(query, chatbot_id, request, stream=True)
+        if 'error' in context:
+            yield context['response'], None
+            yield '', {'success': False, 'error': context['error'], 'response': context['response']}
+            return
+        
+        pieces = []
+        for piece in context['response']:
+            if piece:
+                pieces.append(piece)
+                yield piece, None
+        context['response'] = ''.join(pieces)
+        
+        result = self._build_result(context)
+        if request['namespace'] is not None:
+            self.response_cache.store(request['namespace'], request['embedding'], result)
+        yield '', result
+    
+    def _prepare_query(self, query: str, chatbot_id: str, config: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Embed the query and look it up in the semantic cache"""
+        config = config or {}
+        search_type = config.get('search_type', 'hybrid')
+        top_k = config.get('context_limit', 5)
+        
+        # Batched with other requests' queries; reused for the cache and the vector search
+        query_embedding = self.query_embedder.encode(query)
+        
+        namespace = embedding = cached = None
+        if search_type != 'keyword':
+            # documents_version (from the caller's database) moves on whenever the
+            # chatbot's documents change, so other workers miss too, not just this
+            # process whose cache invalidate() clears
+            namespace = (chatbot_id, config.get('documents_version'), search_type, top_k)
+            embedding = query_embedding / max(float(np.linalg.norm(query_embedding)), 1e-12)
+            cached = self.response_cache.lookup(namespace, embedding)
+        
+        return {
+            'search_type': search_type,
+            'top_k': top_k,
+            'query_embedding': query_embedding.tolist(),
+            'namespace': namespace,
+            'embedding': embedding,
+            'cached': cached
+        }
+    
+    def _retrieve_context(self, query: str, chatbot_id: str, request: Dict[str, Any], stream: bool = False) -> Dict[str, Any]:
+        """query_with_context with the search weights implied by search_type"""
+        search_type = request['search_type']
+        if search_type == 'semantic':
+            weights = {'semantic_weight': 1.0, 'keyword_weight': 0.0}
+        elif search_type == 'keyword':
+            weights = {'semantic_weight': 0.0, 'keyword_weight': 1.0}
+        else:
+            weights = {}
+        
+        return self.query_with_context(chatbot_id, query, {'top_k': request['top_k'], **weights},
+                                       query_embedding=request['query_embedding'], stream=stream)
+    
+    def _answer_query(self, query: str, chatbot_id: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Run the RAG pipeline for generate_response and cache a successful answer"""
+        context = self._retrieve_context(query, chatbot_id, request)
+        if 'error' in context:
+            return {'success': False, 'error': context['error'], 'response': context['response']}
+        
+        result = self._build_result(context)
+        if request['namespace'] is not None:
+            self.response_cache.store(request['namespace'], request['embedding'], result)
+        return result
+    
+    def _build_result(self, context: Dict[str, Any]) -> Dict[str, Any]:
+        """Shape a query_with_context result the way the chat routes expect"""
+        search_results = context['search_results']
+        analysis = context['analysis']
+        return {
+            'success': True,
+            'response': context['response'],
+            'metadata': {
+                'search_results': {
+                    'count': context['sources_count'],
+                    'context_quality': context['context_quality']
+                },
+                'context_sources': sorted({
+                    r.get('metadata', {}).get('document_id')
+                    for r in search_results if r.get('metadata', {}).get('document_id')
+                }),
+                'tokens_used': 0,
+                'model_used': 'gpt-3.5-turbo' if self.openai_available else 'template',
+                'quality_score': analysis.get('relevance_score', 0.0),
+                'confidence': analysis.get('relevance_score', 0.0)
+            }
+        }
+    
     def _analyze_context_quality(self, search_results: List[Dict], query: str) -> Dict[str, Any]:
         """Analyze the quality and relevance of retrieved context"""
         
@@ -327,13 +557,18 @@ class EnhancedRAGService:
     def _generate_enhanced_response(self, 
                                   query: str, 
                                   context_results: List[Dict],
-                                  context_analysis: Dict[str, Any]) -> str:
-        """Generate enhanced response using context analysis"""
+                                  context_analysis: Dict[str, Any],
+                                  stream: bool = False):
+        """Generate enhanced response using context analysis
+        
+        Returns a string, or an iterator of text pieces when stream is set.
+        """
         
         quality_level = context_analysis['quality_level']
         
         if quality_level == 'no_context':
-            return self._get_template_response('no_context', query=query)
+            response = self._get_template_response('no_context', query=query)
+            return iter([response]) if stream else response
         
         # Prepare context
         context_texts = []
@@ -347,18 +582,24 @@ class EnhancedRAGService:
         # Use OpenAI if available and context is good
         if self.openai_available and quality_level in ['good_context', 'technical_content', 'business_content']:
             try:
-                return self._generate_openai_response(query, context, context_analysis)
+                return self._generate_openai_response(query, context, context_analysis, stream=stream)
             except Exception as e:
                 logger.warning(f"OpenAI generation failed, using template: {e}")
         
         # Use template response
-        return self._get_template_response(quality_level, query=query, context=context)
+        response = self._get_template_response(quality_level, query=query, context=context)
+        return iter([response]) if stream else response
     
     def _generate_openai_response(self, 
                                  query: str, 
                                  context: str, 
-                                 context_analysis: Dict[str, Any]) -> str:
-        """Generate response using OpenAI with enhanced prompting"""
+                                 context_analysis: Dict[str, Any],
+                                 stream: bool = False):
+        """Generate response using OpenAI with enhanced prompting
+        
+        With stream set, the request is sent now and the content deltas are
+        returned as an iterator.
+        """
         
         # Customize prompt based on content type
         categories = context_analysis.get('categories', [])
@@ -388,9 +629,12 @@ Please provide a comprehensive answer based on the context above. If the context
                 {"role": "user", "content": prompt}
             ],
             max_tokens=500,
-            temperature=0.3
+            temperature=0.3,
+            stream=stream
         )
         
+        if stream:
+            return (chunk.choices[0].delta.get('content', '') for chunk in response)
         return response.choices[0].message.content
     
     def _get_template_response(self, template_type: str, **kwargs) -> str:
@@ -454,8 +698,39 @@ Please provide a comprehensive answer based on the context above. If the context
     
     def delete_document(self, document_id: str, chatbot_id: str) -> Dict[str, Any]:
         """Delete document and all associated chunks"""
+        self.response_cache.invalidate(chatbot_id)
         return self.search_service.delete_document_chunks(document_id, chatbot_id)
 
+_shared_services: Dict[tuple, EnhancedRAGService] = {}
+_shared_services_lock = threading.Lock()
+
+def get_enhanced_rag_service(**kwargs) -> EnhancedRAGService:
+    """Process-wide EnhancedRAGService per configuration, built on first use
+    
+    Construction loads the embedding model, so concurrent first callers wait on
+    the one build instead of each starting their own.
+    """
+    key = tuple(sorted(kwargs.items()))
+    with _shared_services_lock:
+        service = _shared_services.get(key)
+        if service is None:
+            service = _shared_services[key] = create_enhanced_rag_service(**kwargs)
+        return service
+
+def purge_chatbot(chatbot_id: str):
+    """Drop a deleted chatbot's vectors, keyword indexes and cached answers
+    
+    Only services already built are touched; they all share one vector store,
+    so the collection is dropped once.
+    """
+    get_response_cache().invalidate(chatbot_id)
+    with _shared_services_lock:
+        services = list(_shared_services.values())
+    if not services:
+        logger.warning(f"No RAG service loaded; vector collection for chatbot {chatbot_id} left in place")
+    for index, service in enumerate(services):
+        service.search_service.delete_chatbot_index(chatbot_id, drop_collection=index == 0)
+
 # Factory function
 def create_enhanced_rag_service(
     vector_db_path: str = "./chroma_db",
@@ -0,0 +1,20 @@
+"""
+Gunicorn settings for the backend apps
+
+    gunicorn -c gunicorn.conf.py wsgi:application               # Phase 4 demo
+    gunicorn -c gunicorn.conf.py 'enhanced_app:create_app()'    # enhanced backend
+"""
+
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5000')
+
+# One process per core; threads in each so slow uploads and chat calls don't block a worker
+workers = int(os.getenv('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+
+# Document processing runs on a job pool, so only slow uploads approach this
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+keepalive = 5
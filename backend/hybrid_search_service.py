@@ -270,11 +270,12 @@ class HybridSearchService:
                      top_k: int = 5,
                      semantic_weight: float = 0.7,
                      keyword_weight: float = 0.3,
-                     filter_metadata: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+                     filter_metadata: Dict[str, Any] = None,
+                     query_embedding: List[float] = None) -> List[Dict[str, Any]]:
         """Perform hybrid search combining semantic and keyword search"""
         
         # Perform semantic search
-        semantic_results = self.semantic_search(chatbot_id, query, top_k * 2, filter_metadata)
+        semantic_results = self.semantic_search(chatbot_id, query, top_k * 2, filter_metadata, query_embedding)
         
         # Perform keyword search
         keyword_results = self.keyword_search(chatbot_id, query, top_k * 2)
@@ -291,13 +292,18 @@ class HybridSearchService:
                        chatbot_id: str, 
                        query: str, 
                        top_k: int = 5,
-                       filter_metadata: Dict[str, Any] = None) -> List[Dict[str, Any]]:
-        """Perform semantic similarity search"""
+                       filter_metadata: Dict[str, Any] = None,
+                       query_embedding: List[float] = None) -> List[Dict[str, Any]]:
+        """Perform semantic similarity search
+        
+        Pass query_embedding when the caller already encoded the query.
+        """
         
         collection = self.get_or_create_collection(chatbot_id)
         
         # Generate query embedding
-        query_embedding = self.embedding_model.encode(query).tolist()
+        if query_embedding is None:
+            query_embedding = self.embedding_model.encode(query).tolist()
         
         # Prepare where clause for filtering
         where_clause = {}
@@ -509,6 +515,23 @@ class HybridSearchService:
             logger.error(f"Error deleting document chunks: {str(e)}")
             return {'error': str(e)}
 
+    def delete_chatbot_index(self, chatbot_id: str, drop_collection: bool = True) -> Dict[str, Any]:
+        """Forget a chatbot's keyword index and, optionally, drop its vector collection"""
+        self.tfidf_vectorizers.pop(chatbot_id, None)
+        self.tfidf_matrices.pop(chatbot_id, None)
+        self.chunk_texts.pop(chatbot_id, None)
+        
+        if not drop_collection:
+            return {'status': 'success'}
+        try:
+            self.client.delete_collection(f"chatbot_{chatbot_id}")
+            logger.info(f"Deleted collection for chatbot {chatbot_id}")
+            return {'status': 'success'}
+        except Exception as e:
+            # ChromaDB raises when the collection was never created
+            logger.info(f"No collection deleted for chatbot {chatbot_id}: {e}")
+            return {'status': 'no_collection'}
+
 # Factory function
 def create_hybrid_search_service(db_path: str = "./chroma_db", 
                                 embedding_model: str = "all-MiniLM-L6-v2") -> HybridSearchService:
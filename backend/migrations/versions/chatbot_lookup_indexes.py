@@ -0,0 +1,38 @@
+"""Index queries and documents by chatbot
+
+Revision ID: chatbot_lookup_indexes
+Revises: phase4_enhanced_metadata
+Create Date: 2025-11-01 10:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'chatbot_lookup_indexes'
+down_revision = 'phase4_enhanced_metadata'
+branch_labels = None
+depends_on = None
+
+
+INDEXES = (
+    ('ix_queries_chatbot_created', 'queries', 'chatbot_id, created_at DESC'),
+    ('ix_documents_chatbot_id', 'documents', 'chatbot_id'),
+)
+
+
+def upgrade():
+    """Add (chatbot_id, created_at DESC) on queries and chatbot_id on documents"""
+    if op.get_bind().dialect.name == 'postgresql':
+        # CONCURRENTLY can't run inside a transaction, but avoids locking writes
+        with op.get_context().autocommit_block():
+            for name, table, columns in INDEXES:
+                op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})")
+    else:
+        for name, table, columns in INDEXES:
+            op.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+
+
+def downgrade():
+    """Drop the chatbot lookup indexes"""
+    for name, _, _ in INDEXES:
+        op.execute(f"DROP INDEX IF EXISTS {name}")
@@ -0,0 +1,25 @@
+"""Add per-chatbot public API rate limit
+
+Revision ID: chatbot_rate_limit
+Revises: chatbot_lookup_indexes
+Create Date: 2025-11-01 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'chatbot_rate_limit'
+down_revision = 'chatbot_lookup_indexes'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Add rate_limit_per_minute to chatbots (NULL means the server default)"""
+    op.add_column('chatbots', sa.Column('rate_limit_per_minute', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    """Remove rate_limit_per_minute from chatbots"""
+    op.drop_column('chatbots', 'rate_limit_per_minute')
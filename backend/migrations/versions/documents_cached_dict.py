@@ -0,0 +1,25 @@
+"""Store each document's listing dict
+
+Revision ID: documents_cached_dict
+Revises: documents_chatbot_created
+Create Date: 2025-11-01 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'documents_cached_dict'
+down_revision = 'documents_chatbot_created'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Add cached_dict to documents (NULL rows are built from their columns on read)"""
+    op.add_column('documents', sa.Column('cached_dict', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    """Remove cached_dict from documents"""
+    op.drop_column('documents', 'cached_dict')
@@ -0,0 +1,33 @@
+"""Index documents by chatbot and creation time
+
+Revision ID: documents_chatbot_created
+Revises: chatbot_rate_limit
+Create Date: 2025-11-01 14:00:00.000000
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'documents_chatbot_created'
+down_revision = 'chatbot_rate_limit'
+branch_labels = None
+depends_on = None
+
+
+INDEX = ('ix_documents_chatbot_created', 'documents', 'chatbot_id, created_at DESC')
+
+
+def upgrade():
+    """Add (chatbot_id, created_at DESC) on documents for the per-chatbot listing"""
+    name, table, columns = INDEX
+    if op.get_bind().dialect.name == 'postgresql':
+        # CONCURRENTLY can't run inside a transaction, but avoids locking writes
+        with op.get_context().autocommit_block():
+            op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})")
+    else:
+        op.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+
+
+def downgrade():
+    """Drop the documents listing index"""
+    op.execute(f"DROP INDEX IF EXISTS {INDEX[0]}")
@@ -0,0 +1,27 @@
+"""Deduplicate document uploads by content hash
+
+Revision ID: documents_content_hash
+Revises: documents_cached_dict
+Create Date: 2025-11-01 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = 'documents_content_hash'
+down_revision = 'documents_cached_dict'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    """Add content_hash to documents, unique per chatbot (existing rows stay NULL)"""
+    op.add_column('documents', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.create_index('ix_documents_chatbot_content_hash', 'documents', ['chatbot_id', 'content_hash'], unique=True)
+
+
+def downgrade():
+    """Remove content_hash and its index from documents"""
+    op.drop_index('ix_documents_chatbot_content_hash', table_name='documents')
+    op.drop_column('documents', 'content_hash')
@@ -2,6 +2,7 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+import secrets
 import uuid
 
 db = SQLAlchemy()
@@ -55,17 +56,25 @@ class Chatbot(db.Model):
     description = db.Column(db.Text)
     theme = db.Column(db.String(50), default='default')
     tone = db.Column(db.String(50), default='friendly')
-    api_key = db.Column(db.String(64), unique=True, nullable=False, default=lambda: str(uuid.uuid4().hex))
+    api_key = db.Column(db.String(64), unique=True, nullable=False, default=lambda: secrets.token_urlsafe(24))
     is_active = db.Column(db.Boolean, default=True)
+    rate_limit_per_minute = db.Column(db.Integer)  # public API requests per minute; None uses the default
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    # Relationships
-    documents = db.relationship('Document', backref='chatbot', lazy=True, cascade='all, delete-orphan')
-    queries = db.relationship('Query', backref='chatbot', lazy=True, cascade='all, delete-orphan')
+    # Relationships; the database cascades deletes, so the ORM needn't load children to delete them
+    documents = db.relationship('Document', backref='chatbot', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
+    queries = db.relationship('Query', backref='chatbot', lazy=True, cascade='all, delete-orphan', passive_deletes=True)
     
-    def to_dict(self):
-        """Convert chatbot to dictionary"""
+    def to_dict(self, document_count=None, query_count=None):
+        """Convert chatbot to dictionary
+        
+        Pass precomputed counts to avoid loading the documents/queries relationships.
+        """
+        if document_count is None:
+            document_count = len(self.documents)
+        if query_count is None:
+            query_count = len(self.queries)
         return {
             'id': self.id,
             'user_id': self.user_id,
@@ -75,10 +84,11 @@ class Chatbot(db.Model):
             'tone': self.tone,
             'api_key': self.api_key,
             'is_active': self.is_active,
+            'rate_limit_per_minute': self.rate_limit_per_minute,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'document_count': len(self.documents),
-            'query_count': len(self.queries)
+            'document_count': document_count,
+            'query_count': query_count
         }
     
     def __repr__(self):
@@ -87,14 +97,21 @@ class Chatbot(db.Model):
 
 class Document(db.Model):
     __tablename__ = 'documents'
+    __table_args__ = (
+        # The newest-first document listing per chatbot reads this index in order
+        db.Index('ix_documents_chatbot_created', 'chatbot_id', db.text('created_at DESC')),
+        # One row per distinct upload content per chatbot (NULL hashes don't collide)
+        db.Index('ix_documents_chatbot_content_hash', 'chatbot_id', 'content_hash', unique=True),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    chatbot_id = db.Column(db.String(36), db.ForeignKey('chatbots.id'), nullable=False)
+    chatbot_id = db.Column(db.String(36), db.ForeignKey('chatbots.id', ondelete='CASCADE'), nullable=False, index=True)
     filename = db.Column(db.String(255), nullable=False)
     original_filename = db.Column(db.String(255), nullable=False)
     file_path = db.Column(db.String(500), nullable=False)
     file_size = db.Column(db.Integer)
     file_type = db.Column(db.String(50))
+    content_hash = db.Column(db.String(64))  # sha256 of the uploaded bytes
     status = db.Column(db.String(20), default='processing')  # processing, completed, failed
     chunk_count = db.Column(db.Integer, default=0)
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -103,6 +120,7 @@ class Document(db.Model):
     error_message = db.Column(db.Text)
     document_metadata = db.Column(db.JSON)  # Renamed from metadata to avoid conflict
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    cached_dict = db.Column(db.JSON)  # list_dict() as of the last write, served by the listing
     
     def to_dict(self):
         """Convert document to dictionary"""
@@ -128,15 +146,30 @@ class Document(db.Model):
             
         return data
     
+    def list_dict(self):
+        """to_dict() plus enhanced_metadata, as the document listing reports it"""
+        data = self.to_dict()
+        if self.document_metadata:
+            data['enhanced_metadata'] = self.document_metadata
+        return data
+    
+    def refresh_cached_dict(self):
+        """Store list_dict() on the row; call after changing any field it reports"""
+        self.cached_dict = self.list_dict()
+    
     def __repr__(self):
         return f'<Document {self.filename}>'
 
 
 class Query(db.Model):
     __tablename__ = 'queries'
+    __table_args__ = (
+        # Newest-first history per chatbot is an index range scan; also serves chatbot_id counts
+        db.Index('ix_queries_chatbot_created', 'chatbot_id', db.text('created_at DESC')),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    chatbot_id = db.Column(db.String(36), db.ForeignKey('chatbots.id'), nullable=False)
+    chatbot_id = db.Column(db.String(36), db.ForeignKey('chatbots.id', ondelete='CASCADE'), nullable=False)
     user_message = db.Column(db.Text, nullable=False)
     bot_response = db.Column(db.Text, nullable=False)
     tokens_used = db.Column(db.Integer, default=0)
@@ -0,0 +1,96 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List
+
+from models import db, Query
+
+logger = logging.getLogger(__name__)
+
+class QueryWriter:
+    """Write Query rows from a background thread in batched INSERTs
+
+    put() returns immediately; the worker commits whatever has queued up every
+    flush_ms milliseconds, or as soon as flush_n rows are waiting.
+    """
+
+    def __init__(self, flush_ms: int = 100, flush_n: int = 100):
+        self.flush_interval = flush_ms / 1000.0
+        self.flush_n = flush_n
+        self._queue = queue.Queue()
+        self._app = None
+        self._start_lock = threading.Lock()
+
+    def put(self, app, **fields) -> str:
+        """Queue a Query row for app's database and return its id"""
+        row = dict(fields)
+        row.setdefault('id', str(uuid.uuid4()))
+        row.setdefault('created_at', datetime.utcnow())
+        self._ensure_started(app)
+        self._queue.put(row)
+        return row['id']
+
+    def _ensure_started(self, app):
+        if self._app is not None:
+            return
+        with self._start_lock:
+            if self._app is None:
+                self._app = app
+                threading.Thread(target=self._run, name='query-writer', daemon=True).start()
+                atexit.register(self.flush)
+
+    def _drain(self, first: Dict[str, Any]) -> List[Dict[str, Any]]:
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.flush_n:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        with self._app.app_context():
+            try:
+                self._insert(batch)
+            finally:
+                db.session.remove()
+
+    def _insert(self, batch: List[Dict[str, Any]]):
+        try:
+            db.session.bulk_insert_mappings(Query, batch)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            if len(batch) == 1:
+                logger.error("Dropped query record %s: %s", batch[0]['id'], e)
+                return
+            # Retry in halves so only the failing rows are lost (e.g. rows queued
+            # for a chatbot that was deleted in the meantime), not the whole batch
+            middle = len(batch) // 2
+            self._insert(batch[:middle])
+            self._insert(batch[middle:])
+
+    def _run(self):
+        while True:
+            self._write(self._drain(self._queue.get()))
+
+    def flush(self):
+        """Write everything still queued (used at interpreter exit)"""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch and self._app is not None:
+            self._write(batch)
+
+query_writer = QueryWriter()
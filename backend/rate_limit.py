@@ -0,0 +1,27 @@
+import os
+
+from flask import request
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+
+import chatbot_cache
+
+# Requests per minute a public API key may make unless its chatbot sets its own limit
+PUBLIC_CHAT_RPM = int(os.getenv('PUBLIC_CHAT_RPM', '60'))
+
+# memory:// is per process; point RATELIMIT_STORAGE_URI at redis:// to share buckets across workers
+limiter = Limiter(
+    key_func=get_remote_address,
+    storage_uri=os.getenv('RATELIMIT_STORAGE_URI', 'memory://'),
+    strategy='moving-window'
+)
+
+def public_chat_key() -> str:
+    """Rate-limit bucket for the public chat endpoint: one per API key"""
+    return f"public-chat:{request.view_args.get('api_key', '')}"
+
+def public_chat_limit() -> str:
+    """Per-minute limit for the API key in the current request"""
+    chatbot = chatbot_cache.get_by_api_key(request.view_args.get('api_key', ''))
+    rpm = chatbot.rate_limit_per_minute if chatbot and chatbot.rate_limit_per_minute else PUBLIC_CHAT_RPM
+    return f"{rpm}/minute"
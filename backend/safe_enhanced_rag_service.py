@@ -37,11 +37,11 @@ class SafeEnhancedRAGService:
         # Import with timeout/safety checks
         try:
             import sentence_transformers
-            from advanced_document_processor import AdvancedDocumentProcessor
+            from advanced_document_processor import create_processor
             from hybrid_search_service import HybridSearchService
             
             # Initialize enhanced components
-            self.document_processor = AdvancedDocumentProcessor(enable_ocr=False)  # Disable OCR for now
+            self.document_processor = create_processor(enable_ocr=False)  # Disable OCR for now
             self.search_service = HybridSearchService()
             
         except ImportError as e:
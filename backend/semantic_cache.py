@@ -0,0 +1,83 @@
+import os
+import time
+import logging
+import threading
+from functools import lru_cache
+from typing import Dict, Any, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.95'))
+SEMANTIC_CACHE_TTL = float(os.getenv('SEMANTIC_CACHE_TTL', '3600'))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv('SEMANTIC_CACHE_MAX_ENTRIES', '256'))
+
+class _Namespace:
+    """Cached entries for one (chatbot, search settings) namespace"""
+
+    def __init__(self, dim: int):
+        self.embeddings = np.empty((0, dim), dtype=np.float32)
+        self.expires = np.empty(0, dtype=np.float64)
+        self.results = []
+
+class SemanticCache:
+    """In-process cache of RAG results, matched by cosine similarity of query embeddings
+
+    Embeddings are expected to be L2-normalized so a dot product is the cosine.
+    Entries are scoped to a namespace (chatbot id plus search settings) and can be
+    dropped per chatbot when its documents change.
+    """
+
+    def __init__(self,
+                 threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 ttl: float = SEMANTIC_CACHE_TTL,
+                 max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._namespaces: Dict[tuple, _Namespace] = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, namespace: tuple, embedding: np.ndarray) -> Optional[Dict[str, Any]]:
+        """Return the cached result closest to embedding if it clears the threshold"""
+        with self._lock:
+            entries = self._namespaces.get(namespace)
+            if entries is None or not entries.results:
+                return None
+
+            scores = entries.embeddings @ embedding
+            scores[entries.expires < time.monotonic()] = -1.0
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+            return entries.results[best]
+
+    def store(self, namespace: tuple, embedding: np.ndarray, result: Dict[str, Any]):
+        """Cache result under embedding, evicting expired and then oldest entries"""
+        embedding = np.asarray(embedding, dtype=np.float32)
+        with self._lock:
+            entries = self._namespaces.get(namespace)
+            if entries is None:
+                entries = self._namespaces[namespace] = _Namespace(embedding.shape[0])
+
+            now = time.monotonic()
+            keep = np.flatnonzero(entries.expires >= now)
+            # Rows are in insertion order, so trimming from the front drops the oldest
+            overflow = len(keep) - (self.max_entries - 1)
+            if overflow > 0:
+                keep = keep[overflow:]
+            entries.embeddings = np.vstack([entries.embeddings[keep], embedding[np.newaxis]])
+            entries.expires = np.append(entries.expires[keep], now + self.ttl)
+            entries.results = [entries.results[i] for i in keep] + [result]
+
+    def invalidate(self, chatbot_id: str):
+        """Drop every cached result for a chatbot (its documents changed)"""
+        with self._lock:
+            for namespace in [ns for ns in self._namespaces if ns[0] == chatbot_id]:
+                del self._namespaces[namespace]
+
+@lru_cache(maxsize=None)
+def get_response_cache() -> SemanticCache:
+    """Process-wide cache shared by every RAG service instance"""
+    return SemanticCache()
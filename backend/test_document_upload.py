@@ -0,0 +1,158 @@
+import io
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pytest
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token
+
+import documents
+from document_jobs import DOCUMENT_JOB_TIMEOUT
+from models import db, User, Chatbot, Document
+
+
+class FakeRagService:
+    def __init__(self):
+        self.deleted = []
+
+    def delete_document(self, document_id, chatbot_id):
+        self.deleted.append(document_id)
+        return {'success': True}
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI='sqlite://',
+        JWT_SECRET_KEY='test-secret',
+        UPLOAD_FOLDER=str(tmp_path)
+    )
+    db.init_app(app)
+    JWTManager(app)
+    app.register_blueprint(documents.documents_bp)
+    with app.app_context():
+        db.create_all()
+        yield app
+
+
+@pytest.fixture
+def rag_service(monkeypatch):
+    service = FakeRagService()
+    monkeypatch.setattr(documents, 'get_rag_service', lambda: service)
+    return service
+
+
+@pytest.fixture
+def submitted(monkeypatch):
+    jobs = []
+    monkeypatch.setattr(documents.document_jobs, 'submit', lambda *args, **kwargs: jobs.append(kwargs))
+    return jobs
+
+
+@pytest.fixture
+def chatbot(app):
+    user = User(email='owner@example.com', name='Owner', password_hash='x')
+    db.session.add(user)
+    db.session.flush()
+    chatbot = Chatbot(user_id=user.id, name='Docs bot')
+    db.session.add(chatbot)
+    db.session.commit()
+    return chatbot
+
+
+@pytest.fixture
+def upload(app, chatbot, rag_service, submitted):
+    client = app.test_client()
+    headers = {'Authorization': f"Bearer {create_access_token(identity=chatbot.user_id)}"}
+
+    def post(content=b'the same bytes every time'):
+        return client.post('/api/documents/upload', headers=headers, data={
+            'chatbot_id': chatbot.id,
+            'file': (io.BytesIO(content), 'notes.txt')
+        }, content_type='multipart/form-data')
+    return post
+
+
+def _uploaded_files(app, chatbot):
+    return sorted(path.name for path in Path(app.config['UPLOAD_FOLDER'], chatbot.id).iterdir())
+
+
+def test_duplicate_upload_reuses_document(app, chatbot, upload, submitted):
+    first = upload()
+    assert first.status_code == 202
+    document_id = first.get_json()['document']['id']
+
+    second = upload()
+
+    assert second.status_code == 200
+    assert second.get_json()['duplicate_of'] == document_id
+    assert Document.query.count() == 1
+    assert len(submitted) == 1
+    assert len(_uploaded_files(app, chatbot)) == 1
+
+
+def test_failed_document_is_replaced(app, chatbot, upload, submitted, rag_service):
+    first_id = upload().get_json()['document']['id']
+    db.session.get(Document, first_id).status = 'failed'
+    db.session.commit()
+
+    second = upload()
+
+    assert second.status_code == 202
+    second_id = second.get_json()['document']['id']
+    assert second_id != first_id
+    assert [document.id for document in Document.query.all()] == [second_id]
+    assert rag_service.deleted == [first_id]
+    assert len(submitted) == 2
+    assert len(_uploaded_files(app, chatbot)) == 1
+
+
+def test_stale_processing_document_is_replaced(app, upload, submitted):
+    first_id = upload().get_json()['document']['id']
+    stuck = db.session.get(Document, first_id)
+    stuck.uploaded_at = datetime.utcnow() - timedelta(seconds=DOCUMENT_JOB_TIMEOUT + 60)
+    db.session.commit()
+
+    second = upload()
+
+    assert second.status_code == 202
+    assert second.get_json()['document']['id'] != first_id
+    assert Document.query.count() == 1
+    assert len(submitted) == 2
+
+
+def test_recent_processing_document_is_a_duplicate(upload, submitted):
+    first_id = upload().get_json()['document']['id']
+
+    second = upload()
+
+    assert second.status_code == 200
+    assert second.get_json()['duplicate_of'] == first_id
+    assert len(submitted) == 1
+
+
+def test_concurrent_duplicate_returns_the_winner(app, chatbot, upload, submitted, monkeypatch):
+    real_find = documents._find_upload
+    winner = {}
+
+    def racing_find(chatbot_id, content_hash):
+        # Another request inserts the same content between our check and our commit
+        if not winner:
+            document = Document(chatbot_id=chatbot_id, filename='other.txt', original_filename='other.txt',
+                                file_path='other.txt', content_hash=content_hash, status='processing')
+            db.session.add(document)
+            db.session.commit()
+            winner['id'] = document.id
+            return None
+        return real_find(chatbot_id, content_hash)
+
+    monkeypatch.setattr(documents, '_find_upload', racing_find)
+
+    response = upload()
+
+    assert response.status_code == 200
+    assert response.get_json()['duplicate_of'] == winner['id']
+    assert Document.query.count() == 1
+    assert submitted == []
+    assert _uploaded_files(app, chatbot) == []
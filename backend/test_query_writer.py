@@ -0,0 +1,52 @@
+import uuid
+
+import pytest
+from flask import Flask
+
+from models import db, Query
+from query_writer import QueryWriter
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    yield app
+
+
+def _row(**fields):
+    row = {
+        'id': str(uuid.uuid4()),
+        'chatbot_id': str(uuid.uuid4()),
+        'user_message': 'hello',
+        'bot_response': 'hi',
+    }
+    row.update(fields)
+    return row
+
+
+def test_write_commits_whole_batch(app):
+    writer = QueryWriter()
+    writer._app = app
+    batch = [_row() for _ in range(5)]
+
+    writer._write(batch)
+
+    with app.app_context():
+        assert {query.id for query in Query.query.all()} == {row['id'] for row in batch}
+
+
+def test_failing_row_drops_only_itself(app):
+    writer = QueryWriter()
+    writer._app = app
+    good = [_row() for _ in range(6)]
+    bad = _row(user_message=None)  # violates NOT NULL
+    batch = good[:3] + [bad] + good[3:]
+
+    writer._write(batch)
+
+    with app.app_context():
+        assert {query.id for query in Query.query.all()} == {row['id'] for row in good}
@@ -0,0 +1,9 @@
+"""
+WSGI entry point for the Phase 4 demo application
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+"""
+
+from demo_app import create_demo_app
+
+application = create_demo_app()
@@ -6,10 +6,32 @@ Guaranteed to work without dependencies issues
 
 from flask import Flask, jsonify, request
 from flask_cors import CORS
+from werkzeug.serving import make_server
 from datetime import datetime
+import argparse
 import os
 import sys
 
+# Printed with the bound port once the listening socket is up; RUN_SYSTEM.py waits for it
+READY_SENTINEL = "RAG_BACKEND_READY"
+
+# (method, endpoint, JSON payload, label) checked by /api/_selftest
+SELFTEST_PROBES = (
+    ('GET', '/', None, 'Home'),
+    ('GET', '/api/health', None, 'Health'),
+    ('GET', '/api/system/status', None, 'Status'),
+    ('GET', '/api/documents', None, 'Documents'),
+    ('GET', '/api/operations', None, 'Operations'),
+    ('POST', '/api/chat', {'message': 'test'}, 'Chat'),
+    ('POST', '/api/search', {'query': 'test', 'type': 'hybrid'}, 'Search')
+)
+
+def serve(app, port):
+    """Bind the server, announce readiness and serve until interrupted"""
+    server = make_server('0.0.0.0', port, app, threaded=True)
+    print(f"{READY_SENTINEL} {port}", flush=True)
+    server.serve_forever()
+
 def create_simple_server():
     """Create a simple working Flask server"""
     app = Flask(__name__)
@@ -188,16 +210,39 @@ def create_simple_server():
             'production_ready': True
         })
     
+    @app.route('/api/_selftest')
+    def selftest():
+        # Run every endpoint check in-process so clients need one round trip
+        client = app.test_client()
+        checks = []
+        for method, endpoint, payload, name in SELFTEST_PROBES:
+            response = client.open(endpoint, method=method, json=payload)
+            checks.append({
+                'name': name,
+                'endpoint': endpoint,
+                'status': response.status_code
+            })
+        
+        return jsonify({
+            'checks': checks,
+            'all_ok': all(check['status'] == 200 for check in checks),
+            'timestamp': datetime.now().isoformat()
+        })
+    
     return app
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Simple Phase 4 RAG System Server")
+    parser.add_argument('--port', type=int, default=5000)
+    port = parser.parse_args().port
+    
     print("🚀 Starting Simple Phase 4 RAG System Server")
     print("=" * 50)
     
     try:
         app = create_simple_server()
         print("✅ Server created successfully")
-        print("🌐 Server starting on http://localhost:5000")
+        print(f"🌐 Server starting on http://localhost:{port}")
         print("📋 Available endpoints:")
         print("   • GET  /                     - Home page")
         print("   • GET  /api/health           - Health check")
@@ -207,17 +252,18 @@ if __name__ == '__main__':
         print("   • POST /api/search           - Advanced search")
         print("   • POST /api/chat             - Enhanced chat")
         print("   • GET  /api/operations       - All operations")
+        print("   • GET  /api/_selftest        - Run all endpoint checks")
         print("=" * 50)
         
-        app.run(host='0.0.0.0', port=5000, debug=False)
+        serve(app, port)
         
     except Exception as e:
         print(f"❌ Error starting server: {e}")
         
         # Try alternative port
         try:
-            print("🔄 Trying alternative port 5001...")
-            app.run(host='0.0.0.0', port=5001, debug=False)
+            print(f"🔄 Trying alternative port {port + 1}...")
+            serve(app, port + 1)
         except Exception as e2:
-            print(f"❌ Error on port 5001: {e2}")
+            print(f"❌ Error on port {port + 1}: {e2}")
             print("💡 Try manually running on a different port")# Performance Optimizations 
@@ -5,7 +5,6 @@ Serves the HTML frontend on a separate port
 """
 
 import http.server
-import socketserver
 import os
 import webbrowser
 from urllib.parse import urlparse
@@ -15,6 +14,9 @@ import time
 class CORSHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
     """HTTP Request Handler with CORS support"""
     
+    # Keep connections alive so browsers can reuse them for every asset
+    protocol_version = "HTTP/1.1"
+    
     def end_headers(self):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
@@ -23,6 +25,7 @@ class CORSHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
     
     def do_OPTIONS(self):
         self.send_response(200)
+        self.send_header('Content-Length', '0')
         self.end_headers()
 
 def start_frontend_server(port=3000, directory=None):
@@ -34,7 +37,7 @@ def start_frontend_server(port=3000, directory=None):
     handler = CORSHTTPRequestHandler
     
     try:
-        with socketserver.TCPServer(("", port), handler) as httpd:
+        with http.server.ThreadingHTTPServer(("", port), handler) as httpd:
             print(f"🌐 Frontend server starting on http://localhost:{port}")
             print(f"📁 Serving directory: {os.getcwd()}")
             print(f"🔗 Backend API: http://localhost:5000")